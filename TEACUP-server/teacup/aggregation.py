@@ -0,0 +1,301 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package aggregation
+# Aggregation of time series over time windows (e.g. throughput computed
+# from packet sizes) and level of detail reduction of time series for
+# plotting, used by the plot functions and TeaPlot
+#
+# The window size and the step between windows correspond to
+# TC_AGGR_WIN_SIZE and TC_AGGR_WIN_SIZE / TC_AGGR_INT_FACTOR of the R
+# plot scripts. interval_aggregate() and thin_points() compute the same as
+# the aggregation (TC_AGGR) and point thinning (point_thinning.R) of the R
+# plot scripts, so the data can be reduced before it is passed to R.
+#
+# $Id$
+
+import numpy as np
+
+
+## Compute sums over sliding time windows using prefix sums
+## A window starts at a data point. The window sum includes all points after
+## the start point up to and including the first point after the window end
+## (this is how TeaPlot always computed windows). The next window starts at
+## the first point that is more than step seconds after the start point.
+## Each window sum is normalised to the window size and its timestamp is the
+## start time plus half the window size.
+#  @param times Timestamps (sorted in ascending order)
+#  @param values Values
+#  @param window_size Window size in seconds
+#  @param step Minimum time between window starts in seconds
+#  @return Tuple of arrays (timestamps, normalised window sums)
+def sliding_window_sum(times, values, window_size=1.0, step=0.1):
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(times)
+    if n == 0:
+        return (np.empty(0), np.empty(0))
+
+    # window starts: follow the chain of next starts
+    next_start = np.searchsorted(times, times + step, side='right')
+    starts = []
+    idx = 0
+    while idx < n:
+        starts.append(idx)
+        idx = max(next_start[idx], idx + 1)
+    starts = np.array(starts, dtype=np.intp)
+
+    # last point of each window is the first point after the window end
+    start_times = times[starts]
+    ends = np.minimum(np.searchsorted(times, start_times + window_size,
+                                      side='right'), n - 1)
+    ends = np.maximum(ends, starts)
+
+    cum_values = np.concatenate(([0.0], np.cumsum(values)))
+    sums = cum_values[ends + 1] - cum_values[starts + 1]
+    # windows that end before time zero are empty
+    sums[start_times + window_size < 0] = 0.0
+
+    return (start_times + window_size / 2, sums / window_size)
+
+
+## Aggregate time series over time intervals like the R plot scripts (TC_AGGR)
+## Values are aggregated in intervals of window_size seconds. The interval
+## boundaries are shifted by window_size / int_factor int_factor times
+## (oversampling), and the results for all shifts are merged and sorted by time.
+## The timestamp of an interval is computed exactly like in the R scripts.
+#  @param times Timestamps
+#  @param values Values
+#  @param window_size Interval size in seconds
+#  @param int_factor Oversampling factor
+#  @param func 'sum' sum of values divided by interval size (throughput),
+#              'percentage' sum of values as percentage of the number of
+#              values (packet loss, values are 0 or 1)
+#  @return Tuple of arrays (timestamps, aggregated values)
+def interval_aggregate(times, values, window_size=1.0, int_factor=4, func='sum'):
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(times) == 0:
+        return (np.empty(0), np.empty(0))
+
+    # same offsets as seq(0, window_size, by=window_size/int_factor) without
+    # the last element
+    step = window_size / float(int_factor)
+    num_offsets = int(np.floor(window_size / step + 1e-10))
+    offsets = np.arange(num_offsets + 1)[:-1] * step
+
+    out_times = []
+    out_values = []
+    for offset in offsets:
+        intervals = np.floor((times - offset) * (1.0 / window_size))
+        uniq, inverse = np.unique(intervals, return_inverse=True)
+        sums = np.bincount(inverse, weights=values)
+        if func == 'sum':
+            out_values.append(sums * (1.0 / window_size))
+        else:
+            out_values.append(sums / np.bincount(inverse) * 100.0)
+        out_times.append(uniq / (1.0 / window_size) + offset +
+                         (1.0 / int_factor) / 2 + window_size / 2)
+
+    out_times = np.concatenate(out_times)
+    order = np.argsort(out_times, kind='mergesort')
+
+    return (out_times[order], np.concatenate(out_values)[order])
+
+
+## Thin out data points like the R plot scripts (point_thinning.R)
+## A point is kept if its time or value differs from the last kept point by at
+## least the given distance. The first point is always kept.
+#  @param times Timestamps
+#  @param values Values
+#  @param dist_x Minimum time distance
+#  @param dist_y Minimum value distance
+#  @return Array of indices of kept points (sorted in ascending order)
+def thin_points(times, values, dist_x, dist_y):
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(times)
+    if n == 0:
+        return np.arange(0)
+
+    # a point that is far enough from its predecessor is kept if the
+    # predecessor was kept, so runs of such points are kept at once
+    far = np.concatenate(([False],
+                          (np.abs(np.diff(times)) >= dist_x) |
+                          (np.abs(np.diff(values)) >= dist_y)))
+    not_far = np.flatnonzero(~far)
+
+    keep = [ np.zeros(1, dtype=np.intp) ]
+    last = 0
+    start = 1
+    chunk = 64
+    # search the next point to keep in increasingly larger chunks, so we only
+    # loop over kept points
+    while start < n:
+        if far[start] and start == last + 1:
+            pos = np.searchsorted(not_far, start)
+            end = not_far[pos] if pos < len(not_far) else n
+            keep.append(np.arange(start, end))
+            last = end - 1
+            start = end
+            continue
+        end = min(start + chunk, n)
+        hits = np.flatnonzero(
+            (np.abs(times[start:end] - times[last]) >= dist_x) |
+            (np.abs(values[start:end] - values[last]) >= dist_y))
+        if len(hits) == 0:
+            start = end
+            chunk *= 2
+            continue
+        last = start + hits[0]
+        keep.append(np.array([ last ]))
+        start = last + 1
+        chunk = max(64, 2 * (hits[0] + 1))
+
+    return np.concatenate(keep).astype(np.intp)
+
+
+## Minimum number of data points of the coarsest level of detail
+LOD_MIN_POINTS = 2000
+## Reduction factor between levels of detail
+LOD_FACTOR = 4
+
+
+## Select data points that preserve the shape of a line plot (M4 aggregation)
+## The time range is divided into buckets of equal duration. For each bucket
+## the first, last, minimum and maximum point are selected, so a line plot of
+## the selected points with one bucket per pixel looks like the plot of all
+## data points.
+#  @param times Timestamps (sorted in ascending order)
+#  @param values Values
+#  @param num_buckets Number of buckets
+#  @return Array of indices of selected points (sorted in ascending order)
+def m4_indices(times, values, num_buckets):
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(times)
+    num_buckets = max(int(num_buckets), 1)
+    if n <= 4 * num_buckets:
+        return np.arange(n)
+
+    duration = times[-1] - times[0]
+    if duration > 0:
+        buckets = ((times - times[0]) * (num_buckets / duration)).astype(np.int64)
+        np.minimum(buckets, num_buckets - 1, out=buckets)
+    else:
+        buckets = np.zeros(n, dtype=np.int64)
+
+    # buckets are contiguous since times are sorted
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [n])) - 1
+    segment = np.repeat(np.arange(len(starts)), ends - starts + 1)
+
+    mins = _first_in_segment(values == np.minimum.reduceat(values, starts)[segment],
+                             segment)
+    maxs = _first_in_segment(values == np.maximum.reduceat(values, starts)[segment],
+                             segment)
+
+    return np.unique(np.concatenate((starts, ends, mins, maxs)))
+
+
+## Get first index of each segment where mask is true
+#  @param mask Boolean array
+#  @param segment Segment number of each element (non-decreasing)
+#  @return Array of indices
+def _first_in_segment(mask, segment):
+
+    idx = np.flatnonzero(mask)
+    seg = segment[idx]
+
+    return idx[np.concatenate(([True], seg[1:] != seg[:-1]))] if len(idx) > 0 else idx
+
+
+## Build levels of detail of a time series
+## Each level has about LOD_FACTOR times fewer points than the next finer
+## level and is computed from it with M4 aggregation, until a level has no more
+## than min_points points. The full data is the finest level and is not
+## included in the result.
+#  @param times Timestamps (sorted in ascending order)
+#  @param values Values
+#  @param min_points Maximum number of points of the coarsest level
+#  @return List of index arrays into times/values (finest level first)
+def build_lod_levels(times, values, min_points=LOD_MIN_POINTS):
+
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    levels = []
+    idx = np.arange(len(times))
+    while len(idx) > min_points:
+        sub = m4_indices(times[idx], values[idx], len(idx) // (4 * LOD_FACTOR))
+        if len(sub) >= len(idx):
+            break
+        idx = idx[sub]
+        levels.append(idx)
+
+    return levels
+
+
+## Select the data points of a time range for display
+## Uses the coarsest level of detail whose buckets are not wider than one pixel
+## and reduces the points in the time range further if there are more than 4
+## per pixel. The points just before and after the time range are included,
+## so lines reach the borders of the plot.
+#  @param times Timestamps (sorted in ascending order)
+#  @param values Values
+#  @param levels Levels of detail returned by build_lod_levels()
+#  @param start Start of time range
+#  @param end End of time range
+#  @param pixels Number of pixels available for the time range
+#  @return Array of indices of selected points (sorted in ascending order)
+def select_lod(times, values, levels, start, end, pixels):
+
+    times = np.asarray(times, dtype=np.float64)
+    pixels = max(int(pixels), 1)
+    duration = times[-1] - times[0] if len(times) > 0 else 0.0
+    pixel_width = (end - start) / float(pixels)
+
+    idx = None
+    num_points = len(times)
+    for level in levels:
+        # number of buckets the level was built with
+        num_buckets = num_points // (4 * LOD_FACTOR)
+        if duration > pixel_width * num_buckets:
+            break
+        idx = level
+        num_points = len(level)
+
+    level_times = times if idx is None else times[idx]
+    lo = max(np.searchsorted(level_times, start, side='left') - 1, 0)
+    hi = min(np.searchsorted(level_times, end, side='right') + 1, len(level_times))
+    sel = np.arange(lo, hi) if idx is None else idx[lo:hi]
+    if len(sel) > 4 * pixels:
+        sel = sel[m4_indices(times[sel], np.asarray(values)[sel], pixels)]
+
+    return sel
@@ -43,39 +43,58 @@ from internalutil import _list
 from clockoffset import adjust_timestamps
 from filefinder import get_testid_file_list
 from flowcache import append_flow_cache, lookup_flow_cache
+from pcapreader import get_pcap_flows
+from pktstore import get_store_flows, get_flow_pkts, get_src_pkts, \
+    write_columns, TCP_FLAG_ACK
+from sppmatch import write_spp_rtts
+from bursts import get_burst_ranges, get_burst_acked_bytes, get_burst_dupacks
+from datacache import load_data_file
+from incremental import filter_analysed_job_groups
 from sourcefilter import SourceFilter
 from analyseutil import get_out_dir, get_out_name, filter_min_values, \
-    select_bursts, get_address_pair_analysis
+    select_bursts, get_address_pair_analysis, run_job_groups, count_rows
 from plot import plot_time_series, plot_dash_goodput, plot_incast_ACK_series
 
 import gzip
 import socket
 import csv
-from ctypes import *
-
-
-# structure for ttprobe binary format
-class TTprobe(Structure):
-    _fields_ = [
-            ('tv_sec', c_uint64),
-            ('tv_usec', c_uint64),
-            ('src_addr', c_uint8 * 16),
-            ('dst_addr', c_uint8 * 16),
-            ('src_port', c_uint16),
-            ('dst_port', c_uint16),
-            ('length', c_uint16),
-            ('snd_nxt', c_uint32),
-            ('snd_una', c_uint32),
-            ('snd_wnd', c_uint32),
-            ('rcv_wnd', c_uint32),
-            ('snd_cwnd', c_uint32),
-            ('ssthresh', c_uint32),
-            ('srtt', c_uint32),
-            ('mss_cache', c_uint32),
-            ('sock_state', c_uint8),
-            ('direction', c_uint8),
-            ('addr_family', c_uint8),
-            ]
+import numpy as np
+
+
+## numpy structured type for ttprobe binary format (same layout as the C
+## structure written by ttprobe, ports are in network byte order)
+TTPROBE_DTYPE = np.dtype([
+    ('tv_sec', '=u8'),
+    ('tv_usec', '=u8'),
+    ('src_addr', 'u1', (16, )),
+    ('dst_addr', 'u1', (16, )),
+    ('src_port', '>u2'),
+    ('dst_port', '>u2'),
+    ('length', '=u2'),
+    ('snd_nxt', '=u4'),
+    ('snd_una', '=u4'),
+    ('snd_wnd', '=u4'),
+    ('rcv_wnd', '=u4'),
+    ('snd_cwnd', '=u4'),
+    ('ssthresh', '=u4'),
+    ('srtt', '=u4'),
+    ('mss_cache', '=u4'),
+    ('sock_state', 'u1'),
+    ('direction', 'u1'),
+    ('addr_family', 'u1'),
+    ], align=True)
+
+## Number of ttprobe records decoded at once
+TTPROBE_CHUNK_RECORDS = 262144
+
+## Fields of a ttprobe record that identify the flow
+TTPROBE_FLOW_DTYPE = np.dtype([
+    ('src_addr', 'u1', (16, )),
+    ('dst_addr', 'u1', (16, )),
+    ('src_port', '>u2'),
+    ('dst_port', '>u2'),
+    ('addr_family', 'u1'),
+    ])
 
 ## Guess ttprobe file format
 #  @param file_name ttprobe File name to be checked
@@ -118,6 +137,53 @@ def arraytoIP(ip, addr_family):
             )
 
 
+## Read binary ttprobe file in chunks of records
+#  @param ttprobe_file ttprobe file name
+#  @return Generator of arrays of TTPROBE_DTYPE records
+def read_ttprobe_chunks(ttprobe_file):
+
+    chunk_size = TTPROBE_CHUNK_RECORDS * TTPROBE_DTYPE.itemsize
+    with gzip.open(ttprobe_file, 'rb') as f:
+        while True:
+            buf = f.read(chunk_size)
+            # ignore incomplete record at the end
+            records = len(buf) // TTPROBE_DTYPE.itemsize
+            if records == 0:
+                break
+            yield np.frombuffer(buf, dtype=TTPROBE_DTYPE, count=records)
+            if len(buf) < chunk_size:
+                break
+
+
+## Compute flow ids of ttprobe records
+#  @param records Array of TTPROBE_DTYPE records
+#  @param flow_names Map of flow keys to flow names, new flows are added
+#  @return Array of flow names, array with index into flow names for each record
+def get_ttprobe_record_flows(records, flow_names):
+
+    keys = np.empty(len(records), dtype=TTPROBE_FLOW_DTYPE)
+    for field in TTPROBE_FLOW_DTYPE.names:
+        keys[field] = records[field]
+
+    keys, inverse = np.unique(keys.view('V%i' % TTPROBE_FLOW_DTYPE.itemsize),
+                              return_inverse=True)
+
+    names = []
+    for key in keys:
+        key_str = key.tostring()
+        name = flow_names.get(key_str)
+        if name is None:
+            k = np.frombuffer(key_str, dtype=TTPROBE_FLOW_DTYPE)[0]
+            name = '%s,%s,%s,%s' % (arraytoIP(k['src_addr'], k['addr_family']),
+                                    k['src_port'],
+                                    arraytoIP(k['dst_addr'], k['addr_family']),
+                                    k['dst_port'])
+            flow_names[key_str] = name
+        names.append(name)
+
+    return (names, inverse)
+
+
 ## Get unique TCP flows from ttprobe file
 #  @param ttprobe_file ttprobe file name
 #  @return A list of flows
@@ -125,19 +191,14 @@ def get_ttprobe_flows(ttprobe_file=''):
     # guss ttprobe file format
     ttprobe_format = guess_ttprobe_file_format(ttprobe_file)
     if ttprobe_format == 'binary':
-        x = TTprobe()
         # the idea of using set data stracture is to get a unique flow without need
         # for duplication checking
         flows_set = set()
+        flow_names = {}
         try:
-            with gzip.open(ttprobe_file, 'rb') as f:
-                while f.readinto(x) == sizeof(x):
-                    flow = '%s,%s,%s,%s' % (arraytoIP(x.src_addr, x.addr_family),
-                        socket.ntohs(x.src_port),
-                        arraytoIP(x.dst_addr, x.addr_family),
-                        socket.ntohs(x.dst_port)
-                        )
-                    flows_set.add(flow)
+            for records in read_ttprobe_chunks(ttprobe_file):
+                names, inverse = get_ttprobe_record_flows(records, flow_names)
+                flows_set.update(names)
         except IOError:
             print('Cannot open file %s' % ttprobe_file)
         # convert set to list and then sort it
@@ -161,59 +222,109 @@ def get_ttprobe_flows(ttprobe_file=''):
         return flows
 
 
+## Get columns of requested fields from binary ttprobe records
+#  @param records Array of TTPROBE_DTYPE records
+#  @param fields List of fields to be extracted (start index is 1)
+#  @return List of columns (lists of values, srtt is converted to seconds and
+#          formatted as string)
+def _get_ttprobe_columns(records, fields):
+
+    mss = records['mss_cache'].astype(np.uint64)
+    columns = []
+    for field in fields:
+        if field == '1':
+            col = records['direction']
+        elif field == '8':
+            col = records['mss_cache']
+        elif field == '9':
+            col = [ str(v) for v in (records['srtt'] / 1000.0).tolist() ]
+        elif field == '10':
+            col = records['snd_cwnd'] * mss
+        elif field == '11':
+            col = records['ssthresh']
+        elif field == '12':
+            col = records['snd_wnd'] * mss
+        elif field == '13':
+            col = records['rcv_wnd'] * mss
+        elif field == '14':
+            col = records['sock_state']
+        elif field == '15':
+            col = records['snd_una']
+        elif field == '16':
+            col = records['snd_nxt']
+        elif field == '17':
+            col = records['length']
+        else:
+            abort('Unsupported ttprobe field %s' % field)
+
+        if not isinstance(col, list):
+            col = col.tolist()
+        columns.append(col)
+
+    return columns
+
+
 ## extract fileds from tprobe file
+## The file is read once and the data of all flows and statistics is written
 #  @param ttprobe_file ttprobe file name
-#  @param attributes Fields to be extracted
-#  @param rflow Flows to be filtered on
-#  @param out the output file
-def extract_ttprobe_fileds_data(ttprobe_file, attributes, rflow, io_filter, out):
+#  @param stats List of tuples (attributes, io_filter) of the statistics to be
+#               extracted, attributes is a comma-separated list of fields and
+#               io_filter is 'i', 'o' or 'io'
+#  @param flow_outs Map of flows to be filtered on to lists of output file
+#                   names, one for each statistic (None if the statistic is
+#                   not extracted for the flow)
+def extract_ttprobe_fileds_data(ttprobe_file, stats, flow_outs):
+
+    puts('Extracting fields (%s) from ttprobe file %s' %
+         (';'.join([ attributes for attributes, io_filter in stats ]),
+          ttprobe_file))
+    stat_fields = [ attributes.split(',') for attributes, io_filter in stats ]
+
+    # create all output files, even if there is no data for a flow
+    for outs in flow_outs.values():
+        for out in outs:
+            if out is not None:
+                open(out, 'w').close()
 
-    puts('Extracting fields (%s) from ttprobe file %s' % (attributes, ttprobe_file))
-    fields = attributes.split(',')
     ttprobe_format = guess_ttprobe_file_format(ttprobe_file)
     if ttprobe_format == 'binary':
-        x = TTprobe()
+        directions = [ [ ord(c) for c in io_filter ]
+                       for attributes, io_filter in stats ]
+        all_directions = list(set(sum(directions, [])))
+        row_fmts = [ '%u.%06u' + ''.join([ ',%s' if field == '9' else ',%u'
+                                           for field in fields ]) + '\n'
+                     for fields in stat_fields ]
+        flow_names = {}
         try:
-            with gzip.open(ttprobe_file, 'rb') as f:
-                with open(out, 'w') as fout:
-                    while f.readinto(x) == sizeof(x):
-                        # ignore the values when TCP socket state is SYN_SENT (==2)
-                        if x.sock_state == 2:
-                            continue
-                        if chr(x.direction) in io_filter:
-                            flow = '%s,%s,%s,%s' % (arraytoIP(x.src_addr, x.addr_family),
-                                socket.ntohs(x.src_port),
-                                arraytoIP(x.dst_addr, x.addr_family),
-                                socket.ntohs(x.dst_port)
-                                )
-                            if rflow == flow:
-                                fval = ''
-                                fout.write('%u.%06u' % (x.tv_sec, x.tv_usec))
-                                for field in fields:
-                                    if field == '1':
-                                        fval = x.direction
-                                    if field == '8':
-                                        fval = x.mss_cache
-                                    if field == '9':
-                                        fval = x.srtt / 1000.0
-                                    if field == '10':
-                                        fval = x.snd_cwnd * x.mss_cache
-                                    elif field == '11':
-                                        fval = x.ssthresh
-                                    elif field == '12':
-                                        fval = x.snd_wnd * x.mss_cache
-                                    elif field == '13':
-                                        fval = x.rcv_wnd * x.mss_cache
-                                    elif field == '14':
-                                        fval = x.sock_state
-                                    elif field == '15':
-                                        fval = x.snd_una
-                                    elif field == '16':
-                                        fval = x.snd_nxt
-                                    elif field == '17':
-                                        fval = x.length
-                                    fout.write(',' + str(fval))
-                                fout.write('\n')
+            for records in read_ttprobe_chunks(ttprobe_file):
+                # ignore the values when TCP socket state is SYN_SENT (==2)
+                records = records[(records['sock_state'] != 2) &
+                                  np.in1d(records['direction'], all_directions)]
+                if len(records) == 0:
+                    continue
+
+                names, inverse = get_ttprobe_record_flows(records, flow_names)
+
+                # partition the records by flow, keeping the order in the file
+                order = np.argsort(inverse, kind='mergesort')
+                ends = np.cumsum(np.bincount(inverse, minlength=len(names)))
+                start = 0
+                for flow_id, flow in enumerate(names):
+                    end = ends[flow_id]
+                    if flow in flow_outs and end > start:
+                        flow_records = records[order[start:end]]
+                        for i, out in enumerate(flow_outs[flow]):
+                            if out is None:
+                                continue
+                            stat_records = flow_records[
+                                np.in1d(flow_records['direction'], directions[i])]
+                            rows = zip(stat_records['tv_sec'].tolist(),
+                                       stat_records['tv_usec'].tolist(),
+                                       *_get_ttprobe_columns(stat_records,
+                                                             stat_fields[i]))
+                            with open(out, 'a') as fout:
+                                fout.writelines([ row_fmts[i] % row for row in rows ])
+                    start = end
 
         except IOError:
             print('Cannot open file %s' % ttprobe_file)
@@ -221,28 +332,38 @@ def extract_ttprobe_fileds_data(ttprobe_file, attributes, rflow, io_filter, out)
         return 0
 
     elif ttprobe_format == 'ttprobe':
+        fouts = {}
         try:
+            for flow, outs in flow_outs.items():
+                fouts[flow] = [ open(out, 'a') if out is not None else None
+                                for out in outs ]
             with gzip.open(ttprobe_file, 'rb') as f:
-                with open(out, 'w') as fout:
-                    ttprobe_cvs_reader = csv.reader(f, delimiter=',')
-                    for row in ttprobe_cvs_reader:
-                        # ignore the values when TCP socket state is SYN_SENT (==2)
-                        if row[13] == '2':
+                ttprobe_cvs_reader = csv.reader(f, delimiter=',')
+                for row in ttprobe_cvs_reader:
+                    # ignore the values when TCP socket state is SYN_SENT (==2)
+                    if row[13] == '2':
+                        continue
+                    flow = '%s,%s,%s,%s' % (row[2], row[3], row[4], row[5])
+                    if flow not in fouts:
+                        continue
+                    for i, fout in enumerate(fouts[flow]):
+                        if fout is None or row[0] not in stats[i][1]:
                             continue
-                        if row[0] in io_filter:
-                            flow = '%s,%s,%s,%s' % (row[2], row[3], row[4], row[5])
-                            if rflow == flow:
-                                fout.write(row[1])
-                                for field in fields:
-                                    # if field is srtt, then convert to second
-                                    if int(field) == 9:
-                                        fout.write(',%s' % (int(row[int(field) - 1]) / 1000.0))
-                                    else:
-                                        fout.write(',' + row[int(field) - 1])
-                                fout.write('\n')
-                fout.close()
+                        fout.write(row[1])
+                        for field in stat_fields[i]:
+                            # if field is srtt, then convert to second
+                            if int(field) == 9:
+                                fout.write(',%s' % (int(row[int(field) - 1]) / 1000.0))
+                            else:
+                                fout.write(',' + row[int(field) - 1])
+                        fout.write('\n')
         except IOError:
             print('Cannot open file %s' % ttprobe_file)
+        finally:
+            for outs in fouts.values():
+                for fout in outs:
+                    if fout is not None:
+                        fout.close()
         return 0
 
 
@@ -268,11 +389,33 @@ def extract_ttprobe(test_id='', out_dir='', replot_only='0', source_filter='',
                    attributes='', out_file_ext='', post_proc=None,
                    ts_correct='1', io_filter='i'):
 
-    if io_filter != 'i' and io_filter != 'o' and io_filter != 'io':
-        abort('Invalid parameter value for io_filter')
+    return extract_ttprobe_stats(test_id, out_dir, replot_only, source_filter,
+                                 [ (attributes, out_file_ext, post_proc, io_filter) ],
+                                 ts_correct)[0]
 
-    out_files = {}
-    out_groups = {}
+
+## Extract data of several statistics from ttprobe files, reading each file
+## only once
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again, just redo the plot
+#  @param source_filter Filter on specific sources
+#  @param stats List of tuples (attributes, out_file_ext, post_proc, io_filter),
+#               one for each statistic (SEE extract_ttprobe)
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @return List of tuples (map of flow names to interim data file names,
+#          map of file names and group IDs), one for each statistic
+def extract_ttprobe_stats(test_id='', out_dir='', replot_only='0', source_filter='',
+                          stats=[], ts_correct='1'):
+
+    for attributes, out_file_ext, post_proc, io_filter in stats:
+        if io_filter != 'i' and io_filter != 'o' and io_filter != 'io':
+            abort('Invalid parameter value for io_filter')
+
+    out_files = [ {} for stat in stats ]
+    out_groups = [ {} for stat in stats ]
 
     test_id_arr = test_id.split(';')
 
@@ -298,6 +441,9 @@ def extract_ttprobe(test_id='', out_dir='', replot_only='0', source_filter='',
                 flows = get_ttprobe_flows(ttprobe_file)
                 append_flow_cache(ttprobe_file, flows)
 
+            # flows and output files, extract all flows in one pass
+            flow_outs = {}
+            extract_outs = {}
             for flow in flows:
 
                 src, src_port, dst, dst_port = flow.split(',')
@@ -309,18 +455,45 @@ def extract_ttprobe(test_id='', out_dir='', replot_only='0', source_filter='',
                 if src == '' or dst == '':
                     continue
 
+                flow_name = flow.replace(',', '_')
+                flow_outs[flow] = []
+                extract_outs[flow] = []
+                for attributes, out_file_ext, post_proc, io_filter in stats:
+                    out = out_dirname + test_id + '_' + flow_name + '_ttprobe.' + \
+                        out_file_ext
+                    flow_outs[flow].append(out)
+                    # statistics can share output files, extract them only once
+                    if (replot_only == '0' or not os.path.isfile(out)) and \
+                       out not in extract_outs[flow]:
+                        extract_outs[flow].append(out)
+                    else:
+                        extract_outs[flow].append(None)
+
+            if len([ out for outs in extract_outs.values() for out in outs
+                     if out is not None ]) > 0:
+                extract_ttprobe_fileds_data(ttprobe_file,
+                                            [ (attributes, io_filter) for
+                                              attributes, out_file_ext, post_proc,
+                                              io_filter in stats ],
+                                            extract_outs)
+
+                for outs in extract_outs.values():
+                    for i, out in enumerate(outs):
+                        post_proc = stats[i][2]
+                        if out is not None and post_proc is not None:
+                            post_proc(ttprobe_file, out)
+
+            for flow in flows:
+
+                if flow not in flow_outs:
+                    continue
+
                 flow_name = flow.replace(',', '_')
                 # test id plus flow name
                 if len(test_id_arr) > 1:
                     long_flow_name = test_id + '_' + flow_name
                 else:
                     long_flow_name = flow_name
-                out = out_dirname + test_id + '_' + flow_name + '_ttprobe.' + out_file_ext
-                if replot_only == '0' or not os.path.isfile(out):
-                    extract_ttprobe_fileds_data(ttprobe_file, attributes, flow, io_filter, out)
-
-                    if post_proc is not None:
-                        post_proc(ttprobe_file, out)
 
                 if sfil.is_in(flow_name):
                     if ts_correct == '1':
@@ -328,14 +501,17 @@ def extract_ttprobe(test_id='', out_dir='', replot_only='0', source_filter='',
                             'echo %s | sed "s/.*_\([a-z0-9\.]*\)_ttprobe.log.gz/\\1/"' %
                             (ttprobe_file),
                             capture=True)
-                        out = adjust_timestamps(test_id, out, host, ',', out_dir)
 
-                    out_files[long_flow_name] = out
-                    out_groups[out] = group
+                    for i, out in enumerate(flow_outs[flow]):
+                        if ts_correct == '1':
+                            out = adjust_timestamps(test_id, out, host, ',', out_dir)
+
+                        out_files[i][long_flow_name] = out
+                        out_groups[i][out] = group
 
         group += 1
 
-    return (out_files, out_groups)
+    return zip(out_files, out_groups)
 
 
 
@@ -505,7 +681,7 @@ def analyse_dash_goodput(test_id='', out_dir='', replot_only='0', dash_log_list=
     puts('\n[MAIN] COMPLETED plotting DASH goodput %s \n' % out_name)
 
 
-## Extract RTT for flows using SPP
+## Extract RTT for flows using synthetic packet pairs (SPP)
 ## The extracted files have an extension of .rtts. The format is CSV with the
 ## columns:
 ## 1. Timestamp RTT measured (seconds.microseconds)
@@ -547,8 +723,6 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
     # Initialise source filter data structure
     sfil = SourceFilter(source_filter)
 
-    #local('which spp')
-
     if udp_map != '':
         entries = udp_map.split(';')
         for entry in entries:
@@ -571,22 +745,7 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
             dir_name = os.path.dirname(tcpdump_file)
 
             # get unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_store_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -621,19 +780,7 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                     dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext 
                     dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext 
 
-                    # control the fields used by spp for generating the packet
-                    # ids (hashes)
                     if proto == 'udp':
-                        pid_fields = 2111
-                    else:
-                        pid_fields = 511
-
-                    if proto == 'tcp':
-                        filter1 = '(src host ' + src_internal + ' && src port ' + src_port + \
-                                  ') || (' + \
-                                  'dst host ' + src_internal + ' && dst port ' + src_port + ')'
-                        filter2 = filter1 
-                    else:
                         entry = udp_reverse_map.get(
                             src_internal + ',' + src_port, '')
                         if entry != '':
@@ -642,48 +789,45 @@ def _extract_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                                 '_' + src2_internal + '_' + src2_port
                             rev_name = src2_internal + '_' + src2_port + \
                                 '_' + src_internal + '_' + src_port
-                            filter1 = '(src host ' + src_internal + ' && src port ' + src_port + \
-                                ') || ( ' + \
-                                'src host ' + src2_internal + ' && src port ' + src2_port + ')'
-                            filter2 = filter1 
                             if rev_name in out_files:
                                 continue
                         else:
                             warn('No entry in udp_map for %s:%s' % (src_internal, src_port)) 
                             continue
 
-                    out1 = out_dirname + test_id + \
-                        '_' + src + '_filtered_' + name + '_ref.dmp'
-                    out2 = out_dirname + test_id + \
-                        '_' + dst + '_filtered_' + name + '_mon.dmp'
                     out_rtt = out_dirname + test_id + '_' + name + ofile_ext 
                     rev_out_rtt = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
                     if replot_only == '0' or not ( os.path.isfile(out_rtt) and \
                                                    os.path.isfile(rev_out_rtt) ): 
-                        # create filtered tcpdumps
-                        local(
-                            'zcat %s | tcpdump -nr - -w %s "%s"' %
-                            (dump1, out1, filter1))
-                        local(
-                            'zcat %s | tcpdump -nr - -w %s "%s"' %
-                            (dump2, out2, filter2))
-
-                        # compute rtts with spp
-                        local(
-                            'spp -# %s -a %s -f %s -A %s -F %s > %s' %
-                            (pid_fields, src_internal, out1, dst_internal, out2, out_rtt))
-                        local(
-                            'spp -# %s -a %s -f %s -A %s -F %s > %s' %
-                            (pid_fields,
-                             dst_internal,
-                             out2,
-                             src_internal,
-                             out1,
-                             rev_out_rtt))
-
-                        # remove filtered tcpdumps
-                        local('rm -f %s %s' % (out1, out2))
+                        # get packets of both directions at both ends
+                        if proto == 'tcp':
+                            pkts1_out = get_flow_pkts(dump1, src_internal, src_port,
+                                                      dst_internal, dst_port, proto)
+                            pkts1_back = get_flow_pkts(dump1, dst_internal, dst_port,
+                                                       src_internal, src_port, proto)
+                            pkts2_out = get_flow_pkts(dump2, src_internal, src_port,
+                                                      dst_internal, dst_port, proto)
+                            pkts2_back = get_flow_pkts(dump2, dst_internal, dst_port,
+                                                       src_internal, src_port, proto)
+                        else:
+                            # two unidirectional UDP flows
+                            pkts1_out = get_src_pkts(dump1, src_internal, src_port,
+                                                     proto)
+                            pkts1_back = get_src_pkts(dump1, src2_internal, src2_port,
+                                                      proto)
+                            pkts2_out = get_src_pkts(dump2, src_internal, src_port,
+                                                     proto)
+                            pkts2_back = get_src_pkts(dump2, src2_internal, src2_port,
+                                                      proto)
+
+                        # compute rtts, reference point is the source for the
+                        # forward direction and the destination for the reverse
+                        # direction
+                        write_spp_rtts(out_rtt, pkts1_out, pkts1_back,
+                                       pkts2_out, pkts2_back, proto)
+                        write_spp_rtts(rev_out_rtt, pkts2_back, pkts2_out,
+                                       pkts1_back, pkts1_out, proto)
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
@@ -796,6 +940,127 @@ def analyse_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
     puts('\n[MAIN] COMPLETED plotting RTTs %s \n' % out_name)
 
 
+## Read siftr log file once, check it and split the data of all flows into
+## per-flow files. Each output line has the timestamp and the attribute
+## columns, like
+##   zcat | grep -v enable | head -<lines - 3> | egrep "^<io_filter>" |
+##   cut -d',' -f 3,4,5,6,7,<attributes> | grep <flow> | cut -d',' -f 1,6-
+## did before for each flow.
+#  @param siftr_file siftr log file name
+#  @param stats List of tuples (attributes, io_filter) of the statistics to be
+#               extracted, attributes is a comma-separated list of attributes
+#               (start index is 1) and io_filter is 'i', 'o' or 'io'
+#  @param get_flow_outs Function called with a flow string that returns the
+#                       list of output file names for the flow, one for each
+#                       statistic (None if the statistic is not extracted),
+#                       or None if the flow is not to be extracted
+#  @param flows Known flows (from cache) or None
+#  @param check_file If True abort if the file is incomplete or siftr was
+#                    not patched to log ertt
+#  @return Tuple (sorted list of flows found, list of the names of the files
+#          written for each statistic)
+def split_siftr_file(siftr_file, stats, get_flow_outs, flows=None,
+                     check_file=True):
+
+    # columns as cut selects them: in file order and each column only once
+    columns = [ sorted(set([3, 4, 5, 6, 7] +
+                           [ int(a) for a in attributes.split(',') ]))
+                for attributes, io_filter in stats ]
+    directions = [ tuple(io_filter) for attributes, io_filter in stats ]
+    all_directions = tuple(set(sum(directions, ())))
+
+    known_flows = None
+    if flows != None:
+        known_flows = set(flows)
+    flows_found = set()
+    outs = {}
+    fouts = {}
+
+    # the last three lines of the file are not used (disable line), but we
+    # only know the number of lines at the end, so we hold back lines
+    held_back = []
+    lines_total = 0
+    lines_written = 0
+    last_line = ''
+
+    def write_line(line):
+        fields = line.split(',')
+        flow = ','.join(fields[3:7])
+        flows_found.add(flow)
+        if flow not in outs:
+            if known_flows != None and flow not in known_flows:
+                outs[flow] = None
+            else:
+                outs[flow] = get_flow_outs(flow)
+            if outs[flow] != None:
+                fouts[flow] = [ open(out, 'w') if out != None else None
+                                for out in outs[flow] ]
+        if outs[flow] != None:
+            for i, fout in enumerate(fouts[flow]):
+                if fout != None and line.startswith(directions[i]):
+                    sel = [ fields[c - 1] for c in columns[i] if c <= len(fields) ]
+                    fout.write(','.join(sel[0:1] + sel[5:]) + '\n')
+
+    try:
+        with gzip.open(siftr_file, 'rb') as f:
+            for line_num, line in enumerate(f):
+                if line.endswith('\n'):
+                    lines_total += 1
+                    line = line[:-1]
+                last_line = line
+
+                if check_file and line_num == 1:
+                    # check that we have patched siftr (27 columns)
+                    if len(line.replace(',', ' ').split()) < 27:
+                        abort('siftr needs to be patched to output ertt estimates')
+
+                if line.find('enable') != -1:
+                    continue
+
+                held_back.append(line)
+                if len(held_back) > 3:
+                    line = held_back.pop(0)
+                    lines_written += 1
+                    if line.startswith(all_directions):
+                        write_line(line)
+
+            # check that file is complete, i.e. we have the disable line
+            if check_file and last_line.find('disable_time_secs') == -1:
+                abort('Incomplete siftr file %s' % siftr_file)
+
+            # we need to stop reading before the log disable line
+            for line in held_back[0:max(lines_total - 3 - lines_written, 0)]:
+                if line.startswith(all_directions):
+                    write_line(line)
+    except IOError:
+        abort('Cannot read file %s' % siftr_file)
+    finally:
+        for flow_fouts in fouts.values():
+            for fout in flow_fouts:
+                if fout != None:
+                    fout.close()
+
+    # create (empty) output files for known flows without data
+    if flows == None:
+        flows = flows_found
+    for flow in flows:
+        if flow not in outs:
+            outs[flow] = get_flow_outs(flow)
+            if outs[flow] != None:
+                for out in outs[flow]:
+                    if out != None:
+                        open(out, 'w').close()
+
+    extracted = [ [] for stat in stats ]
+    for flow_outs in outs.values():
+        if flow_outs != None:
+            for i, out in enumerate(flow_outs):
+                if out != None:
+                    extracted[i].append(out)
+
+    return (sorted(flows_found), extracted)
+
+
 ## Extract data from siftr files
 #  @param test_id Test ID prefix of experiment to analyse
 #  @param out_dir Output directory for results
@@ -818,13 +1083,33 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
                   attributes='', out_file_ext='', post_proc=None, 
                   ts_correct='1', io_filter='o'):
 
-    out_files = {}
-    out_groups = {}
+    return extract_siftr_stats(test_id, out_dir, replot_only, source_filter,
+                               [ (attributes, out_file_ext, post_proc, io_filter) ],
+                               ts_correct)[0]
 
-    if io_filter != 'i' and io_filter != 'o' and io_filter != 'io':
-        abort('Invalid parameter value for io_filter')
-    if io_filter == 'io':
-        io_filter = '(i|o)'
+
+## Extract data of several statistics from siftr files, reading each file
+## only once
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again, just redo the plot
+#  @param source_filter Filter on specific sources
+#  @param stats List of tuples (attributes, out_file_ext, post_proc, io_filter),
+#               one for each statistic (SEE extract_siftr)
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @return List of tuples (map of flow names to interim data file names,
+#          map of file names and group IDs), one for each statistic
+def extract_siftr_stats(test_id='', out_dir='', replot_only='0', source_filter='',
+                        stats=[], ts_correct='1'):
+
+    for attributes, out_file_ext, post_proc, io_filter in stats:
+        if io_filter != 'i' and io_filter != 'o' and io_filter != 'io':
+            abort('Invalid parameter value for io_filter')
+
+    out_files = [ {} for stat in stats ]
+    out_groups = [ {} for stat in stats ]
 
     test_id_arr = test_id.split(';')
 
@@ -842,44 +1127,8 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(siftr_file, out_dir)
 
-            if replot_only == '0':
-                # check that file is complete, i.e. we have the disable line
-                with settings(warn_only=True):
-                    last_line = local(
-                        'zcat %s | tail -1 | grep disable_time_secs' %
-                        siftr_file,
-                        capture=True)
-                if last_line == '':
-                    abort('Incomplete siftr file %s' % siftr_file)
-
-                # check that we have patched siftr (27 columns)
-                cols = int(
-                    local(
-                        'zcat %s | head -2 | tail -1 | sed "s/,/ /g" | wc -w' %
-                        siftr_file,
-                        capture=True))
-                if cols < 27:
-                    abort('siftr needs to be patched to output ertt estimates')
-
-            # we need to stop reading before the log disable line
-            rows = str(int(
-                local('zcat %s | wc -l | awk \'{ print $1 }\'' %
-                      (siftr_file), capture=True)) - 3)
-
-            # unique flows
-            flows = lookup_flow_cache(siftr_file)
-            if flows == None:
-                flows = _list(
-                    local(
-                        'zcat %s | grep -v enable | head -%s | '
-                        'egrep "^%s" | '
-                        'cut -d\',\' -f 4,5,6,7 | LC_ALL=C sort -u' %
-                        (siftr_file, rows, io_filter), capture=True))
-
-                append_flow_cache(siftr_file, flows)
-
-            for flow in flows:
-
+            # output file names of flow, None if flow is not analysed
+            def get_flow_outs(flow):
                 src, src_port, dst, dst_port = flow.split(',')
 
                 # get external and internal addresses
@@ -887,6 +1136,58 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
                 dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
 
                 if src == '' or dst == '':
+                    return None
+
+                return [ out_dirname + test_id + '_' + flow.replace(',', '_') +
+                         '_siftr.' + out_file_ext
+                         for attributes, out_file_ext, post_proc, io_filter in stats ]
+
+            # output file names of flow if data needs to be extracted
+            def get_extract_outs(flow):
+                outs = get_flow_outs(flow)
+                if outs == None:
+                    return None
+
+                outs = [ out if replot_only == '0' or not os.path.isfile(out)
+                         else None for out in outs ]
+
+                # statistics can share output files, extract them only once
+                return [ out if out not in outs[:i] else None
+                         for i, out in enumerate(outs) ]
+
+            # unique flows, read file only if we don't know the flows or need
+            # to extract data
+            flows = lookup_flow_cache(siftr_file)
+            if flows == None or replot_only == '0' or \
+               any([ out != None for f in flows
+                     for out in (get_extract_outs(f) or []) ]):
+                (found_flows,
+                 extracted) = split_siftr_file(siftr_file,
+                                               [ (attributes, io_filter) for
+                                                 attributes, out_file_ext,
+                                                 post_proc, io_filter in stats ],
+                                               get_extract_outs, flows,
+                                               check_file=(replot_only == '0'))
+                if flows == None:
+                    flows = found_flows
+                    append_flow_cache(siftr_file, flows)
+
+                for i, outs in enumerate(extracted):
+                    post_proc = stats[i][2]
+                    if post_proc is not None:
+                        for out in outs:
+                            post_proc(siftr_file, out)
+
+            if ts_correct == '1':
+                host = local(
+                    'echo %s | sed "s/.*_\([a-z0-9\.]*\)_siftr.log.gz/\\1/"' %
+                    siftr_file,
+                    capture=True)
+
+            for flow in flows:
+
+                outs = get_flow_outs(flow)
+                if outs == None:
                     continue
 
                 flow_name = flow.replace(',', '_')
@@ -895,32 +1196,18 @@ def extract_siftr(test_id='', out_dir='', replot_only='0', source_filter='',
                     long_flow_name = test_id + '_' + flow_name
                 else:
                     long_flow_name = flow_name
-                out = out_dirname + test_id + '_' + flow_name + '_siftr.' + out_file_ext
-                if replot_only == '0' or not os.path.isfile(out) :
-                    local(
-                        'zcat %s | grep -v enable | head -%s | '
-                        'egrep "^%s" | '
-                        'cut -d\',\' -f 3,4,5,6,7,%s | '
-                        'grep "%s" | cut -d\',\' -f 1,6- > %s' %
-                        (siftr_file, rows, io_filter, attributes, flow, out))
-
-                    if post_proc is not None:
-                        post_proc(siftr_file, out)
 
                 if sfil.is_in(flow_name):
-                    if ts_correct == '1':
-                        host = local(
-                            'echo %s | sed "s/.*_\([a-z0-9\.]*\)_siftr.log.gz/\\1/"' %
-                            siftr_file,
-                            capture=True)
-                        out = adjust_timestamps(test_id, out, host, ',', out_dir)
+                    for i, out in enumerate(outs):
+                        if ts_correct == '1':
+                            out = adjust_timestamps(test_id, out, host, ',', out_dir)
 
-                    out_files[long_flow_name] = out
-                    out_groups[out] = group
+                        out_files[i][long_flow_name] = out
+                        out_groups[i][out] = group
 
         group += 1
 
-    return (out_files, out_groups)
+    return zip(out_files, out_groups)
 
 
 ## Guess web10g version (based on first file only!)
@@ -949,6 +1236,116 @@ def guess_version_web10g(test_id=''):
         return '2.0.7'
 
 
+## Read web10g log file once and split the data of all flows into per-flow
+## files. Each output line has the timestamp and the attribute columns, like
+##   zcat | egrep -v "[a-z]+" | sed '$d' |
+##   cut -d',' -f 1,3,4,5,6,7,8,13,14,<attributes> | grep <flow> |
+##   awk -F ',' '!a[$2$3$4$5$6$7$8$9]++' | cut -d',' -f 1,10-
+## did before for each flow. Lines with letters are netlink errors or headers
+## and the last line can be incomplete, so they are ignored. The awk command
+## suppresses lines if there is no change with respect to the fields
+## specified, this makes the output comparable to siftr where we only have
+## output if data is flying around.
+#  @param web10g_file web10g log file name
+#  @param stats List of comma-separated attribute lists (start index is 1),
+#               one for each statistic to be extracted
+#  @param get_flow_outs Function called with a flow string that returns the
+#                       list of output file names for the flow, one for each
+#                       statistic (None if the statistic is not extracted),
+#                       or None if the flow is not to be extracted
+#  @param flows Known flows (from cache) or None
+#  @param check_errors If True warn about errors in the file
+#  @return Tuple (sorted list of flows found, list of the names of the files
+#          written for each statistic)
+def split_web10g_file(web10g_file, stats, get_flow_outs, flows=None,
+                      check_errors=True):
+
+    # columns as cut selects them: in file order and each column only once
+    columns = [ sorted(set([1, 3, 4, 5, 6, 7, 8, 13, 14] +
+                           [ int(a) for a in attributes.split(',') ]))
+                for attributes in stats ]
+    has_letters = re.compile('[a-z]').search
+
+    known_flows = None
+    if flows != None:
+        known_flows = set(flows)
+    flows_found = set()
+    outs = {}
+    fouts = {}
+    # lines already seen for each flow and statistic
+    seen = {}
+    errors = []
+
+    def write_line(line):
+        fields = line.split(',')
+        flow = ','.join(fields[2:6])
+        flows_found.add(flow)
+        if flow not in outs:
+            if known_flows != None and flow not in known_flows:
+                outs[flow] = None
+            else:
+                outs[flow] = get_flow_outs(flow)
+            if outs[flow] != None:
+                fouts[flow] = [ open(out, 'w') if out != None else None
+                                for out in outs[flow] ]
+                seen[flow] = [ set() for stat in stats ]
+        if outs[flow] != None:
+            for i, fout in enumerate(fouts[flow]):
+                if fout == None:
+                    continue
+                sel = [ fields[c - 1] for c in columns[i] if c <= len(fields) ]
+                key = ''.join(sel[1:9])
+                if key not in seen[flow][i]:
+                    seen[flow][i].add(key)
+                    fout.write(','.join(sel[0:1] + sel[9:]) + '\n')
+
+    try:
+        with gzip.open(web10g_file, 'rb') as f:
+            prev_line = None
+            for line in f:
+                line = line.rstrip('\n')
+                if has_letters(line):
+                    if line.find('runbg_wrapper.sh') == -1 and \
+                       line.find('Timestamp') == -1:
+                        errors.append(line)
+                    continue
+
+                # last line can be incomplete, so write with one line delay
+                if prev_line != None:
+                    write_line(prev_line)
+                prev_line = line
+    except IOError:
+        abort('Cannot read file %s' % web10g_file)
+    finally:
+        for flow_fouts in fouts.values():
+            for fout in flow_fouts:
+                if fout != None:
+                    fout.close()
+
+    if check_errors and len(errors) > 0:
+        warn('Errors in %s:\n%s' % (web10g_file, '\n'.join(errors)))
+
+    # create (empty) output files for known flows without data
+    if flows == None:
+        flows = flows_found
+    for flow in flows:
+        if flow not in outs:
+            outs[flow] = get_flow_outs(flow)
+            if outs[flow] != None:
+                for out in outs[flow]:
+                    if out != None:
+                        open(out, 'w').close()
+
+    extracted = [ [] for stat in stats ]
+    for flow_outs in outs.values():
+        if flow_outs != None:
+            for i, out in enumerate(flow_outs):
+                if out != None:
+                    extracted[i].append(out)
+
+    return (sorted(flows_found), extracted)
+
+
 ## Extract data from web10g files
 #  @param test_id Test ID prefix of experiment to analyse
 #  @param out_dir Output directory for results
@@ -968,8 +1365,29 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
                    attributes='', out_file_ext='', post_proc=None,
                    ts_correct='1'):
 
-    out_files = {}
-    out_groups = {}
+    return extract_web10g_stats(test_id, out_dir, replot_only, source_filter,
+                                [ (attributes, out_file_ext, post_proc) ],
+                                ts_correct)[0]
+
+
+## Extract data of several statistics from web10g files, reading each file
+## only once
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again, just redo the plot
+#  @param source_filter Filter on specific sources
+#  @param stats List of tuples (attributes, out_file_ext, post_proc), one for
+#               each statistic (SEE extract_web10g)
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @return List of tuples (map of flow names to interim data file names,
+#          map of file names and group IDs), one for each statistic
+def extract_web10g_stats(test_id='', out_dir='', replot_only='0', source_filter='',
+                         stats=[], ts_correct='1'):
+
+    out_files = [ {} for stat in stats ]
+    out_groups = [ {} for stat in stats ]
 
     test_id_arr = test_id.split(';')
 
@@ -987,33 +1405,8 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
             # get input directory name and create result directory if necessary
             out_dirname = get_out_dir(web10g_file, out_dir)
 
-            # check for errors, unless we replot
-            # make sure we have exit status 0 for this, hence the final echo
-            if replot_only == '0':
-                errors = local(
-                    'zcat %s | grep -v "runbg_wrapper.sh" | grep -v "Timestamp" ' 
-                    'egrep "[a-z]+" ; echo -n ""' %
-                    web10g_file,
-                    capture=True)
-                if errors != '':
-                    warn('Errors in %s:\n%s' % (web10g_file, errors))
-
-            # unique flows
-            # the sed command here suppresses the last line, cause that can be
-            # incomplete
-            flows = lookup_flow_cache(web10g_file)
-            if flows == None:
-                flows = _list(
-                    local(
-                        'zcat %s | egrep -v "[a-z]+" | sed -n \'$!p\' | '
-                        'cut -d\',\' -f 3,4,5,6 | LC_ALL=C sort -u' %
-                        (web10g_file),
-                        capture=True))
-
-                append_flow_cache(web10g_file, flows)
-
-            for flow in flows:
-
+            # output file names of flow, None if flow is not analysed
+            def get_flow_outs(flow):
                 src, src_port, dst, dst_port = flow.split(',')
 
                 # get external aNd internal addresses
@@ -1021,6 +1414,57 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
                 dst, dst_internal = get_address_pair_analysis(test_id, dst, do_abort='0')
 
                 if src == '' or dst == '':
+                    return None
+
+                return [ out_dirname + test_id + '_' + flow.replace(',', '_') +
+                         '_web10g.' + out_file_ext
+                         for attributes, out_file_ext, post_proc in stats ]
+
+            # output file names of flow if data needs to be extracted
+            def get_extract_outs(flow):
+                outs = get_flow_outs(flow)
+                if outs == None:
+                    return None
+
+                outs = [ out if replot_only == '0' or not os.path.isfile(out)
+                         else None for out in outs ]
+
+                # statistics can share output files, extract them only once
+                return [ out if out not in outs[:i] else None
+                         for i, out in enumerate(outs) ]
+
+            # unique flows, read file only if we don't know the flows or need
+            # to extract data (errors are only checked if we don't replot)
+            flows = lookup_flow_cache(web10g_file)
+            if flows == None or replot_only == '0' or \
+               any([ out != None for f in flows
+                     for out in (get_extract_outs(f) or []) ]):
+                (found_flows,
+                 extracted) = split_web10g_file(web10g_file,
+                                                [ attributes for attributes,
+                                                  out_file_ext, post_proc in stats ],
+                                                get_extract_outs, flows,
+                                                check_errors=(replot_only == '0'))
+                if flows == None:
+                    flows = found_flows
+                    append_flow_cache(web10g_file, flows)
+
+                for i, outs in enumerate(extracted):
+                    post_proc = stats[i][2]
+                    if post_proc is not None:
+                        for out in outs:
+                            post_proc(web10g_file, out)
+
+            if ts_correct == '1':
+                host = local(
+                    'echo %s | sed "s/.*_\([a-z0-9\.]*\)_web10g.log.gz/\\1/"' %
+                    web10g_file,
+                    capture=True)
+
+            for flow in flows:
+
+                outs = get_flow_outs(flow)
+                if outs == None:
                     continue
 
                 flow_name = flow.replace(',', '_')
@@ -1029,39 +1473,18 @@ def extract_web10g(test_id='', out_dir='', replot_only='0', source_filter='',
                     long_flow_name = test_id + '_' + flow_name
                 else:
                     long_flow_name = flow_name
-                out = out_dirname + test_id + '_' + flow_name + '_web10g.' + out_file_ext
-                if replot_only == '0' or not os.path.isfile(out) :
-                    # the first grep removes lines with netlink errors printed out
-                    # or last incomplete lines (sed '$d')
-                    # (not sure how to suppress them in web10g)
-                    # the awk command here is a little trick to not print out lines when
-                    # no data is flying around; basically it does suppress lines if
-                    # there is no change with respect to the fields specified.
-                    # this makes the output comparable to siftr where we only
-                    # have output if data is flying around.
-                    local('zcat %s | egrep -v "[a-z]+" | sed \'$d\' | '
-                          'cut -d\',\' -f 1,3,4,5,6,7,8,13,14,%s | grep "%s" | '
-                          'awk -F \',\' \'!a[$2$3$4$5$6$7$8$9]++\' | cut -d\',\' -f 1,10- > %s' %
-                          (web10g_file, attributes, flow, out))
-
-                    if post_proc is not None:
-                        post_proc(web10g_file, out)
 
                 if sfil.is_in(flow_name):
-		    if ts_correct == '1':
-                        host = local(
-                            'echo %s | sed "s/.*_\([a-z0-9\.]*\)_web10g.log.gz/\\1/"' %
-                            web10g_file,
-                            capture=True)
-
-                        out = adjust_timestamps(test_id, out, host, ',', out_dir) 
+                    for i, out in enumerate(outs):
+                        if ts_correct == '1':
+                            out = adjust_timestamps(test_id, out, host, ',', out_dir) 
 
-                    out_files[long_flow_name] = out
-                    out_groups[out] = group
+                        out_files[i][long_flow_name] = out
+                        out_groups[i][out] = group
 
         group += 1
 
-    return (out_files, out_groups)
+    return zip(out_files, out_groups)
 
 
 ## SIFTR prints out very high cwnd (max cwnd?) values for some tcp algorithms
@@ -1097,58 +1520,43 @@ def _extract_cwnd(test_id='', out_dir='', replot_only='0', source_filter='',
                  ts_correct='1', io_filter='o'):
     "Extract CWND over time"
 
-    test_id_arr = test_id.split(';')
-    if len(test_id_arr) == 0 or test_id_arr[0] == '':
-        abort('Must specify test_id parameter')
+    (test_id_arr,
+     results) = _extract_tcp_logger_stats(test_id, out_dir, replot_only,
+                                          source_filter,
+                                          [ get_cwnd_stat(io_filter) ],
+                                          ts_correct)
+
+    return (test_id_arr, ) + results[0]
 
-    (files1,
-     groups1) = extract_siftr(test_id,
-                              out_dir,
-                              replot_only,
-                              source_filter,
-                              '9',
-                              'cwnd',
-                              post_proc_siftr_cwnd,
-                              ts_correct=ts_correct,
-                              io_filter=io_filter)
-    (files2,
-     groups2) = extract_web10g(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               '26',
-                               'cwnd',
-                               ts_correct=ts_correct)
-
-    (files3,
-     groups3) = extract_ttprobe(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               '10',
-                               'cwnd',
-                               ts_correct=ts_correct,
-                               io_filter=io_filter)
-
-    # to deal with two Linux loggers for same experiments i.e. 'TPCONF_linux_tcp_logger = 'both'
-    inters = list(set(files2).intersection(files3))
-    if inters is not None:
-        try:
-            logger = os.environ['LINUX_TCP_LOGGER']
-        except:
-            logger = ''
-        for i in inters:
-            if logger == 'ttprobe':
-                del files2[i]
-            elif logger == 'web10g':
-                del files3[i]
-            else:
-                files2['w' + i] = files2.pop(i)
 
-    all_files = dict(files1.items() + files2.items() + files3.items())
-    all_groups = dict(groups1.items() + groups2.items() + groups3.items())
+## Get statistic description for cwnd (SEE _extract_tcp_logger_stats)
+#  @param io_filter 'i', 'o' or 'io' (only effective for SIFTR and ttprobe files)
+#  @return Statistic description
+def get_cwnd_stat(io_filter='o'):
 
-    return (test_id_arr, all_files, all_groups)
+    return {
+        'siftr': ('9', 'cwnd', post_proc_siftr_cwnd),
+        'web10g': ('26', 'cwnd', None),
+        'ttprobe': ('10', 'cwnd', None),
+        'io_filter': io_filter,
+    }
+
+
+## Extract cwnd and RTT estimated by TCP over time, reading each TCP logger
+## file only once
+## SEE _extract_cwnd and _extract_tcp_rtt
+def _extract_cwnd_tcp_rtt(test_id='', out_dir='', replot_only='0',
+                          source_filter='', ts_correct='1', io_filter='o',
+                          web10g_version='2.0.9'):
+
+    _extract_tcp_logger_stats(test_id, out_dir, replot_only, source_filter,
+                              [ get_cwnd_stat(io_filter),
+                                get_tcp_rtt_stat(test_id, io_filter,
+                                                 web10g_version) ],
+                              ts_correct)
+
+    # done
+    puts('\n[MAIN] COMPLETED extracting CWND and TCP RTTs %s \n' % test_id)
 
 
 ## Extract cwnd over time
@@ -1265,22 +1673,23 @@ def _extract_tcp_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
                      ts_correct='1', io_filter='o', web10g_version='2.0.9'):
     "Extract RTT as seen by TCP (smoothed RTT)"
 
-    test_id_arr = test_id.split(';')
-    if len(test_id_arr) == 0 or test_id_arr[0] == '':
-        abort('Must specify test_id parameter')
+    (test_id_arr,
+     results) = _extract_tcp_logger_stats(test_id, out_dir, replot_only,
+                                          source_filter,
+                                          [ get_tcp_rtt_stat(test_id, io_filter,
+                                                             web10g_version) ],
+                                          ts_correct)
+
+    return (test_id_arr, ) + results[0]
 
-    # output smoothed rtt and improved sample rtt (patched siftr required),
-    # post process to get rtt in milliseconds
-    (files1,
-     groups1) = extract_siftr(test_id,
-                              out_dir,
-                              replot_only,
-                              source_filter,
-                              '17,27',
-                              'tcp_rtt',
-                              post_proc_siftr_rtt,
-                              ts_correct=ts_correct,
-                              io_filter=io_filter)
+
+## Get statistic description for RTT estimated by TCP
+## (SEE _extract_tcp_logger_stats)
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param io_filter 'i', 'o' or 'io' (only effective for SIFTR and ttprobe files)
+#  @param web10g_version web10g version string (default is 2.0.9) 
+#  @return Statistic description
+def get_tcp_rtt_stat(test_id='', io_filter='o', web10g_version='2.0.9'):
 
     # output smoothed RTT and sample RTT in milliseconds
     
@@ -1294,44 +1703,14 @@ def _extract_tcp_rtt(test_id='', out_dir='', replot_only='0', source_filter='',
     else:
         data_columns = '23,45'
 
-    (files2,
-     groups2) = extract_web10g(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               data_columns,
-                               'tcp_rtt',
-                               ts_correct=ts_correct)
-
-    (files3,
-     groups3) = extract_ttprobe(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               '9',
-                               'tcp_rtt',
-                               ts_correct=ts_correct,
-                               io_filter=io_filter)
-
-    # to deal with two Linux loggers for same experiments i.e. 'TPCONF_linux_tcp_logger = 'both'
-    inters = list(set(files2).intersection(files3))
-    if inters is not None:
-        try:
-            logger = os.environ['LINUX_TCP_LOGGER']
-        except:
-            logger = ''
-        for i in inters:
-            if logger == 'ttprobe':
-                del files2[i]
-            elif logger == 'web10g':
-                del files3[i]
-            else:
-                files2['w' + i] = files2.pop(i)
-
-    all_files = dict(files1.items() + files2.items() + files3.items())
-    all_groups = dict(groups1.items() + groups2.items() + groups3.items())
-
-    return (test_id_arr, all_files, all_groups)
+    # output smoothed rtt and improved sample rtt (patched siftr required),
+    # post process to get rtt in milliseconds
+    return {
+        'siftr': ('17,27', 'tcp_rtt', post_proc_siftr_rtt),
+        'web10g': (data_columns, 'tcp_rtt', None),
+        'ttprobe': ('9', 'tcp_rtt', None),
+        'io_filter': io_filter,
+    }
 
 
 ## Extract RTT over time estimated by TCP 
@@ -1450,49 +1829,124 @@ def _extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
                       ts_correct='1', io_filter='o'):
     "Extract TCP Statistic"
 
+    (test_id_arr,
+     files,
+     groups) = _extract_tcp_stats(test_id, out_dir, replot_only, source_filter,
+                                  siftr_index, web10g_index, ttprobe_index,
+                                  ts_correct, io_filter)
+
+    return (test_id_arr, files[0], groups[0])
+
+
+## Extract several TCP statistics (based on siftr/web10g/ttprobe output),
+## reading each logger file only once
+## The index parameters are semicolon-separated lists of indexes. All lists
+## must have the same number of entries, entry n of each list is statistic n.
+## SEE _extract_tcp_stat
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again that is already extracted
+#  @param source_filter Filter on specific sources
+#  @param siftr_index Semicolon-separated list of column numbers in siftr log files
+#  @param web10g_index Semicolon-separated list of column numbers in web10g log files
+#  @param ttprobe_index Semicolon-separated list of column numbers in ttprobe log files
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @param io_filter  'i', 'o' or 'io' for all statistics or semicolon-separated
+#                    list with one filter for each statistic
+#                    (only effective for SIFTR and ttprobe files)
+#  @return Test ID list, list of maps of flow names to interim data file names and 
+#          list of maps of file names and group IDs (one map for each statistic)
+def _extract_tcp_stats(test_id='', out_dir='', replot_only='0', source_filter='',
+                       siftr_index='9', web10g_index='26', ttprobe_index='10',
+                       ts_correct='1', io_filter='o'):
+
+    siftr_indexes = siftr_index.split(';')
+    web10g_indexes = web10g_index.split(';')
+    ttprobe_indexes = ttprobe_index.split(';')
+    io_filters = io_filter.split(';')
+    if len(io_filters) == 1:
+        io_filters = io_filters * len(siftr_indexes)
+
+    if len(web10g_indexes) != len(siftr_indexes) or \
+       len(ttprobe_indexes) != len(siftr_indexes) or \
+       len(io_filters) != len(siftr_indexes):
+        abort('siftr_index, web10g_index, ttprobe_index and io_filter must have '
+              'the same number of entries')
+
+    stats = [ get_tcp_stat(siftr_indexes[i], web10g_indexes[i], ttprobe_indexes[i],
+                           io_filters[i]) for i in range(len(siftr_indexes)) ]
+
+    (test_id_arr,
+     results) = _extract_tcp_logger_stats(test_id, out_dir, replot_only,
+                                          source_filter, stats, ts_correct)
+
+    return (test_id_arr, [ r[0] for r in results ], [ r[1] for r in results ])
+
+
+## Get statistic description for some TCP statistic
+## (SEE _extract_tcp_logger_stats)
+#  @param siftr_index Integer number of the column in siftr log files
+#  @param web10g_index Integer number of the column in web10g log files
+#  @param ttprobe_index Integer number of the column in ttprobe log files
+#  @param io_filter 'i', 'o' or 'io' (only effective for SIFTR and ttprobe files)
+#  @return Statistic description
+def get_tcp_stat(siftr_index='9', web10g_index='26', ttprobe_index='10',
+                 io_filter='o'):
+
+    return {
+        'siftr': (siftr_index, 'tcpstat_' + siftr_index, None),
+        'web10g': (web10g_index, 'tcpstat_' + web10g_index, None),
+        'ttprobe': (ttprobe_index, 'tcpstat_' + ttprobe_index, None),
+        'io_filter': io_filter,
+    }
+
+
+## Extract statistics from all TCP logger files (siftr, web10g, ttprobe),
+## reading each logger file only once for all statistics
+#  @param test_id Test ID prefix of experiment to analyse
+#  @param out_dir Output directory for results
+#  @param replot_only Don't extract data again that is already extracted
+#  @param source_filter Filter on specific sources
+#  @param stats List of statistic descriptions, each is a dictionary with keys
+#               'siftr', 'web10g' and 'ttprobe' (each a tuple (attributes,
+#               out_file_ext, post_proc), SEE extract_siftr) and 'io_filter'
+#  @param ts_correct '0' use timestamps as they are (default)
+#                    '1' correct timestamps based on clock offsets estimated
+#                        from broadcast pings
+#  @return Test ID list and list of tuples (map of flow names to interim data
+#          file names, map of file names and group IDs), one for each statistic
+def _extract_tcp_logger_stats(test_id='', out_dir='', replot_only='0',
+                              source_filter='', stats=[], ts_correct='1'):
+
     test_id_arr = test_id.split(';')
     if len(test_id_arr) == 0 or test_id_arr[0] == '':
         abort('Must specify test_id parameter')
 
-    # output smoothed rtt and improved sample rtt (patched siftr required),
-    # post process to get rtt in milliseconds
-    (files1,
-     groups1) = extract_siftr(test_id,
-                              out_dir,
-                              replot_only,
-                              source_filter,
-                              siftr_index,
-                              'tcpstat_' + siftr_index,
-                              ts_correct=ts_correct,
-                              io_filter=io_filter)
+    results1 = extract_siftr_stats(test_id, out_dir, replot_only, source_filter,
+                                   [ stat['siftr'] + (stat['io_filter'], )
+                                     for stat in stats ],
+                                   ts_correct=ts_correct)
+    results2 = extract_web10g_stats(test_id, out_dir, replot_only, source_filter,
+                                    [ stat['web10g'] for stat in stats ],
+                                    ts_correct=ts_correct)
+    results3 = extract_ttprobe_stats(test_id, out_dir, replot_only, source_filter,
+                                     [ stat['ttprobe'] + (stat['io_filter'], )
+                                       for stat in stats ],
+                                     ts_correct=ts_correct)
 
-    # output smoothed RTT and sample RTT in milliseconds
-    (files2,
-     groups2) = extract_web10g(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               web10g_index,
-                               'tcpstat_' + web10g_index,
-                               ts_correct=ts_correct)
-
-    (files3,
-     groups3) = extract_ttprobe(test_id,
-                               out_dir,
-                               replot_only,
-                               source_filter,
-                               ttprobe_index,
-                               'tcpstat_' + ttprobe_index,
-                               ts_correct=ts_correct,
-                               io_filter=io_filter)
-
-    # to deal with two Linux loggers for same experiments i.e. 'TPCONF_linux_tcp_logger = 'both'
-    inters = list(set(files2).intersection(files3))
-    if inters is not None:
-        try:
-            logger = os.environ['LINUX_TCP_LOGGER']
-        except:
-            logger = ''
+    try:
+        logger = os.environ['LINUX_TCP_LOGGER']
+    except:
+        logger = ''
+
+    results = []
+    for (files1, groups1), (files2, groups2), (files3, groups3) in \
+            zip(results1, results2, results3):
+
+        # to deal with two Linux loggers for same experiments i.e. 'TPCONF_linux_tcp_logger = 'both'
+        inters = list(set(files2).intersection(files3))
         for i in inters:
             if logger == 'ttprobe':
                 del files2[i]
@@ -1501,23 +1955,28 @@ def _extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
             else:
                 files2['w' + i] = files2.pop(i)
 
-    all_files = dict(files1.items() + files2.items() + files3.items())
-    all_groups = dict(groups1.items() + groups2.items() + groups3.items())
+        all_files = dict(files1.items() + files2.items() + files3.items())
+        all_groups = dict(groups1.items() + groups2.items() + groups3.items())
+        results.append((all_files, all_groups))
 
-    return (test_id_arr, all_files, all_groups)
+    return (test_id_arr, results)
 
 
 ## Extract some TCP statistic (based on siftr/web10g/ttprobe output)
-## SEE _extract_tcp_stat
+## Several statistics can be extracted at once by specifying semicolon-separated
+## lists of indexes, e.g. siftr_index="9;17;8",web10g_index="26;23;27",
+## ttprobe_index="10;9;11" extracts cwnd, smoothed RTT and ssthresh reading
+## each logger file only once
+## SEE _extract_tcp_stats
 @task
 def extract_tcp_stat(test_id='', out_dir='', replot_only='0', source_filter='',
                      siftr_index='9', web10g_index='26', ttprobe_index='10',
                      ts_correct='1', io_filter='o'):
     "Extract TCP Statistic"
 
-    _extract_tcp_stat(test_id, out_dir, replot_only, source_filter,
-                      siftr_index, web10g_index, ttprobe_index,
-                      ts_correct, io_filter)
+    _extract_tcp_stats(test_id, out_dir, replot_only, source_filter,
+                       siftr_index, web10g_index, ttprobe_index,
+                       ts_correct, io_filter)
 
     # done
     puts('\n[MAIN] COMPLETED extracting TCP Statistic %s \n' % test_id)
@@ -1640,22 +2099,7 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
             dir_name = os.path.dirname(tcpdump_file)
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-             
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_store_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -1688,11 +2132,7 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
                 dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext 
                 dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext 
 
-                # tcpdump filters and output file names
-                filter1 = 'src host ' + src_internal + ' && src port ' + src_port + \
-                    ' && dst host ' + dst_internal + ' && dst port ' + dst_port
-                filter2 = 'src host ' + dst_internal + ' && src port ' + dst_port + \
-                    ' && dst host ' + src_internal + ' && dst port ' + src_port
+                # output file names
                 out_size1 = out_dirname + test_id + '_' + name + ofile_ext 
                 out_size2 = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
@@ -1700,25 +2140,19 @@ def _extract_pktsizes(test_id='', out_dir='', replot_only='0', source_filter='',
                     if replot_only == '0' or not ( os.path.isfile(out_size1) and \
                                                os.path.isfile(out_size2) ):
                         # make sure for each flow we get the packet sizes captured
-                        # at the _receiver_, hence we use filter1 with dump2 ...
+                        # at the _receiver_, hence we use flow 1 with dump2 ...
                         if link_len == '0':
-                            local(
-                                'zcat %s | tcpdump -v -tt -nr - "%s" | '
-                                'awk \'{ print $1 " " $NF }\' | grep ")$" | sed -e "s/)//" > %s' %
-                                (dump2, filter1, out_size1))
-                            local(
-                                'zcat %s | tcpdump -v -tt -nr - "%s" | '
-                                'awk \'{ print $1 " " $NF }\' | grep ")$" | sed -e "s/)//" > %s' %
-                                (dump1, filter2, out_size2))
+                            size_col = 'ip_len'
                         else:
-                            local(
-                                'zcat %s | tcpdump -e -tt -nr - "%s" | grep "ethertype IP" | '
-                                'awk \'{ print $1 " " $9 }\' | sed -e "s/://" > %s' %
-                                (dump2, filter1, out_size1))
-                            local(
-                                'zcat %s | tcpdump -e -tt -nr - "%s" | grep "ethertype IP" | '
-                                'awk \'{ print $1 " " $9 }\' | sed -e "s/://" > %s' %
-                                (dump1, filter2, out_size2))
+                            size_col = 'link_len'
+                        pkts = get_flow_pkts(dump2, src_internal, src_port,
+                                             dst_internal, dst_port)
+                        write_columns(out_size1, (pkts['ts'], pkts[size_col]),
+                                      '%.6f %i')
+                        pkts = get_flow_pkts(dump1, dst_internal, dst_port,
+                                             src_internal, src_port)
+                        write_columns(out_size2, (pkts['ts'], pkts[size_col]),
+                                      '%.6f %i')
    
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
@@ -1876,10 +2310,19 @@ def get_experiment_list(exp_list='', test_id=''):
 #                   'io' use statistics from incooming and outgoing packets
 #                   (only effective for SIFTR files)
 #  @param web10g_version web10g version string (default is 2.0.9)
+#  @param jobs Number of parallel worker processes, '1' extract everything
+#              serially (default), '0' use one worker per CPU. Experiments are
+#              extracted in parallel, the metrics of each experiment one after
+#              the other.
+#  @param incremental '0' extract all experiments (default),
+#                     '1' only extract experiments that are new or whose log
+#                         files changed since they were extracted with the same
+#                         parameters
 @task
 def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
                 replot_only='0', source_filter='', resume_id='', 
-                link_len='0', ts_correct='1', io_filter='o', web10g_version='2.0.9'):
+                link_len='0', ts_correct='1', io_filter='o', web10g_version='2.0.9',
+                jobs='1', incremental='0'):
     "Extract SPP RTT, TCP RTT, CWND and throughput statistics"
 
     experiments = get_experiment_list(exp_list, test_id)
@@ -1889,20 +2332,30 @@ def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
         puts('Resuming analysis with test_id %s' % resume_id)
         do_analyse = False
 
+    job_groups = []
     for test_id in experiments:
 
         if test_id == resume_id:
             do_analyse = True
 
         if do_analyse:
-            execute(extract_rtt, test_id, out_dir, replot_only, source_filter,
-                    ts_correct=ts_correct)
-            execute(extract_cwnd, test_id, out_dir, replot_only, source_filter, 
-                    ts_correct=ts_correct, io_filter=io_filter)
-            execute(extract_tcp_rtt, test_id, out_dir, replot_only, source_filter, 
-                    ts_correct=ts_correct, io_filter=io_filter, web10g_version=web10g_version)
-            execute(extract_pktsizes, test_id, out_dir, replot_only, source_filter,
-                    link_len=link_len, ts_correct=ts_correct)
+            # jobs of an experiment share intermediate files, so they are
+            # run one after the other
+            job_groups.append([
+                (extract_rtt, (test_id, out_dir, replot_only, source_filter),
+                 dict(ts_correct=ts_correct)),
+                (_extract_cwnd_tcp_rtt,
+                 (test_id, out_dir, replot_only, source_filter),
+                 dict(ts_correct=ts_correct, io_filter=io_filter,
+                      web10g_version=web10g_version)),
+                (extract_pktsizes, (test_id, out_dir, replot_only, source_filter),
+                 dict(link_len=link_len, ts_correct=ts_correct)),
+            ])
+
+    if incremental == '1':
+        job_groups = filter_analysed_job_groups(job_groups, out_dir)
+
+    run_job_groups(job_groups, jobs)
 
 
 ## Do all analysis
@@ -1939,12 +2392,21 @@ def extract_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
 #  @param web10g_version web10g version string (default is 2.0.9)
 #  @param plot_params Parameters passed to plot function via environment variables
 #  @param plot_script Specify the script used for plotting, must specify full path
+#  @param jobs Number of parallel worker processes, '1' analyse everything
+#              serially (default), '0' use one worker per CPU. Experiments are
+#              analysed in parallel, the metrics of each experiment one after
+#              the other.
+#  @param incremental '0' analyse all experiments (default),
+#                     '1' only analyse experiments that are new or whose log
+#                         files changed since they were analysed with the same
+#                         parameters
 @task
 def analyse_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
                 replot_only='0', source_filter='', min_values='3', omit_const='0',
                 smoothed='1', resume_id='', lnames='', link_len='0', stime='0.0',
                 etime='0.0', out_name='', pdf_dir='', ts_correct='1',
-                io_filter='o', web10g_version='2.0.9', plot_params='', plot_script=''):
+                io_filter='o', web10g_version='2.0.9', plot_params='', plot_script='',
+                jobs='1', incremental='0'):
     "Compute SPP RTT, TCP RTT, CWND and throughput statistics"
 
     experiments = get_experiment_list(exp_list, test_id)
@@ -1954,29 +2416,45 @@ def analyse_all(exp_list='experiments_completed.txt', test_id='', out_dir='',
         puts('Resuming analysis with test_id %s' % resume_id)
         do_analyse = False
 
+    job_groups = []
     for test_id in experiments:
 
         if test_id == resume_id:
             do_analyse = True
 
         if do_analyse:
-            execute(analyse_rtt, test_id, out_dir, replot_only, source_filter,
-                    min_values, omit_const=omit_const, lnames=lnames, stime=stime,
-                    etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_cwnd, test_id, out_dir, replot_only, source_filter, min_values,
-                    omit_const=omit_const, lnames=lnames, stime=stime, etime=etime,
-                    out_name=out_name, pdf_dir=pdf_dir, ts_correct=ts_correct,
-                    io_filter=io_filter, plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_tcp_rtt, test_id, out_dir, replot_only, source_filter, min_values,
-                    omit_const=omit_const, smoothed=smoothed, lnames=lnames,
-                    stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, io_filter=io_filter, web10g_version=web10g_version,
-                    plot_params=plot_params, plot_script=plot_script)
-            execute(analyse_throughput, test_id, out_dir, replot_only, source_filter,
-                    min_values, omit_const=omit_const, lnames=lnames, link_len=link_len,
-                    stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
-                    ts_correct=ts_correct, plot_params=plot_params, plot_script=plot_script)
+            args = (test_id, out_dir, replot_only, source_filter, min_values)
+            # jobs of an experiment share intermediate files, so they are
+            # run one after the other
+            job_groups.append([
+                (analyse_rtt, args,
+                 dict(omit_const=omit_const, lnames=lnames, stime=stime,
+                      etime=etime, out_name=out_name, pdf_dir=pdf_dir,
+                      ts_correct=ts_correct, plot_params=plot_params,
+                      plot_script=plot_script)),
+                (analyse_cwnd, args,
+                 dict(omit_const=omit_const, lnames=lnames, stime=stime,
+                      etime=etime, out_name=out_name, pdf_dir=pdf_dir,
+                      ts_correct=ts_correct, io_filter=io_filter,
+                      plot_params=plot_params, plot_script=plot_script)),
+                (analyse_tcp_rtt, args,
+                 dict(omit_const=omit_const, smoothed=smoothed, lnames=lnames,
+                      stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
+                      ts_correct=ts_correct, io_filter=io_filter,
+                      web10g_version=web10g_version, plot_params=plot_params,
+                      plot_script=plot_script)),
+                (analyse_throughput, args,
+                 dict(omit_const=omit_const, lnames=lnames, link_len=link_len,
+                      stime=stime, etime=etime, out_name=out_name, pdf_dir=pdf_dir,
+                      ts_correct=ts_correct, plot_params=plot_params,
+                      plot_script=plot_script)),
+            ])
+
+    if incremental == '1':
+        job_groups = filter_analysed_job_groups(job_groups, out_dir,
+                                                    pdf_dir)
+
+    run_job_groups(job_groups, jobs)
 
 
 ## Extract incast response times from httperf files 
@@ -2315,11 +2793,11 @@ def analyse_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 #  @param acks_file Full path to a specific .acks file which is to be parsed
 #                   for dupACKs and (optionally) extract sequence of ACK bursts
 #  @param burst_sep =0, Just calculate running total of dupACKs and create acks_file+".0" output file
-#                  < 0, extract bursts into acks_file+".N" outputfiles (for burst N),
+#                  < 0, extract bursts into acks_file+".bursts" output file,
 #                     where burst starts @ t=0 and then burst_sep seconds after start of previous burst
-#                  > 0, extract bursts into acks_file+".N" outputfiles (for burst N)
+#                  > 0, extract bursts into acks_file+".bursts" output file
 #                     where burst starts @ t=0 and then burst_sep seconds after end of previous burst
-#  @return Vector of file names (one for each file generated)
+#  @return Vector of bursts, each a tuple (file name, first row, end row)
 #
 # First task is to calculate the number of duplicate ACKs. Define
 # them as ACKs whose sequence number is unchanged from the immediately
@@ -2332,8 +2810,8 @@ def analyse_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 #
 #If burst_sep != 0 then we try to further subdivide into "bursts"
 #
-# Output is multiple .acks.N files, containing only the lines for
-# burst N:
+# Output is one .acks.bursts file, containing the lines of all bursts
+# (the rows of each burst are returned):
 #
 #   <time>  <ack_seq_no>  <cumulative_dupACK_count>
 #
@@ -2349,121 +2827,59 @@ def analyse_incast(test_id='', out_dir='', replot_only='0', source_filter='',
 #
 def extract_dupACKs_bursts(acks_file='', burst_sep=0):
 
-    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
-    new_fnames = []
-
-    # Internal variables
-    burstN = 1
-    firstTS = -1
-
     try:
-        _acks = []
-        # First read the entire contents of a .acks file
-        with open(acks_file) as f:
-            _acks = f.readlines()
-            #print _acks
-
-            if burst_sep != 0 :
-                # Create the first .acks.N output file
-                out_f = open(acks_file+"."+"1","w")
-                new_fnames.append(acks_file+"."+"1")
-            else:
-                out_f = open(acks_file+"."+"0","w")
-                new_fnames.append(acks_file+"."+"0")
-
-            # Now walk through every line of the .acks file
-            for oneline in _acks:
-                # ackdetails[0] is the timestamp, ackdetails[1] is the seq number
-                ackdetails = oneline.split()
-
-                if firstTS == -1 :
-                    # This is first time through the loop, so set some baseline
-                    # values for later offsets
-                    firstTS = ackdetails[0]
-                    prev_ACKTS = firstTS
-                    firstBytes = 0
-
-                # Is this ACK a dupACK ?
-                if int(ackdetails[1]) == 0 :
-                    # Only the first ACK line has zero seq number. Special case, reset dupACKs count
-                    dupACKs = 0
-                    prev_seqno = ackdetails[1]
-                else:
-                    # Define dupACK as an ACK with unchanged seq number wrt preceding ACK
-                    if (int(ackdetails[1]) - int(prev_seqno)) == 0 :
-                        dupACKs += 1
-
-                # If burst_sep == 0 the only thing we're calculating is a
-                # cumulative running total of dupACKs, so we only do burst
-                # identification if burst_sep != 0
-
-                if burst_sep != 0 :
-
-                    if burst_sep < 0 :
-                        # ack_gap is time since first ACK of this burst
-                        # (i.e. relative to firstTS)
-                        ack_gap = float(ackdetails[0]) - float(firstTS)
-                    else:
-                        # ack_gap is time since previous ACK in this burst
-                        # (i.e. relative to prev_ACKTS)
-                        ack_gap = float(ackdetails[0]) - float(prev_ACKTS)
-
-                    # New burst begins when time between this ACK and previous
-                    # exceeds abs(burst_sep)
-                    if (ack_gap >= abs(burst_sep)) :
-                        # We've found the first ACK of the _next_ burst
-
-                        # Close previous burst output file
-                        out_f.close()
-
-                        # Move on to the next burst
-                        burstN += 1
-
-                        print ("Burst: %3i, ends at %f sec, data: %i bytes, gap: %3.6f sec, dupACKs: %i" %
-                        ( (burstN-1),  float(prev_ACKTS), int(prev_seqno) - int(firstBytes), ack_gap, dupACKs ) )
-
-                        # Reset firstTS to the beginning (first timestamp) of this new burst
-                        firstTS = ackdetails[0]
-
-                        # The sequence number of first ACK of bursts 2...N must be considered
-                        # relative to LAST seq number of PREVIOUS burst in order to calculate
-                        # how many bytes were fully sent in bursts 2...N.
-                        firstBytes = prev_seqno
-
-                        # Reset the dupACKs counter
-                        dupACKs = 0
-
-                        # Create the next .acks.N output file
-                        out_f = open(acks_file+"."+str(burstN),"w")
-                        new_fnames.append(acks_file+"."+str(burstN))
-
-
-                # How many bytes were ACK'ed since beginning? (Of entire file or of burst N)
-                # This must be calculated _after_ firstBytes is potentially reset on
-                # the boundary between bursts.
-                bytes_gap = int(ackdetails[1]) - int(firstBytes)
-
-                #print "Burst: ", burstN, "  Time ", ackdetails[0] ," Bytes ", bytes_gap, "   DupACKS ", dupACKs
+        data = load_data_file(acks_file)
+    except IOError:
+        print('extract_dupACKs_bursts(): File access problem while working on %s' % acks_file)
+        return []
 
-                # Write to burst-specific output file
-                # <time>  <ACK seq number>  <dupACK count>
-                out_f.write(ackdetails[0]+" "+str(bytes_gap)+" "+str(dupACKs)+"\n")
+    if data.shape[0] > 0:
+        # data[:, 0] is the timestamp, data[:, 1] is the seq number
+        times = data[:, 0]
+        acks = data[:, 1]
+    else:
+        times = acks = np.zeros(0)
 
-                # Store the seq number for next time around the loop
-                prev_seqno = ackdetails[1]
-                prev_ACKTS = ackdetails[0]
+    ranges = get_burst_ranges(times, burst_sep)
 
-            # Close the last output file
-            out_f.close()
+    # How many bytes were ACK'ed since beginning? (Of entire file or of burst N)
+    # The sequence number of first ACK of bursts 2...N is considered relative
+    # to LAST seq number of PREVIOUS burst
+    acked_bytes = get_burst_acked_bytes(acks, ranges)
+    dupacks = get_burst_dupacks(acks, ranges)
 
-    except IOError:
-        print('extract_dupACKs_bursts(): File access problem while working on %s' % acks_file)
+    for burst in range(1, len(ranges)):
+        start = ranges[burst][0]
+        if burst_sep < 0:
+            # ack_gap is time since first ACK of previous burst
+            ack_gap = times[start] - times[ranges[burst - 1][0]]
+        else:
+            # ack_gap is time since previous ACK
+            ack_gap = times[start] - times[start - 1]
+        # dupACKs counted up to and including the first ACK of the next burst
+        if acks[start] == 0:
+            burst_dupacks = 0
+        else:
+            burst_dupacks = dupacks[start - 1] + int(acks[start] == acks[start - 1])
+        print ("Burst: %3i, ends at %f sec, data: %i bytes, gap: %3.6f sec, dupACKs: %i" %
+               ( burst, times[start - 1], acked_bytes[start - 1], ack_gap,
+                 burst_dupacks ) )
+
+    # Write all bursts to one output file
+    # <time>  <ACK seq number>  <dupACK count>
+    if burst_sep == 0:
+        out_file = acks_file + '.0'
+    else:
+        out_file = acks_file + '.bursts'
+    write_columns(out_file, (times, acked_bytes, dupacks), '%.6f %i %i')
 
-    return new_fnames
+    return [ (out_file, start, end) for start, end in ranges ]
 
 
 ## Extract cumulative bytes ACKnowledged and cumulative dupACKs
-## Intermediate files end in ".acks", ".acks.N", ".acks.tscorr" or ".acks.tscorr.N"
+## Intermediate files end in ".acks" or ".acks.tscorr", followed by ".0" or (if
+## burst_sep is set) ".bursts" for the file with the ACKed bytes and dupACKs of
+## all bursts
 ## XXX move sburst and eburst to the plotting task and here extract all?
 #  @param test_id Semicolon-separated list of test ID prefixes of experiments to analyse
 #  @param out_dir Output directory for results
@@ -2483,7 +2899,9 @@ def extract_dupACKs_bursts(acks_file='', burst_sep=0):
 #  @param eburst End plotting with burst N (bursts are numbered from 1)
 #   @param total_per_experiment '0' per-flow data (default)
 #                               '1' total data 
-#  @return Experiment ID list, map of flow names to file names, map of file names to group IDs
+#  @return Experiment ID list, map of flow names to file names (or lists of bursts,
+#          each a tuple (file name, first row, end row), if burst_sep is set),
+#          map of file names (or bursts) to group IDs
 def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                     ts_correct='1', burst_sep='0.0',
                     sburst='1', eburst='0', total_per_experiment='0'):
@@ -2521,16 +2939,7 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
             out_dirname = get_out_dir(tcpdump_file, out_dir)
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_store_flows(tcpdump_file, ('tcp', ))
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -2563,15 +2972,6 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                 dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext 
                 dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext 
 
-                # tcpdump filters and output file names
-                # 'tcp[tcpflags] == tcp-ack' rule to extract only ACK packets (eliminate SYN and FIN, even if ACK also set)
-                filter1 = 'src host ' + src_internal + ' && src port ' + src_port + \
-                    ' && dst host ' + dst_internal + ' && dst port ' + dst_port + \
-                    ' && tcp[tcpflags] == tcp-ack'
-                filter2 = 'src host ' + dst_internal + ' && src port ' + dst_port + \
-                    ' && dst host ' + src_internal + ' && dst port ' + src_port + \
-                    ' && tcp[tcpflags] == tcp-ack'
-
                 out_acks1 = out_dirname + test_id + '_' + name + ofile_ext 
                 out_acks2 = out_dirname + test_id + '_' + rev_name + ofile_ext 
 
@@ -2580,32 +2980,22 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                                                os.path.isfile(out_acks2) ):
 
                         # make sure for each flow we get the ACKs captured
-                        # at the _receiver_, hence we use filter1 with dump2 ...
-                        # Use "-S" option to tcpdump so ACK sequence numbers are always absolute
-
-                        # Grab first ACK sequence numbers for later use as a baseline
-
-                        baseACK1 = local(
-                            'zcat %s | tcpdump -c 1 -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $(i+1) }  } ; }\' | sed \'s/,//\' ' %
-                            (dump2, filter1), capture=True)
-                        baseACK2 = local(
-                            'zcat %s | tcpdump -c 1 -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $(i+1) }  } ; }\' | sed \'s/,//\' ' %
-                            (dump1, filter2), capture=True)
-
-                        #puts('\n[MAIN] BASEACKs %s %s\n' % (baseACK1, baseACK2))
-
-                        # Now extract all ACK sequence numbers, normalised to baseACK{1,2}
-
-                        local(
-                            'zcat %s | tcpdump -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $1 " " $(i+1) - %s }  } ; }\' | sed \'s/,//\'  > %s' %
-                            (dump2, filter1, baseACK1, out_acks1))
-                        local(
-                            'zcat %s | tcpdump -S -tt -nr - "%s" | '
-                            'awk \'{ FS=" " ; for(i=2;i<=NF;i++) { if ( $i  == "ack") { print $1 " " $(i+1) - %s }  } ; }\' | sed \'s/,//\'  > %s' %
-                            (dump1, filter2, baseACK2, out_acks2))
+                        # at the _receiver_, hence we use flow 1 with dump2 ...
+                        # Only use pure ACK packets (eliminate SYN and FIN, even
+                        # if ACK also set) and normalise ACK sequence numbers to
+                        # the first ACK sequence number
+                        for (dump, f_src, f_sport, f_dst, f_dport, out_acks) in (
+                                (dump2, src_internal, src_port, dst_internal, dst_port,
+                                 out_acks1),
+                                (dump1, dst_internal, dst_port, src_internal, src_port,
+                                 out_acks2)):
+                            pkts = get_flow_pkts(dump, f_src, f_sport, f_dst, f_dport,
+                                                 'tcp')
+                            pkts = pkts[pkts['flags'] == TCP_FLAG_ACK]
+                            acks = pkts['ack'].astype(np.int64)
+                            if len(acks) > 0:
+                                acks -= acks[0]
+                            write_columns(out_acks, (pkts['ts'], acks), '%.6f %i')
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
@@ -2615,13 +3005,13 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                             out_acks1 = adjust_timestamps(test_id, out_acks1, dst, ' ', out_dir)
 
                         # do the dupACK calculations and burst extraction here,
-                        # return a new vector of one or more filenames, pointing to file(s) containing
+                        # return a vector of one or more bursts, pointing to rows of a file containing
                         # <time> <seq_no> <dupACKs>
                         #
-                        out_acks1_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks1, 
+                        out_acks1_bursts = extract_dupACKs_bursts(acks_file = out_acks1, 
                                                           burst_sep = burst_sep)
-                        # Incorporate the extracted .N files
-                        # as a new, expanded set of filenames to be plotted.
+                        # Incorporate the extracted bursts
+                        # as a new, expanded set of data series to be plotted.
                         # Update the out_files dictionary (key=interim legend name based on flow, value=file)
                         # and out_groups dictionary (key=file name, value=group)
                         if burst_sep == 0.0:
@@ -2629,40 +3019,40 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                             # The plot_time_series() function expects key to have a single string
                             # value rather than a vector. Take the first (and presumably only)
                             # entry in the vector returned by extract_dupACKs_bursts()
-                            out_files[long_name] = out_acks1_dups_bursts[0]
-                            out_groups[out_acks1_dups_bursts[0]] = group
+                            out_files[long_name] = out_acks1_bursts[0][0]
+                            out_groups[out_acks1_bursts[0][0]] = group
                         else:
                             # This trial has been broken into one or more bursts.
                             # plot_incast_ACK_series() knows how to parse a key having a
-                            # 'vector of strings' value.
+                            # 'vector of bursts' value.
                             # Also filter the selection based on sburst/eburst nominated by user
                             if eburst == 0 :
-                                eburst = len(out_acks1_dups_bursts)
+                                eburst = len(out_acks1_bursts)
                             # Catch case when eburst was set non-zero but also > number of actual bursts
-                            eburst = min(eburst,len(out_acks1_dups_bursts))
+                            eburst = min(eburst,len(out_acks1_bursts))
                             if sburst <= 0 :
                                 sburst = 1
                             # Catch case where sburst set greater than eburst
                             if sburst > eburst :
                                 sburst = eburst
 
-                            out_files[long_name] = out_acks1_dups_bursts[sburst-1:eburst]
-                            for tmp_f in out_acks1_dups_bursts[sburst-1:eburst] :
-                                out_groups[tmp_f] = group
+                            out_files[long_name] = out_acks1_bursts[sburst-1:eburst]
+                            for tmp_b in out_acks1_bursts[sburst-1:eburst] :
+                                out_groups[tmp_b] = group
 
                     if sfil.is_in(rev_name):
                         if ts_correct == '1':
                             out_acks2 = adjust_timestamps(test_id, out_acks2, src, ' ', out_dir)
 
                         # do the dupACK calculations burst extraction here
-                        # return a new vector of one or more filenames, pointing to file(s) containing
+                        # return a vector of one or more bursts, pointing to rows of a file containing
                         # <time> <seq_no> <dupACKs>
                         #
-                        out_acks2_dups_bursts = extract_dupACKs_bursts(acks_file = out_acks2, 
+                        out_acks2_bursts = extract_dupACKs_bursts(acks_file = out_acks2, 
                                                           burst_sep = burst_sep)
 
-                        # Incorporate the extracted .N files
-                        # as a new, expanded set of filenames to be plotted.
+                        # Incorporate the extracted bursts
+                        # as a new, expanded set of data series to be plotted.
                         # Update the out_files dictionary (key=interim legend name based on flow, value=file)
                         # and out_groups dictionary (key=file name, value=group)
                         if burst_sep == 0.0:
@@ -2670,26 +3060,26 @@ def _extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
                             # The plot_time_series() function expects key to have a single string
                             # value rather than a vector. Take the first (and presumably only)
                             # entry in the vector returned by extract_dupACKs_bursts()
-                            out_files[long_rev_name] = out_acks2_dups_bursts[0]
-                            out_groups[out_acks2_dups_bursts[0]] = group
+                            out_files[long_rev_name] = out_acks2_bursts[0][0]
+                            out_groups[out_acks2_bursts[0][0]] = group
                         else:
                             # This trial has been broken into bursts.
                             # plot_incast_ACK_series() knows how to parse a key having a
-                            # 'vector of strings' value.
+                            # 'vector of bursts' value.
                             # Also filter the selection based on sburst/eburst nominated by user
                             if eburst == 0 :
-                                eburst = len(out_acks2_dups_bursts)
+                                eburst = len(out_acks2_bursts)
                             # Catch case when eburst was set non-zero but also > number of actual bursts
-                            eburst = min(eburst,len(out_acks2_dups_bursts))
+                            eburst = min(eburst,len(out_acks2_bursts))
                             if sburst <= 0 :
                                 sburst = 1
                             # Catch case where sburst set greater than eburst
                             if sburst > eburst :
                                 sburst = eburst
 
-                            out_files[long_rev_name] = out_acks2_dups_bursts[sburst-1:eburst]
-                            for tmp_f in out_acks2_dups_bursts[sburst-1:eburst] :
-                                out_groups[tmp_f] = group
+                            out_files[long_rev_name] = out_acks2_bursts[sburst-1:eburst]
+                            for tmp_b in out_acks2_bursts[sburst-1:eburst] :
+                                out_groups[tmp_b] = group
 
         # if desired compute aggregate acked bytes for each experiment
         # XXX only do this for burst_sep=0 now
@@ -2830,7 +3220,9 @@ def extract_ackseq(test_id='', out_dir='', replot_only='0', source_filter='',
 #   @param plot_params Parameters passed to plot function via environment variables
 #   @param plot_script Specify the script used for plotting, must specify full path
 #
-# Intermediate files end in ".acks", ".acks.N", ".acks.tscorr" or ".acks.tscorr.N"
+# Intermediate files end in ".acks" or ".acks.tscorr", followed by ".0" or (if
+# burst_sep is set) ".bursts". A ".bursts" file contains the rows of all bursts
+# of a flow, the bursts are passed to the plot function as row ranges.
 # Output pdf files end in:
 #   "_ackseqno_time_series.pdf",
 #   "_ackseqno_bursts_time_series.pdf",
@@ -3317,16 +3709,7 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
                 continue
 
             # unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_pcap_flows(tcpdump_file, ('tcp', ))
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -3418,8 +3801,7 @@ def _extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_fil
         max_cnt = 0
         for name in out_files:
             if out_groups[out_files[name]] == group:
-                cnt = int(local('wc -l %s | awk \'{ print $1 }\'' %
-                                out_files[name], capture=True)) 
+                cnt = count_rows(out_files[name])
                 if max_cnt > 0 and cnt < max_cnt:
                     abort('Responder timed out in experiment %s' % test_id)
                 if cnt > max_cnt:
@@ -3449,8 +3831,33 @@ def extract_incast_restimes(test_id='', out_dir='', replot_only='0', source_filt
     puts('\n[MAIN] COMPLETED extracting incast response times %s \n' % test_id)
 
 
-## Extract packet loss for flows using custom tool 
-## XXX tool uses packet hash based on UDP/TCP payload, so only works with traffic
+## Compute packet loss of one flow direction and write it to file
+## Packets are identified by a hash over IP ID, TCP sequence number (TCP only)
+## and payload, like tools/pktloss.py does. Packets seen at the sender, but not
+## at the receiver are lost.
+#  @param dump1 tcpdump file collected at sender
+#  @param dump2 tcpdump file collected at receiver
+#  @param src Source IP
+#  @param src_port Source port
+#  @param dst Destination IP
+#  @param dst_port Destination port
+#  @param out_file Output file name
+def _write_pktloss(dump1, dump2, src, src_port, dst, dst_port, out_file):
+
+    pkts1 = get_flow_pkts(dump1, src, src_port, dst, dst_port)
+    pkts2 = get_flow_pkts(dump2, src, src_port, dst, dst_port)
+
+    # for duplicate hashes the last packet seen counts
+    hashes, idx = np.unique(pkts1['hash'][::-1], return_index=True)
+    times = pkts1['ts'][::-1][idx]
+    lost = np.in1d(hashes, pkts2['hash'], invert=True)
+
+    order = np.argsort(times, kind='mergesort')
+    write_columns(out_file, (times[order], lost[order]), '%f %i')
+
+
+## Extract packet loss for flows
+## XXX uses packet hash based on UDP/TCP payload, so only works with traffic
 ## that has unique payload bytes
 ## The extracted files have an extension of .loss. The format is CSV with the
 ## columns:
@@ -3499,22 +3906,7 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
             dir_name = os.path.dirname(tcpdump_file)
 
             # get unique flows
-            flows = lookup_flow_cache(tcpdump_file)
-            if flows == None:
-                flows = _list(local('zcat %s | tcpdump -nr - "tcp" | '
-                                'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " tcp" } }\' | '
-                                'sed "s/://" | '
-                                'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                'LC_ALL=C sort -u' %
-                                tcpdump_file, capture=True))
-                flows += _list(local('zcat %s | tcpdump -nr - "udp" | '
-                                 'awk \'{ if ( $2 == "IP" ) { print $3 " " $5 " udp" } }\' | '
-                                 'sed "s/://" | '
-                                 'sed "s/\.\([0-9]*\) /,\\1 /g" | sed "s/ /,/g" | '
-                                 'LC_ALL=C sort -u' %
-                                 tcpdump_file, capture=True))
-
-                append_flow_cache(tcpdump_file, flows)
+            flows = get_store_flows(tcpdump_file)
 
             # since client sends first packet to server, client-to-server flows
             # will always be first
@@ -3549,10 +3941,6 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
                     dump1 = dir_name + '/' + test_id + '_' + src + ifile_ext
                     dump2 = dir_name + '/' + test_id + '_' + dst + ifile_ext
 
-                    # filters for pktloss.py
-                    filter1 = src_internal + ':' + src_port + ':' + dst_internal + ':' + dst_port
-                    filter2 = dst_internal + ':' + dst_port + ':' + src_internal + ':' + src_port 
-
                     # output file names
                     out_loss = out_dirname + test_id + '_' + name + ofile_ext
                     rev_out_loss = out_dirname + test_id + '_' + rev_name + ofile_ext
@@ -3560,12 +3948,10 @@ def _extract_pktloss(test_id='', out_dir='', replot_only='0', source_filter='',
                     if replot_only == '0' or not ( os.path.isfile(out_loss) and \
                                                    os.path.isfile(rev_out_loss) ):
                         # compute loss 
-                        local(
-                            '%s/tools/pktloss.py -t %s -T %s -f %s > %s' %
-                            (config.TPCONF_script_path, dump1, dump2, filter1, out_loss))
-                        local(
-                            '%s/tools/pktloss.py -t %s -T %s -f %s > %s' %
-                            (config.TPCONF_script_path, dump2, dump1, filter2, rev_out_loss))
+                        _write_pktloss(dump1, dump2, src_internal, src_port,
+                                       dst_internal, dst_port, out_loss)
+                        _write_pktloss(dump2, dump1, dst_internal, dst_port,
+                                       src_internal, src_port, rev_out_loss)
 
                     already_done[long_name] = 1
                     already_done[long_rev_name] = 1
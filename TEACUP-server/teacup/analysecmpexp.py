@@ -43,12 +43,14 @@ from internalutil import mkdir_p, valid_dir
 from clockoffset import DATA_CORRECTED_FILE_EXT
 from filefinder import get_testid_file_list
 from sourcefilter import SourceFilter
-from analyseutil import merge_data_files
+from analyseutil import merge_data_files, count_rows, run_jobs
 from analyse import _extract_rtt, _extract_cwnd, _extract_tcp_rtt, \
     _extract_dash_goodput, _extract_tcp_stat, _extract_incast, \
     _extract_pktsizes, _extract_incast_iqtimes, _extract_incast_restimes, \
     _extract_pktloss, _extract_ackseq
 from plot import plot_cmpexp, plot_2d_density, sort_by_flowkeys
+from incremental import filter_analysed_jobs, get_files_fingerprint, \
+    get_new_files, get_param_string, is_analysed, set_analysed
 
 
 ###############################################################################
@@ -88,8 +90,7 @@ def get_first_experiment_path(experiments):
     if len(files) > 0:
         dir_name = os.path.dirname(files[0])
     else:
-        abort('Cannot find experiment %s\n'
-              'Remove outdated teacup_dir_cache.txt if files were moved.' % experiments[0])
+        abort('Cannot find experiment %s' % experiments[0])
 
     return dir_name
 
@@ -342,6 +343,50 @@ def get_extract_function(metric='', link_len='0', stat_index='0', slowest_only='
     return (extract_functions[metric], extract_kwargs[metric])
 
 
+## Extract data of one experiment for one or more metrics
+## The metrics are extracted one after the other, since extract functions of
+## different metrics may use the same intermediate files.
+#  @param test_id Test ID
+#  @param extract_list List of tuples (extract function, keyword arguments)
+#  @param out_dir Output directory for result files
+#  @param source_filter Filter on specific sources
+#  @param replot_only '0' extract data
+#                     '1' don't extract data again
+#  @param ts_correct '0' use timestamps as they are
+#                    '1' correct timestamps based on clock offsets
+def _extract_experiment(test_id, extract_list, out_dir, source_filter,
+                        replot_only, ts_correct):
+
+    for ex_function, kwargs in extract_list:
+        ex_function(test_id=test_id, out_dir=out_dir,
+                    source_filter=source_filter, replot_only=replot_only,
+                    ts_correct=ts_correct, **kwargs)
+
+
+## Plot summary graph unless it was already plotted with the same parameters
+## from the same data files and the graph still exists
+#  @param plot_func Plot function
+#  @param plot_args Arguments of plot function
+#  @param data_files Data files the graph is based on
+#  @param key Output directory and file name prefix of graph
+#  @param incremental '0' always plot, '1' only plot if data files changed
+#                     or graph was removed
+def _plot_if_changed(plot_func, plot_args, data_files, key, incremental):
+
+    params = get_param_string(plot_args)
+    fingerprint = get_files_fingerprint(data_files)
+    if incremental == '1' and \
+       is_analysed(key, plot_func.__name__, params, fingerprint):
+        puts('Incremental analysis: graph %s is up to date' % key)
+        return
+
+    start = time.time()
+    plot_func(*plot_args)
+    set_analysed(key, plot_func.__name__, params, fingerprint,
+                 get_new_files([ os.path.dirname(key) or '.' ],
+                               os.path.basename(key), start))
+
+
 ####################################################################################
 # Analyse functions
 ####################################################################################
@@ -414,6 +459,12 @@ def get_extract_function(metric='', link_len='0', stat_index='0', slowest_only='
 #                       '2' plot ratio of median/mean (as per ptype) and nominal response
 #                           time
 #  @param query_host Name of querier (only for iqtime metric)
+#  @param jobs Number of parallel worker processes used to extract the data of
+#              the experiments, '0' use one worker per CPU (default), '1'
+#              extract serially
+#  @param incremental '0' extract all experiments and plot (default),
+#                     '1' only extract experiments that are new or whose log
+#                         files changed, only plot if the data files changed
 @task
 def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
                    source_filter='', min_values='3', omit_const='0', metric='throughput',
@@ -424,7 +475,8 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
                    dupacks='0', cum_ackseq='1', merge_data='0', sburst='1',
                    #eburst='0', test_id_prefix='[0-9]{8}\-[0-9]{6}_experiment_',
                    eburst='0', test_id_prefix='exp_[0-9]{8}\-[0-9]{6}_',
-                   slowest_only='0', res_time_mode='0', query_host=''):
+                   slowest_only='0', res_time_mode='0', query_host='', jobs='0',
+                   incremental='0'):
     "Compare metrics for different experiments"
 
     if ptype != 'box' and ptype != 'mean' and ptype != 'median':
@@ -459,18 +511,18 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
 
     # if we haven' got the extracted data run extract method(s) first
     if res_dir == '':
-        for experiment in experiments:
-
-            (ex_function, kwargs) = get_extract_function(metric, link_len,
-                                    stat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,
-                source_filter=source_filter,
-                replot_only=replot_only,
-                ts_correct=ts_correct,
-                **kwargs)
+        extract_list = [ get_extract_function(metric, link_len,
+                         stat_index, sburst=sburst, eburst=eburst,
+                         slowest_only=slowest_only, query_host=query_host) ]
+
+        # experiments are extracted in parallel
+        extract_jobs = [ (_extract_experiment,
+                          (experiment, extract_list, out_dir, source_filter,
+                           replot_only, ts_correct), {})
+                         for experiment in experiments ]
+        if incremental == '1':
+            extract_jobs = filter_analysed_jobs(extract_jobs, out_dir)
+        run_jobs(extract_jobs, jobs)
 
         if out_dir == '' or out_dir[0] != '/':
             res_dir = dir_name + '/' + out_dir
@@ -561,9 +613,7 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
             #print(res.group(1))
             if res and sfil.is_in(res.group(1)):
                 # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
+                rows = count_rows(f)
                 if rows > int(min_values):
                     out_files[res.group(1)] = f
 
@@ -669,9 +719,11 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
         oprefix = test_id_pfx + '_' + metric + '_' + ptype
     title = oprefix
 
-    plot_cmpexp(title, file_names, xlabs, ylab, yindex, yscaler, 'pdf', oprefix,
-                pdf_dir, sep, aggr, diff, omit_const, ptype, ymin, ymax, leg_names,
-                stime, etime, plot_params, plot_script)
+    plot_args = (title, file_names, xlabs, ylab, yindex, yscaler, 'pdf', oprefix,
+                 pdf_dir, sep, aggr, diff, omit_const, ptype, ymin, ymax, leg_names,
+                 stime, etime, plot_params, plot_script)
+    _plot_if_changed(plot_cmpexp, plot_args, file_names, pdf_dir + oprefix,
+                     incremental)
 
     # done
     puts('\n[MAIN] COMPLETED analyse_cmpexp %s \n' % test_id_pfx)
@@ -734,6 +786,12 @@ def analyse_cmpexp(exp_list='experiments_completed.txt', res_dir='', out_dir='',
 #  @param slowest_only '0' plot all response times (metric restime)
 #                      '1' plot only the slowest response times for each burst
 #  @param query_host Name of querier (only for iqtime metric)
+#  @param jobs Number of parallel worker processes used to extract the data of
+#              the experiments, '0' use one worker per CPU (default), '1'
+#              extract serially
+#  @param incremental '0' extract all experiments and plot (default),
+#                     '1' only extract experiments that are new or whose log
+#                         files changed, only plot if the data files changed
 # NOTE: that xmin, xmax, ymin and ymax don't just zoom, but govern the selection of data points
 #       used for the density estimation. this is how ggplot2 works by default, although possibly
 #       can be changed
@@ -747,7 +805,7 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
                    dupacks='0', cum_ackseq='1', merge_data='0',
                    #sburst='1', eburst='0', test_id_prefix='[0-9]{8}\-[0-9]{6}_experiment_',
                    sburst='1', eburst='0', test_id_prefix='exp_[0-9]{8}\-[0-9]{6}_',
-                   slowest_only='0', query_host=''):
+                   slowest_only='0', query_host='', jobs='0', incremental='0'):
     "2d density / ellipse plot for different experiments"
 
     test_id_pfx = ''
@@ -781,29 +839,24 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
 
     # if we haven' got the extracted data run extract method(s) first
     if res_dir == '':
-        for experiment in experiments:
-
-            (ex_function, kwargs) = get_extract_function(xmetric, link_len,
-                                    xstat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,
-                source_filter=source_filter,
-                replot_only=replot_only,
-                ts_correct=ts_correct,
-                **kwargs)
-
-            (ex_function, kwargs) = get_extract_function(ymetric, link_len,
-                                    ystat_index, sburst=sburst, eburst=eburst,
-                                    slowest_only=slowest_only, query_host=query_host)
-
-            (dummy, out_files, out_groups) = ex_function(
-                test_id=experiment, out_dir=out_dir,
-                source_filter=source_filter,
-                replot_only=replot_only,
-                ts_correct=ts_correct,
-                **kwargs)
+        extract_list = [ get_extract_function(xmetric, link_len,
+                         xstat_index, sburst=sburst, eburst=eburst,
+                         slowest_only=slowest_only, query_host=query_host) ]
+        y_extract = get_extract_function(ymetric, link_len,
+                    ystat_index, sburst=sburst, eburst=eburst,
+                    slowest_only=slowest_only, query_host=query_host)
+        # don't extract the same data twice
+        if y_extract not in extract_list:
+            extract_list.append(y_extract)
+
+        # experiments are extracted in parallel
+        extract_jobs = [ (_extract_experiment,
+                          (experiment, extract_list, out_dir, source_filter,
+                           replot_only, ts_correct), {})
+                         for experiment in experiments ]
+        if incremental == '1':
+            extract_jobs = filter_analysed_jobs(extract_jobs, out_dir)
+        run_jobs(extract_jobs, jobs)
 
         if out_dir == '' or out_dir[0] != '/':
             res_dir = dir_name + '/' + out_dir
@@ -932,9 +985,7 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
             #print(res.group(1))
             if res and sfil.is_in(res.group(1)):
                 # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
+                rows = count_rows(f)
                 if rows > int(min_values):
                     x_files.append(f)
 
@@ -944,9 +995,7 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
             res = re.search(match_str, f)
             if res and sfil.is_in(res.group(1)):
                 # only add file if enough data points
-                rows = int(
-                    local('wc -l %s | awk \'{ print $1 }\'' %
-                          f, capture=True))
+                rows = count_rows(f)
                 if rows > int(min_values):
                     y_files.append(f)
 
@@ -977,10 +1026,12 @@ def analyse_2d_density(exp_list='experiments_completed.txt', res_dir='', out_dir
         oprefix = test_id_pfx + '_' + xmetric + '_' + ymetric
     title = oprefix
 
-    plot_2d_density(title, x_files, y_files, x_axis_params[1], y_axis_params[1], yindexes,
-                    yscalers, 'pdf', oprefix, pdf_dir, x_axis_params[4], y_axis_params[4],
-                    aggr_flags, diff_flags, xmin, xmax, ymin, ymax, stime, etime, 
-                    groups, leg_names, plot_params, plot_script)
+    plot_args = (title, x_files, y_files, x_axis_params[1], y_axis_params[1], yindexes,
+                 yscalers, 'pdf', oprefix, pdf_dir, x_axis_params[4], y_axis_params[4],
+                 aggr_flags, diff_flags, xmin, xmax, ymin, ymax, stime, etime, 
+                 groups, leg_names, plot_params, plot_script)
+    _plot_if_changed(plot_2d_density, plot_args, x_files + y_files,
+                     pdf_dir + oprefix, incremental)
 
     # done
     puts('\n[MAIN] COMPLETED analyse_2d_density %s \n' % test_id_pfx)
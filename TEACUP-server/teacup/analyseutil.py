@@ -35,8 +35,8 @@ import errno
 import time
 import datetime
 import re
-import imp
-import tempfile
+import multiprocessing
+import numpy as np
 from fabric.api import task, warn, put, puts, get, local, run, execute, \
     settings, abort, env, runs_once, parallel, hide
 
@@ -44,6 +44,12 @@ import config
 from internalutil import mkdir_p
 from hostint import get_address_pair
 from filefinder import get_testid_file_list
+from expmeta import get_experiment_meta
+from datacache import load_data_file
+from pktstore import write_columns
+from bursts import get_burst_ranges, normalise_bursts
+from metadb import lookup_rows, update_rows, lookup_experiment_hosts, \
+    update_experiment_hosts
 
 
 ## Figure out directory for output files and create if it doesn't exist
@@ -85,16 +91,41 @@ def get_out_name(test_id_arr=[], out_name=''):
             return test_id_arr[0]
 
 
-## Check number of data rows and include file if over minimum
+## Count number of data rows (lines) of file like wc -l, the count is kept in
+## the metadata database until the file changes
 #  @param fname Data file name
+#  @return Number of rows
+def count_rows(fname=''):
+
+    rows = lookup_rows(fname)
+    if rows is None:
+        rows = 0
+        with open(fname, 'rb') as f:
+            while True:
+                buf = f.read(1024 * 1024)
+                if not buf:
+                    break
+                rows += buf.count('\n')
+        update_rows(fname, rows)
+
+    return rows
+
+
+## Check number of data rows and include file if over minimum
+#  @param fname Data file name or burst (tuple of file name, first row, end row)
 #  @param min_values Minimum number of values required
 #  @return True if file has more than minimum rows, False otherwise
 def enough_rows(fname='', min_values='3'):
 
     min_values = int(min_values)
 
-    #rows = int(local('wc -l %s | awk \'{ print $1 }\'' %
-    #               fname, capture=True))
+    if isinstance(fname, tuple):
+        return fname[2] - fname[1] > min_values
+
+    rows = lookup_rows(fname)
+    if rows is not None:
+        return rows > min_values
+
     rows = 0
     with open(fname, 'r') as f:
         while f.readline():
@@ -146,104 +177,49 @@ def filter_min_values(files={}, groups={}, min_values='3'):
 #  @param normalize 0: leave metric values as they are (default)
 #                  1: normalise metric values on first value or first value
 #                     fo each burst (if burst_sep > 0.0)        
-#  @return List of file names (one file per burst)
+#  @return List of bursts, each a tuple (file name, first row, end row). If
+#          burst_sep is 0.0 there is one burst in data_file + '.0', otherwise
+#          the bursts are in data_file (or data_file + '.bursts' if values are
+#          normalised)
 def extract_bursts(data_file='', burst_sep=0.0, normalize=0):
 
-    # New filenames (source file + ".0" or ".1,.2,....N" for bursts)
-    new_fnames = []
-
-    # Internal variables
-    burstN = 1
-    firstTS = -1
-    prev_data = -1
-
     try:
-        lines = []
-        # First read the entire contents of a data file
-        with open(data_file) as f:
-            lines = f.readlines()
-
-            if burst_sep != 0 :
-                # Create the first .N output file
-                out_f = open(data_file + "." + "1", "w")
-                new_fnames.append(data_file + "." + "1")
-            else:
-                out_f = open(data_file + "." + "0", "w")
-                new_fnames.append(data_file + "." + "0")
-
-            # Now walk through every line of the data file
-            for oneline in lines:
-                # fields[0] is the timestamp, fields[1] is the statistic 
-                fields = oneline.split()
-
-                if firstTS == -1 :
-                    # This is first time through the loop, so set some baseline
-                    # values for later offsets
-                    firstTS = fields[0]
-                    prevTS = firstTS
-                    if normalize == 1:
-                        first_data = fields[1]
-                    else:
-                        first_data = '0.0'
-
-                # If burst_sep == 0 the only thing we're calculating is a
-                # cumulative running total, so we only do burst
-                # identification if burst_sep != 0
-
-                if burst_sep != 0 :
-
-                    if burst_sep < 0 :
-                        # gap is time since first statistic of this burst
-                        # (i.e. relative to firstTS)
-                        gap = float(fields[0]) - float(firstTS)
-                    else:
-                        gap = float(fields[0]) - float(prevTS)
-
-                    # New burst begins when time between this statistic and previous
-                    # exceeds abs(burst_sep)
-                    if (gap >= abs(burst_sep)) :
-                        # We've found the first one of the _next_ burst
-
-                        # Close previous burst output file
-                        out_f.close()
-
-                        # Move on to the next burst
-                        burstN += 1
-
-                        print ("Burst: %3i, ends at %f sec, data: %f bytes, gap: %3.6f sec" %
-                        ( (burstN - 1),  float(prevTS), float(prev_data) - float(first_data), gap ) )
-
-                        # Reset firstTS to the beginning (first timestamp) of this new burst
-                        firstTS = fields[0]
-
-                        # first data value of next burst must be considered relative to the last 
-                        # data value of the previous burst if we normalize 
-                        if normalize == 1:
-                            first_data = prev_data
-
-                        # Create the next .N output file
-                        out_f = open(data_file + "." + str(burstN), "w")
-                        new_fnames.append(data_file + "." + str(burstN))
-
-
-                # data value (potentially normalised based on first value / first value of burst
-                data_gap = float(fields[1]) - float(first_data)
+        data = load_data_file(data_file)
+    except IOError:
+        print('extract_bursts(): File access problem while working on %s' % data_file)
+        return []
 
-                # Write to burst-specific output file
-                # <time>  <data>
-                out_f.write(fields[0] + " " + str(data_gap) + "\n")
+    if data.shape[0] > 0:
+        times = data[:, 0]
+        values = data[:, 1]
+    else:
+        times = values = np.zeros(0)
 
-                # Store the seq number for next time around the loop
-                prev_data = fields[1]
-                prevTS = fields[0]
+    ranges = get_burst_ranges(times, burst_sep)
+    values = normalise_bursts(values, ranges, normalize)
 
-            # Close the last output file
-            out_f.close()
+    for burst in range(1, len(ranges)):
+        start = ranges[burst][0]
+        if burst_sep < 0:
+            # gap is time since first statistic of previous burst
+            gap = times[start] - times[ranges[burst - 1][0]]
+        else:
+            gap = times[start] - times[start - 1]
+        print ("Burst: %3i, ends at %f sec, data: %f bytes, gap: %3.6f sec" %
+               ( burst, times[start - 1], values[start - 1], gap ) )
+
+    # only write new file if the values change
+    if burst_sep == 0:
+        out_file = data_file + '.0'
+    elif normalize == 1:
+        out_file = data_file + '.bursts'
+    else:
+        out_file = data_file
 
-    except IOError:
-        print('extract_bursts(): File access problem while working on %s' % data_file)
+    if out_file != data_file:
+        write_columns(out_file, (times, values), '%.6f %.12g')
 
-    return new_fnames
+    return [ (out_file, start, end) for start, end in ranges ]
 
 
 ## Select bursts to plot and add files to out_files and out_groups 
@@ -254,8 +230,8 @@ def extract_bursts(data_file='', burst_sep=0.0, normalize=0):
 #  @param sburst First burst in output
 #  @param eburst Last burst in output
 #  @param out_files Map of flow names to file names
-#  @param out_groups Map of file names to group numbers
-#  @return Updated file and group lists (with burst file data)
+#  @param out_groups Map of file names (and bursts) to group numbers
+#  @return Updated file and group lists (with burst data)
 def select_bursts(name='', group='', data_file='', burst_sep='0.0', sburst='1', eburst='0',
                   out_files={}, out_groups={}):
 
@@ -264,12 +240,12 @@ def select_bursts(name='', group='', data_file='', burst_sep='0.0', sburst='1',
     eburst = int(eburst)
 
     # do the burst extraction here,
-    # return a new vector of one or more filenames, pointing to file(s) containing
+    # return a vector of one or more bursts, pointing to rows of a file containing
     # <time> <statistic> 
     #
-    out_burst_files = extract_bursts(data_file = data_file, burst_sep = burst_sep)
-    # Incorporate the extracted .N files
-    # as a new, expanded set of filenames to be plotted.
+    out_bursts = extract_bursts(data_file = data_file, burst_sep = burst_sep)
+    # Incorporate the extracted bursts
+    # as a new, expanded set of data series to be plotted.
     # Update the out_files dictionary (key=interim legend name based on flow, value=file)
     # and out_groups dictionary (key=file name, value=group)
     if burst_sep == 0.0:
@@ -277,26 +253,26 @@ def select_bursts(name='', group='', data_file='', burst_sep='0.0', sburst='1',
         # The plot_time_series() function expects key to have a single string
         # value rather than a vector. Take the first (and presumably only)
         # entry in the vector returned by extract_bursts()
-        out_files[name] = out_burst_files[0]
-        out_groups[out_burst_files[0]] = group
+        out_files[name] = out_bursts[0][0]
+        out_groups[out_bursts[0][0]] = group
     else:
         # This trial has been broken into one or more bursts.
         # plot_incast_ACK_series() knows how to parse a key having a
-        # 'vector of strings' value.
+        # 'vector of bursts' value.
         # Also filter the selection based on sburst/eburst nominated by user
         if eburst == 0 :
-            eburst = len(out_burst_files)
+            eburst = len(out_bursts)
         # Catch case when eburst was set non-zero but also > number of actual bursts
-        eburst = min(eburst,len(out_burst_files))
+        eburst = min(eburst,len(out_bursts))
         if sburst <= 0 :
             sburst = 1
         # Catch case where sburst set greater than eburst
         if sburst > eburst :
             sburst = eburst
 
-        out_files[name] = out_burst_files[sburst-1:eburst]
-        for tmp_f in out_burst_files[sburst-1:eburst] :
-            out_groups[tmp_f] = group
+        out_files[name] = out_bursts[sburst-1:eburst]
+        for tmp_b in out_bursts[sburst-1:eburst] :
+            out_groups[tmp_b] = group
 
     return (out_files, out_groups)
 
@@ -336,24 +312,23 @@ def get_part_hosts(test_id):
 
     if test_id not in part_hosts:
 
-        part_hosts[test_id] = []
+        part_hosts[test_id] = lookup_experiment_hosts(test_id)
+        if part_hosts[test_id] is None:
+            part_hosts[test_id] = []
 
-        # first process tcpdump files (ignore router and ctl interface tcpdumps)
-        uname_files = get_testid_file_list('', test_id,
-                                   'uname.log.gz', '')
+            # first process tcpdump files (ignore router and ctl interface tcpdumps)
+            uname_files = get_testid_file_list('', test_id,
+                                       'uname.log.gz', '')
 
-        for f in uname_files:
-            res = re.search('.*_(.*)_uname.log.gz', f)
-            if res:
-                part_hosts[test_id].append(res.group(1))
+            for f in uname_files:
+                res = re.search('.*_(.*)_uname.log.gz', f)
+                if res:
+                    part_hosts[test_id].append(res.group(1))
 
-    return part_hosts[test_id]
+            update_experiment_hosts(test_id, part_hosts[test_id])
 
+    return part_hosts[test_id]
 
-## map test IDs or directory names to TPCONF_host_internal_ip structures
-host_internal_ip_cache = {}
-## map test IDs or directory names to list of hosts (TPCONF_router + TPCONF_hosts) 
-host_list_cache = {}
 
 ## Get external and internal address for analysis functions
 #  @param test_id Experiment id
@@ -363,14 +338,9 @@ host_list_cache = {}
 #  @return Pair of external address and internal address, or pair of empty strings
 #          if host not part of experiment
 def get_address_pair_analysis(test_id, host, do_abort='1'):
-    global host_internal_ip_cache
-    global host_list_cache
+
     internal = ''
     external = ''
-    TMP_CONF_FILE = tempfile.mktemp(suffix='_oldconfig.py', dir='/tmp/')
-
-    # XXX the whole old config access should be moved into separate module as 
-    # similar code is also in clockoffset
 
     # prior to TEACUP version 0.9 it was required to run the analysis with a config
     # file that had config.TPCONF_host_internal_ip as it was used to run the experiment
@@ -378,68 +348,23 @@ def get_address_pair_analysis(test_id, host, do_abort='1'):
     # (as well as config.TPCONF_hosts and config.TPCONF_router) from the file 
     # <test_id_prefix>_tpconf_vars.log.gz in the test experiment directory.
 
-    if test_id not in host_internal_ip_cache:
-        # first find the directory but looking for mandatory uname file
-        uname_file = get_testid_file_list('', test_id,
-                                          'uname.log.gz', '')
-        dir_name = os.path.dirname(uname_file[0])
-
-        if dir_name in host_internal_ip_cache:
-            # create test id cache entry from directory entry 
-            host_internal_ip_cache[test_id] = host_internal_ip_cache[dir_name]
-            if host_internal_ip_cache[test_id] != None:
-                host_list_cache[test_id] = host_list_cache[dir_name]
-        else:
-            # try to find old config information
-
-            # look for tpconf_vars.log.gz file in that directory 
-            var_file = local('find -L %s -name "*tpconf_vars.log.gz"' % dir_name,
-                             capture=True)
-
-            if len(var_file) > 0:
-                # new approach without using config.py
-
-                # unzip archived file
-                local('gzip -cd %s > %s' % (var_file, TMP_CONF_FILE))
-
-                # load the TPCONF_variables into oldconfig
-                oldconfig = imp.load_source('oldconfig', TMP_CONF_FILE)
-
-                # remove temporary unzipped file 
-                try:
-                    os.remove(TMP_CONF_FILE)
-                    os.remove(TMP_CONF_FILE + 'c') # remove the compiled file as well
-                except OSError:
-                    pass
-
-                # store data in cache (both under test id and directory name)
-                host_internal_ip_cache[test_id] = oldconfig.TPCONF_host_internal_ip
-                host_list_cache[test_id] = oldconfig.TPCONF_hosts + oldconfig.TPCONF_router
-                host_internal_ip_cache[dir_name] = oldconfig.TPCONF_host_internal_ip
-                host_list_cache[dir_name] = oldconfig.TPCONF_hosts + oldconfig.TPCONF_router
-            else:
-                # old approach using the functions in hostint.py that access config.py
-                # store empty value in cache (both under test id and directory name)
-                host_internal_ip_cache[test_id] = None
-                host_internal_ip_cache[dir_name] = None
-
-    if host_internal_ip_cache[test_id] != None:
+    meta = get_experiment_meta(test_id)
+
+    if meta != None:
         # new approach
 
         # pretend it is an external name and perform lookup
-        internal = host_internal_ip_cache[test_id].get(host, [])
+        internal = meta['host_internal_ip'].get(host, [])
         if len(internal) == 0:
             # host is internal name, so need to find external name
             internal = host
-            for e, i in host_internal_ip_cache[test_id].items():
-                if i[0] == host:
-                    external = e
+            external = meta['internal_external'].get(host, '')
         else:
             # host is external name
             internal = internal[0]
             external = host
 
-        hosts = host_list_cache[test_id]
+        hosts = meta['hosts']
 
     else:
         # old approach
@@ -453,3 +378,86 @@ def get_address_pair_analysis(test_id, host, do_abort='1'):
     else:
         return (external, internal)
 
+
+
+## Jobs executed by run_jobs(). This is global, so that forked worker
+## processes inherit the job list and we don't need to pickle tasks.
+job_list = []
+
+
+## Execute one job of job_list in a worker process
+#  @param idx Index of job in job_list
+#  @return Tuple (True, return value) if job succeeded,
+#          tuple (False, error message) if job failed
+def _run_job(idx):
+
+    func, args, kwargs = job_list[idx]
+    try:
+        return (True, execute(func, *args, **kwargs).values()[0])
+    except SystemExit:
+        # fabric abort() already printed the error
+        return (False, 'aborted')
+    except Exception as e:
+        return (False, str(e))
+
+
+## Run jobs serially or in parallel with a pool of worker processes
+#  @param jobs List of jobs, each a tuple (task, args, kwargs) that is
+#              executed with fabric's execute()
+#  @param num_procs Number of worker processes, '1' means serial execution
+#                   in this process (default), '0' means one worker per CPU
+#  @return List of return values of the tasks in the order of the jobs
+def run_jobs(jobs, num_procs='1'):
+
+    global job_list
+
+    num_procs = int(num_procs)
+    if num_procs <= 0:
+        num_procs = multiprocessing.cpu_count()
+    num_procs = min(num_procs, len(jobs))
+
+    if num_procs <= 1:
+        return [ execute(func, *args, **kwargs).values()[0]
+                 for func, args, kwargs in jobs ]
+
+    job_list = jobs
+    pool = multiprocessing.Pool(num_procs)
+    results = []
+    try:
+        # imap returns results in the order of the jobs
+        for idx, (ok, ret) in enumerate(pool.imap(_run_job, range(len(jobs)))):
+            if not ok:
+                pool.terminate()
+                func, args, kwargs = jobs[idx]
+                abort('Job %s%s failed: %s' % (func.__name__, str(args), ret))
+            results.append(ret)
+        pool.close()
+    finally:
+        pool.join()
+        job_list = []
+
+    return results
+
+
+## Run jobs of a group one after the other
+#  @param jobs List of jobs, each a tuple (task, args, kwargs) that is
+#              executed with fabric's execute()
+#  @return List of return values of the tasks in the order of the jobs
+def _run_job_group(jobs):
+
+    return [ execute(func, *args, **kwargs).values()[0]
+             for func, args, kwargs in jobs ]
+
+
+## Run groups of jobs serially or in parallel with a pool of worker processes.
+## The jobs of a group are run one after the other by the same worker, e.g.
+## jobs of one experiment that share intermediate files (packet store, clock
+## offsets) must not run at the same time.
+#  @param groups List of job lists, each job a tuple (task, args, kwargs)
+#  @param num_procs Number of worker processes, '1' means serial execution
+#                   in this process (default), '0' means one worker per CPU
+#  @return List of lists of return values of the tasks in the order of the jobs
+def run_job_groups(groups, num_procs='1'):
+
+    return run_jobs([ (_run_job_group, (jobs, ), {}) for jobs in groups ],
+                    num_procs)
@@ -28,13 +28,18 @@
 #
 
 from ast import literal_eval
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy as np
 import os
-from scipy.interpolate.fitpack2 import InterpolatedUnivariateSpline
 import sys
-from threading import Lock
+from threading import Lock, Thread, current_thread
+import time
 import traceback
+import uuid
 
 
 TEACUP_DIR = os.environ['TEACUP_DIR']
@@ -42,11 +47,27 @@ CWD = os.environ['TEACUP_CWD']
 EXP_COMPLETED = os.path.join(CWD, os.environ['TEACUP_EXP_LIST'])
 EXP_DIR = os.path.join(CWD, os.environ['TEACUP_EXP_DIR'])
 OUT_DIR = os.environ['TEACUP_OUT_DIR']
+# Maximum size of the result cache in MB
+CACHE_SIZE = int(os.environ.get('TEACUP_CACHE_SIZE', '512'))
+# Number of threads running extraction jobs in each process
+JOB_WORKERS = int(os.environ.get('TEACUP_JOB_WORKERS', '2'))
+# Directory with the state of extraction jobs (shared by all processes)
+JOB_DIR = os.path.join(CWD, 'teaplot_jobs')
+# Seconds after which finished extraction jobs are removed
+JOB_MAX_AGE = 86400
+# Seconds between updates of the state of queued and running jobs
+JOB_HEARTBEAT = 10
+# Seconds after which a queued or running job whose state was not updated is
+# considered failed (e.g. the process running it was recycled)
+JOB_TIMEOUT = int(os.environ.get('TEACUP_JOB_TIMEOUT', '120'))
 
 os.chdir(CWD)
 sys.path.append(TEACUP_DIR)
 from analysecmpexp import get_extract_function, read_experiment_ids
-from analyse import _extract_tcp_stat
+from analyse import _extract_tcp_stat, _extract_tcp_stats
+from aggregation import sliding_window_sum, build_lod_levels, select_lod
+from filefinder import set_search_dir
+from datacache import load_data_file
 
 def init_log():
     """
@@ -66,63 +87,118 @@ LOG = init_log()
 LOG.setLevel(logging.INFO)
 #LOG.setLevel(logging.WARNING)
 
-def cumulative_window(data, window_size=1, skip_factor=0.1):
+class ResultCache(object):
+    """
+    Thread-safe least recently used cache for parsed and calculated data arrays
+    (or lists of arrays). Entries are keyed by file name, modification time and
+    size of the file the data was read from (plus any calculation parameters),
+    so changed files are never served from the cache. The least recently used
+    entries are evicted when the total size of the cached arrays exceeds
+    max_size bytes.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def get_size(data):
+        """
+        Returns the size of an array or list of arrays in bytes
+        """
+        if isinstance(data, list):
+            return sum([entry.nbytes for entry in data])
+        return data.nbytes
+
+    @staticmethod
+    def make_key(filename, *params):
+        """
+        Returns the cache key for data read from filename
+        """
+        stat = os.stat(filename)
+        return (os.path.abspath(filename), stat.st_mtime, stat.st_size) + params
+
+    def get(self, key):
+        """
+        Returns the cached data for key, or None if not cached
+        """
+        with self.lock:
+            try:
+                data = self.entries.pop(key)
+            except KeyError:
+                self.misses = self.misses + 1
+                return None
+            # Re-insert as most recently used
+            self.entries[key] = data
+            self.hits = self.hits + 1
+            return data
+
+    def put(self, key, data):
+        """
+        Adds data to the cache. Arrays are made read-only, since they are shared
+        between requests.
+        """
+        if data is None or self.get_size(data) > self.max_size:
+            return
+        for entry in (data if isinstance(data, list) else [data]):
+            entry.flags.writeable = False
+        with self.lock:
+            if key in self.entries:
+                self.size = self.size - self.get_size(self.entries.pop(key))
+            self.entries[key] = data
+            self.size = self.size + self.get_size(data)
+            while self.size > self.max_size:
+                _, old = self.entries.popitem(last=False)
+                self.size = self.size - self.get_size(old)
+
+    def get_stats(self):
+        """
+        Returns the cache statistics
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size
+            }
+
+RESULT_CACHE = ResultCache(CACHE_SIZE * 1024 * 1024)
+
+def cumulative_window(data, window_size=1, skip_factor=0.1, time_skip=None):
     """
     Calculates a moving window sum over the provided data, with a window size measured in seconds.
-    Functions by iterating through the data according to skip_factor*window_size, and summing all
-    data points within the window_size of the current point.
+    Windows start time_skip (default skip_factor*window_size) seconds apart, and each window sums
+    all data points within the window_size of its start point. Uses prefix sums, so the run time
+    is linear in the number of data points.
     """
 
-    time_skip = window_size * skip_factor
+    if time_skip is None:
+        time_skip = window_size * skip_factor
 
-    # Hard to figure out how many are required without actually processing the data.
-    # Therefore, allocate an empty array that is equal in size to the source data,
-    # and keep track of how many points are added, then return the array up to that
-    # index.
-    result = np.empty(data.shape)
-    index = 0
-    result_index = 0
     data_length = len(data)
     LOG.info('Calculating cumulative window for %s data points \
-             with window size %s, skip factor %s…', data_length, window_size, skip_factor)
-    while index < data_length:
-        # Window start time
-        time = data[index][0]
-        max_time = time + window_size
-        points = []
-        seek_index = index
-        point = [0, 0]
-        # Collect all future data points within the window
-        while (seek_index + 1) < data_length and point[0] <= max_time:
-            seek_index = seek_index + 1
-            point = data[seek_index]
-            points = points + [point, ]
-        # Calculate sum of the value of all points found
-        total = 0
-        for point in points:
-            total = total + point[1]
-        # Normalise to per second
-        total = total / window_size
-        # Add resulting sum to result array, timestamp is centred in the window
-        timestamp = time + window_size / 2
-
-        result[result_index][0] = timestamp
-        result[result_index][1] = total
-
-        result_index = result_index + 1
-        # Find next window index
-        while index < data_length and data[index][0] <= (time + time_skip):
-            index = index + 1
-    LOG.info('Done. Calculated %s data points', result_index)
-    return result[:result_index]
-
-def calculate_throughput(data):
+             with window size %s, time skip %s…', data_length, window_size, time_skip)
+    times, totals = sliding_window_sum(data[:, 0], data[:, 1], window_size, time_skip)
+
+    result = np.zeros((len(times), data.shape[1]))
+    result[:, 0] = times
+    result[:, 1] = totals
+    LOG.info('Done. Calculated %s data points', len(result))
+    return result
+
+def calculate_throughput(data, window_size=1, time_skip=None):
     """
     Moving window sum over packet sizes
     """
     # Sort array by time
     data = data[data[:, 0].argsort()]
-    data = cumulative_window(data)
+    data = cumulative_window(data, window_size=window_size, time_skip=time_skip)
     # bytes to bits
     data[:, 1] = data[:, 1] * 8.0
     return data
@@ -144,7 +220,7 @@ def extract_goodput(test_id='',
                        ** kwargs)
 
 
-def calculate_goodput(data):
+def calculate_goodput(data, window_size=1, time_skip=None):
     """
     Moving window sum over the bytes received column (2nd column) in the ACKSEQ data.
     ACKSEQ is cumulative bytes received, so calculate differences between ACKs.
@@ -152,7 +228,7 @@ def calculate_goodput(data):
     # Sort array by time
     data = data[data[:, 0].argsort()]
     data[:, 1] = np.append(np.zeros(1), np.diff(data[:, 1]))
-    data = cumulative_window(data)
+    data = cumulative_window(data, window_size=window_size, time_skip=time_skip)
     # bytes to bits
     data[:, 1] = data[:, 1] * 8.0
     return data
@@ -969,18 +1045,29 @@ def get_experiments_from_teacup():
 def read_raw_file(filename):
     """
     Reads entries as CSV from filename and normalises the first
-    column relative to the first entry
+    column relative to the first entry. The data is cached in RESULT_CACHE,
+    so the returned array must not be modified.
+    """
+    key = ResultCache.make_key(filename, 'raw')
+    data = RESULT_CACHE.get(key)
+    if data is not None:
+        LOG.info('Using cached data of "%s"', filename)
+        return data
+    data = load_raw_file(filename)
+    RESULT_CACHE.put(key, data)
+    return data
+
+def load_raw_file(filename):
+    """
+    Reads entries (comma or space separated) from filename. Uses TEACUP's
+    binary sidecar of the file if it is up to date, otherwise the file is
+    parsed and the sidecar is created.
     """
     LOG.info('Reading "%s"…', filename)
-    with open(filename, 'r') as raw_file:
-        try:
-            data = np.loadtxt(raw_file, delimiter=',')
-        except ValueError:
-            # Probably space separated
-            data = np.loadtxt(raw_file, delimiter=' ')
+    data = load_data_file(filename)
     if data is not None and (len(data) > 0):
         LOG.info('File contains %s records', len(data))
-        return data.copy()
+        return data
     return None
 
 
@@ -1044,8 +1131,35 @@ def normalise_summary_start_times(out_files, metric, result,out_groups):
 
     return result
 
-# Lock to stop multiple extract jobs from conflicting with each other
-EXTRACT_LOCK = Lock()
+# Locks to stop extract jobs for the same experiment and metric from conflicting
+# with each other, indexed by (experiment, metric)
+EXTRACT_LOCKS = {}
+# Lock protecting EXTRACT_LOCKS
+EXTRACT_LOCKS_LOCK = Lock()
+
+@contextmanager
+def extract_locks(exp_id_list, metrics):
+    """
+    Holds the locks for extracting the given metrics of the given experiments
+    (semicolon-separated list). Locks are always acquired in the same order, so
+    requests for overlapping sets of experiments and metrics cannot deadlock.
+    Metrics extracted from the same TEACUP files share a lock.
+    """
+    names = set()
+    for metric in metrics:
+        if metric in METRIC_LIST and METRIC_LIST[metric]['extract'] is extract_goodput:
+            metric = 'ackseq'
+        for exp in exp_id_list.split(';'):
+            names.add((exp, metric))
+    with EXTRACT_LOCKS_LOCK:
+        locks = [EXTRACT_LOCKS.setdefault(name, Lock()) for name in sorted(names)]
+    for lock in locks:
+        lock.acquire()
+    try:
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
 
 def post_process_metric(metric, result, filename, flow):
     """
@@ -1067,10 +1181,11 @@ def post_process_metric(metric, result, filename, flow):
 def process_metric(result,
                    metric,
                    source_filter,
-                   exp_id_list):
+                   exp_id_list,
+                   job=None):
     """
     Performs the extraction of a single metric pertaining to the given
-    parameters
+    parameters. Progress is reported to job (if given).
     """
     LOG.info('Extracting "' + metric + '"…')
     result['data'].update({metric: {}})
@@ -1086,16 +1201,16 @@ def process_metric(result,
             result = {'result': '"' + metric + '" is not yet implemented.'}
             return True
     error = False;
-    # Block thread while another extract task is running
-    EXTRACT_LOCK.acquire()
+    # Block thread while another extract task for the same data is running
     try:
-        (_, out_files, out_groups) = \
-            ex_function(test_id=exp_id_list,
-                        out_dir=OUT_DIR,
-                        source_filter=source_filter if source_filter is not None else '',
-                        ts_correct='1',
-                        replot_only='1',
-                        ** kwargs)
+        with extract_locks(exp_id_list, [metric]):
+            (_, out_files, out_groups) = \
+                ex_function(test_id=exp_id_list,
+                            out_dir=OUT_DIR,
+                            source_filter=source_filter if source_filter is not None else '',
+                            ts_correct='1',
+                            replot_only='1',
+                            ** kwargs)
 
     except Exception as exc:
         LOG.error('Something went wrong with TEACUP\'s extraction process: ' + repr(exc))
@@ -1108,15 +1223,52 @@ def process_metric(result,
                                 result=result,
                                 filename=filename,
                                 flow=flow)
+            if job is not None:
+                job.file_done(flow in result['data'][metric])
         result = normalise_summary_start_times(out_files, metric, result,out_groups)
         LOG.info('Finished extracting and post-processing "' + metric + '".')
-    finally:
-        EXTRACT_LOCK.release()
     return error
 
-def get_metrics_from_request(request):
+def extract_tcp_stats(exp_id_list, source_filter, metrics):
     """
-    Extracts the data pertaining to the given metrics, exp_id, and source filter
+    Extracts all requested siftr and web10g metrics with TEACUP's _extract_tcp_stats
+    task, so that each TCP logger file is read only once. The extraction of the
+    single metrics afterwards finds the already extracted files.
+    """
+    siftr_index = []
+    web10g_index = []
+    io_filter = []
+    for metric in metrics:
+        if metric not in METRIC_LIST:
+            continue
+        entry = METRIC_LIST[metric]
+        # same indexes as used by extract_siftr and extract_web10g
+        if entry['extract'] is extract_siftr:
+            siftr_index.append(entry['siftr'])
+            web10g_index.append('26')
+            io_filter.append(entry['io_filter'] if 'io_filter' in entry else 'o')
+        elif entry['extract'] is extract_web10g:
+            siftr_index.append('9')
+            web10g_index.append(entry['web10g'])
+            io_filter.append('o')
+    if len(siftr_index) < 2:
+        return
+    LOG.info('Extract TCP statistics for %s metrics in one pass…', len(siftr_index))
+    with extract_locks(exp_id_list, metrics):
+        _extract_tcp_stats(test_id=exp_id_list,
+                           source_filter=source_filter if source_filter is not None else '',
+                           ts_correct='1',
+                           replot_only='1',
+                           siftr_index=';'.join(siftr_index),
+                           web10g_index=';'.join(web10g_index),
+                           ttprobe_index=';'.join(['10'] * len(siftr_index)),
+                           out_dir=OUT_DIR,
+                           io_filter=';'.join(io_filter))
+
+def parse_metrics_request(request):
+    """
+    Returns the experiment IDs, metrics and source filter of a metrics request,
+    or an error result if the request is incomplete
     """
     request = literal_eval(request)
     metrics = get_value_from_request(request, 'metrics')
@@ -1124,14 +1276,21 @@ def get_metrics_from_request(request):
     exp_id = get_value_from_request(request, 'exp_id')
 
     if exp_id is None:
-        return {'result': 'No data sources selected. Please select at least one \
+        return (None, {'result': 'No data sources selected. Please select at least one \
                 experiment ID and optionally provide a source \
-                filter.'}
+                filter.'})
     elif metrics is None:
-        return {'result': 'No metrics selected. Please select at least one metric to show.'}
+        return (None, {'result': 'No metrics selected. Please select at least one metric to show.'})
+
+    return ((exp_id, metrics, source_filter), None)
 
-    orig_dir = os.getcwd()
-    os.chdir(EXP_DIR)
+def extract_metrics(exp_id, metrics, source_filter, job=None):
+    """
+    Extracts the data pertaining to the given metrics, exp_id, and source filter.
+    Progress is reported to job (if given).
+    """
+    # Search experiment files from EXP_DIR (the returned file names are absolute)
+    set_search_dir(EXP_DIR)
     result = {'result': 'Success', 'data': {}}
     fail = False
     LOG.info('Received request for experiment(s) "' + repr(exp_id) + '".')
@@ -1140,13 +1299,19 @@ def get_metrics_from_request(request):
     for exp in exp_id:
         exp_id_list = exp_id_list + (';' if len(exp_id_list) > 0 else '') + exp
     try:
+        extract_tcp_stats(exp_id_list=exp_id_list,
+                          source_filter=source_filter,
+                          metrics=metrics)
         for metric in metrics:
             fail = process_metric(result=result,
                                   metric=metric,
                                   source_filter=source_filter,
-                                  exp_id_list=exp_id_list)
+                                  exp_id_list=exp_id_list,
+                                  job=job)
             if fail:
                 break
+            if job is not None:
+                job.metric_done()
     except SystemExit:
         # Intercept sys.exit call
         LOG.error('TEACUP process aborted')
@@ -1155,8 +1320,6 @@ def get_metrics_from_request(request):
         fail = True
         LOG.error('Something went wrong with data post-processing: ' + repr(exc))
         LOG.info(traceback.format_exc())
-    finally:
-        os.chdir(orig_dir)
     if fail:
         LOG.warning('Error occurred during extraction.')
         return {'result': 'Error performing analysis (TEACUP error)'}
@@ -1164,73 +1327,365 @@ def get_metrics_from_request(request):
         LOG.info('Successfully processed request.')
         return result
 
-def read_metric(filename, metric):
+def get_metrics_from_request(request):
+    """
+    Extracts the data pertaining to the given metrics, exp_id, and source filter
+    """
+    (params, error) = parse_metrics_request(request)
+    if error is not None:
+        return error
+    return extract_metrics(*params)
+
+class ExtractJob(object):
+    """
+    Extraction job running in the background. The state of a job is stored in
+    JOB_DIR, so all uWSGI processes can report the progress and result of
+    jobs started by any process.
+    """
+
+    def __init__(self, exp_id, metrics, source_filter):
+        self.status = {
+            'id': uuid.uuid4().hex,
+            'state': 'queued',
+            'exp_id': exp_id,
+            'metrics': metrics,
+            'src_filter': source_filter,
+            'submitted': time.time(),
+            'updated': time.time(),
+            'started': None,
+            'finished': None,
+            'metrics_total': len(metrics),
+            'metrics_done': 0,
+            'files_done': 0,
+            'flows_done': 0,
+            'eta': None
+        }
+        self.lock = Lock()
+
+    @staticmethod
+    def get_file_name(job_id, ext):
+        """
+        Returns the name of a state file of job_id
+        """
+        return os.path.join(JOB_DIR, job_id + ext)
+
+    def write(self):
+        """
+        Writes the status of the job and the time of the update. The caller
+        must hold self.lock.
+        """
+        self.status['updated'] = time.time()
+        write_job_file(self.status['id'], '.json', self.status)
+
+    def save(self):
+        """
+        Writes the status of the job
+        """
+        with self.lock:
+            self.write()
+
+    def update(self, increments=None, **kwargs):
+        """
+        Updates the status of the job (values in kwargs are set, values in
+        increments are added) and recalculates the expected time until the
+        job is finished
+        """
+        with self.lock:
+            self.status.update(kwargs)
+            for (key, value) in (increments or {}).items():
+                self.status[key] += value
+            done = self.status['metrics_done']
+            if self.status['started'] is not None and done > 0:
+                elapsed = time.time() - self.status['started']
+                self.status['eta'] = elapsed / done * (self.status['metrics_total'] - done)
+            self.write()
+
+    def finish(self, result):
+        """
+        Writes the result of the job, then marks the job as finished, so
+        clients never see a finished job without result
+        """
+        with self.lock:
+            write_job_file(self.status['id'], '.result.json', result)
+            self.status.update(state='done' if result['result'] == 'Success' else 'failed',
+                               finished=time.time(), eta=0.0)
+            self.write()
+
+    def file_done(self, have_flow):
+        """
+        Called after an extracted file was post-processed
+        """
+        self.update(increments={'files_done': 1, 'flows_done': 1 if have_flow else 0})
+
+    def metric_done(self):
+        """
+        Called after a metric was extracted
+        """
+        self.update(increments={'metrics_done': 1})
+
+    def run(self):
+        """
+        Runs the extraction and stores the result
+        """
+        self.update(state='running', started=time.time())
+        try:
+            result = extract_metrics(self.status['exp_id'], self.status['metrics'],
+                                     self.status['src_filter'], job=self)
+        except Exception as exc:
+            LOG.error('Extraction job %s failed: %s', self.status['id'], repr(exc))
+            result = {'result': 'Error performing analysis (TEACUP error)'}
+        with JOB_POOL_LOCK:
+            ACTIVE_JOBS.discard(self)
+        self.finish(result)
+
+# Pool of threads running extraction jobs (created when the first job is submitted)
+JOB_POOL = None
+# Queued and running jobs of this process
+ACTIVE_JOBS = set()
+# Lock protecting JOB_POOL and ACTIVE_JOBS
+JOB_POOL_LOCK = Lock()
+
+def write_job_file(job_id, ext, data):
+    """
+    Writes a state file of job_id. Files are replaced atomically, so readers
+    never see partial files.
+    """
+    fname = ExtractJob.get_file_name(job_id, ext)
+    tmp_name = '%s.%i.%i.tmp' % (fname, os.getpid(), current_thread().ident)
+    with open(tmp_name, 'w') as out_file:
+        json.dump(data, out_file)
+    os.rename(tmp_name, fname)
+
+def update_active_jobs():
+    """
+    Periodically updates the state files of the queued and running jobs of
+    this process, so other processes can tell that the jobs are still alive
+    """
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        with JOB_POOL_LOCK:
+            jobs = list(ACTIVE_JOBS)
+        for job in jobs:
+            try:
+                job.save()
+            except (IOError, OSError) as exc:
+                LOG.error('Cannot update extraction job %s: %s', job.status['id'], repr(exc))
+
+def remove_old_jobs():
+    """
+    Removes the state files of jobs that were last updated more than
+    JOB_MAX_AGE seconds ago
+    """
+    now = time.time()
+    for fname in os.listdir(JOB_DIR):
+        fname = os.path.join(JOB_DIR, fname)
+        try:
+            if now - os.path.getmtime(fname) > JOB_MAX_AGE:
+                os.remove(fname)
+        except OSError:
+            pass
+
+def submit_extract_job(request):
+    """
+    Starts the extraction of a metrics request in the background and returns
+    the job ID, which can be used to poll the progress and get the result
+    """
+    global JOB_POOL
+
+    (params, error) = parse_metrics_request(request)
+    if error is not None:
+        return error
+
+    if not os.path.isdir(JOB_DIR):
+        try:
+            os.makedirs(JOB_DIR)
+        except OSError:
+            # Created by another process
+            pass
+    remove_old_jobs()
+
+    job = ExtractJob(*params)
+    job.save()
+    with JOB_POOL_LOCK:
+        if JOB_POOL is None:
+            JOB_POOL = ThreadPool(JOB_WORKERS)
+            heartbeat = Thread(target=update_active_jobs)
+            heartbeat.daemon = True
+            heartbeat.start()
+        ACTIVE_JOBS.add(job)
+        JOB_POOL.apply_async(job.run)
+    LOG.info('Submitted extraction job %s', job.status['id'])
+    return {'result': 'Success', 'job': job.status['id']}
+
+def read_job_file(job_id, ext):
+    """
+    Returns the content of a state file of job_id, or None if it does not exist
+    """
+    try:
+        with open(ExtractJob.get_file_name(job_id, ext)) as job_file:
+            return json.load(job_file)
+    except (IOError, ValueError):
+        return None
+
+def read_job_status(job_id):
+    """
+    Returns the status of job_id, or None if the job does not exist. A queued
+    or running job whose status was not updated for JOB_TIMEOUT seconds is
+    marked as failed, since the process running it has stopped.
+    """
+    status = read_job_file(job_id, '.json')
+    if status is None or status['state'] not in ('queued', 'running'):
+        return status
+    if time.time() - status.get('updated', status['submitted']) <= JOB_TIMEOUT:
+        return status
+    LOG.error('Extraction job %s was not updated for %i seconds', job_id, JOB_TIMEOUT)
+    status.update(state='failed', finished=time.time(), eta=0.0)
+    try:
+        write_job_file(job_id, '.result.json',
+                       {'result': 'Error: extraction job stopped (server process ended)'})
+        write_job_file(job_id, '.json', status)
+    except (IOError, OSError):
+        pass
+    return status
+
+def get_extract_job(job_id):
+    """
+    Returns the status and progress of an extraction job
+    """
+    status = read_job_status(job_id)
+    if status is None:
+        return {'result': 'Unknown job "' + job_id + '"'}
+    return {'result': 'Success', 'job': status}
+
+def get_extract_job_result(job_id):
+    """
+    Returns the result of a finished extraction job (same as the result of
+    get_metrics_from_request)
+    """
+    status = read_job_status(job_id)
+    if status is None:
+        return {'result': 'Unknown job "' + job_id + '"'}
+    if status['state'] not in ('done', 'failed'):
+        return {'result': 'Job "' + job_id + '" has not finished yet'}
+    result = read_job_file(job_id, '.result.json')
+    if result is None:
+        return {'result': 'Result of job "' + job_id + '" is missing'}
+    return result
+
+def read_metric(filename, metric, window=1, step=None):
     """
     Reads the raw data of a metric and performs any calculation required
-    for that metric as specified in METRIC_LIST
+    for that metric as specified in METRIC_LIST. Window and step are the
+    window size and the time between windows (in seconds) used by
+    calculations over moving windows. Calculated data is cached in
+    RESULT_CACHE, so the returned array must not be modified.
     """
-    data = read_raw_file(filename)
     if metric in METRIC_LIST and METRIC_LIST[metric]['calculate'] is not None:
+        key = ResultCache.make_key(filename, metric, window, step)
+        data = RESULT_CACHE.get(key)
+        if data is not None:
+            LOG.info('Using cached "%s" data of "%s"', metric, filename)
+            return data
+        data = read_raw_file(filename)
         LOG.info('Running calculation function for "' + metric + '"…')
         calc_function = METRIC_LIST[metric]['calculate']
-        data = calc_function(data)
-    return data
+        data = calc_function(data, window_size=window, time_skip=step)
+        RESULT_CACHE.put(key, data)
+        return data
+    return read_raw_file(filename)
 
-def do_2d_density_with_time(axis, primary, secondary, scales):
+def get_aligned_series(primary, secondary):
     """
-    Calculates a 2D density plot against time using an interpolated univariate
-    spline.
+    Aligns the values of two metrics on the timestamps of the metric with more
+    data points (the primary). The values of the other metric are linearly
+    interpolated at these timestamps (zero outside its time range). Aligned
+    series are cached in RESULT_CACHE, so the returned array must not be
+    modified. Returns an array with the columns time, primary value and
+    secondary value.
     """
     primary_file = primary['file']
-    primary_dataset = primary['dataset']
-    primary_metric = primary['metric']
     secondary_file = secondary['file']
-    secondary_dataset = secondary['dataset']
-    secondary_metric = secondary['metric']
-    x_scale = scales['x']
-    y_scale = scales['y']
-    z_scale = scales['z']
 
     if secondary_file is None or len(secondary_file) == 0:
         raise ValueError('Must provide 2 sources (for now)')
     if not (os.path.exists(primary_file) and os.path.exists(secondary_file)):
         raise ValueError('One or more files does not exist!')
 
-    primary = read_metric(primary_file, primary_metric)[:, [0, primary_dataset]]
-    secondary = read_metric(secondary_file, secondary_metric)[:, [0, secondary_dataset]]
+    key = ('aligned',) + \
+        ResultCache.make_key(primary_file, primary['metric'], primary['dataset'],
+                             primary['window'], primary['step']) + \
+        ResultCache.make_key(secondary_file, secondary['metric'], secondary['dataset'],
+                             secondary['window'], secondary['step'])
+    data = RESULT_CACHE.get(key)
+    if data is not None:
+        LOG.info('Using cached aligned series')
+        return data
+
+    primary = read_metric(primary_file, primary['metric'],
+                          primary['window'], primary['step'])[:, [0, primary['dataset']]]
+    secondary = read_metric(secondary_file, secondary['metric'],
+                            secondary['window'], secondary['step'])[:, [0, secondary['dataset']]]
 
     if len(secondary) > len(primary):
         temp = secondary
         secondary = primary
         primary = temp
 
-    p_time = primary[:, 0]
-    p_data = primary[:, 1]
-
-    s_time = secondary[:, 0]
-    s_data = secondary[:, 1]
+    # np.interp needs increasing timestamps
+    secondary = secondary[np.argsort(secondary[:, 0], kind='mergesort')]
 
     LOG.info('Interpolating…')
-    interp_function = InterpolatedUnivariateSpline(x=s_time, y=s_data, ext='zeros')
-    #f = interpolate.interp1d(x=s_time, y=s_data)
-    znew = interp_function(p_time)
+    znew = np.interp(primary[:, 0], secondary[:, 0], secondary[:, 1], left=0.0, right=0.0)
     LOG.info('Finished.')
-    data = [p_time, p_data, znew]
+    data = np.column_stack([primary[:, 0], primary[:, 1], znew])
+    RESULT_CACHE.put(key, data)
+    return data
+
+def do_2d_density_with_time(axis, primary, secondary, scales):
+    """
+    Calculates a 2D density plot against time by aligning both metrics on
+    common timestamps.
+    """
+    x_scale = scales['x']
+    y_scale = scales['y']
+    z_scale = scales['z']
+
+    data = get_aligned_series(primary, secondary)
     if axis == 'x':
-        return np.dstack([data[0] * x_scale, data[1] * y_scale, data[2] * z_scale])
+        return np.dstack([data[:, 0] * x_scale, data[:, 1] * y_scale, data[:, 2] * z_scale])
     elif axis == 'z':
-        return np.dstack([data[1] * x_scale, data[2] * y_scale, data[0] * z_scale])
+        return np.dstack([data[:, 1] * x_scale, data[:, 2] * y_scale, data[:, 0] * z_scale])
     else:
         raise ValueError('Invalid axis')
 
-def do_1d_time_series(axis, y_file, y_dataset, y_metric, scales):
+def do_2d_density_histogram(primary, secondary, scales, bins):
+    """
+    Calculates a binned 2D histogram of the values of two metrics aligned on
+    common timestamps. Scales is a tuple of the scales of the primary and the
+    secondary metric, bins is the number of bins (int or list with the number
+    of bins for primary and secondary values). Only the bin counts and the bin
+    edges are returned.
+    """
+    data = get_aligned_series(primary, secondary)
+    LOG.info('Binning %s data points…', len(data))
+    counts, p_edges, s_edges = np.histogram2d(data[:, 1] * scales[0],
+                                              data[:, 2] * scales[1],
+                                              bins=bins)
+    return {
+        'counts': counts.tolist(),
+        'primary_edges': p_edges.tolist(),
+        'secondary_edges': s_edges.tolist(),
+        'points': len(data)
+    }
+
+def do_1d_time_series(axis, y_file, y_dataset, y_metric, scales, window=1, step=None):
     """
     Calculates the 2D graph values for the given metric
     """
     x_scale = scales['x']
     y_scale = scales['y']
     z_scale = scales['z']
-    data = read_metric(y_file, y_metric)[:, [0, y_dataset]]
+    data = read_metric(y_file, y_metric, window, step)[:, [0, y_dataset]]
     if data is None:
         raise ValueError('Empty dataset')
     if axis == 'x':
@@ -1240,9 +1695,10 @@ def do_1d_time_series(axis, y_file, y_dataset, y_metric, scales):
     else:
         raise ValueError('Invalid axis')
 
-def process_plot(x, y, z):
+def process_plot(x, y, z, bins=None):
     """
-    Performs the appropriate calculations for the requested plot
+    Performs the appropriate calculations for the requested plot. If bins is
+    given, 2D density plots return a binned histogram instead of the points.
     """
     scales = {'x': x['scale'], 'y': y['scale'], 'z': z['scale']}
     if x['metric'] == 'TIME' and z['metric'] == 'NOTHING':
@@ -1251,22 +1707,36 @@ def process_plot(x, y, z):
                                  y_file=y['file'],
                                  y_dataset=y['dataset'],
                                  y_metric=y['metric'],
-                                 scales=scales)
+                                 scales=scales,
+                                 window=y['window'],
+                                 step=y['step'])
     elif z['metric'] == 'TIME' and x['metric'] == 'NOTHING':
         # 1D time series with time on Z axis
         return do_1d_time_series(axis='z',
                                  y_file=y['file'],
                                  y_dataset=y['dataset'],
                                  y_metric=y['metric'],
-                                 scales=scales)
+                                 scales=scales,
+                                 window=y['window'],
+                                 step=y['step'])
     elif x['metric'] == 'TIME' and z['metric'] != 'TIME':
         # 2D Density with time on xaxis
+        if bins is not None:
+            return do_2d_density_histogram(primary=y,
+                                           secondary=z,
+                                           scales=(scales['y'], scales['z']),
+                                           bins=bins)
         return do_2d_density_with_time(axis='x',
                                        primary=y,
                                        secondary=z,
                                        scales=scales)
     elif x['metric'] != 'TIME' and z['metric'] == 'TIME':
         # 2D Density with time on z axis
+        if bins is not None:
+            return do_2d_density_histogram(primary=x,
+                                           secondary=y,
+                                           scales=(scales['x'], scales['y']),
+                                           bins=bins)
         return do_2d_density_with_time(axis='z',
                                        primary=x,
                                        secondary=y,
@@ -1283,9 +1753,10 @@ def parse_info_from_map_entry(map_entry):
     Pulls the request parameters from the map_entry with sane defaults and
     constructs dicts holding the information for each axis
     """
-    x_file = map_entry['x']['file'] if 'file' in map_entry['x'] else ''
-    y_file = map_entry['y']['file'] if 'file' in map_entry['y'] else ''
-    z_file = map_entry['z']['file'] if 'file' in map_entry['z'] else ''
+    # File names are relative to EXP_DIR (unless absolute)
+    x_file = os.path.join(EXP_DIR, map_entry['x']['file']) if map_entry['x'].get('file') else ''
+    y_file = os.path.join(EXP_DIR, map_entry['y']['file']) if map_entry['y'].get('file') else ''
+    z_file = os.path.join(EXP_DIR, map_entry['z']['file']) if map_entry['z'].get('file') else ''
 
     x_metric = map_entry['x']['metric'] if 'metric' in map_entry['x'] else 'NOTHING'
     y_metric = map_entry['y']['metric'] if 'metric' in map_entry['y'] else 'NOTHING'
@@ -1300,17 +1771,30 @@ def parse_info_from_map_entry(map_entry):
     y_scale = float(map_entry['y']['scale']) if 'scale' in map_entry['y'] else 1.0
     z_scale = float(map_entry['z']['scale']) if 'scale' in map_entry['z'] else 1.0
 
+    # Moving window size and time between windows in seconds (throughput, goodput)
+    x_window = float(map_entry['x']['window']) if 'window' in map_entry['x'] else 1
+    y_window = float(map_entry['y']['window']) if 'window' in map_entry['y'] else 1
+    z_window = float(map_entry['z']['window']) if 'window' in map_entry['z'] else 1
+
+    x_step = float(map_entry['x']['step']) if 'step' in map_entry['x'] else None
+    y_step = float(map_entry['y']['step']) if 'step' in map_entry['y'] else None
+    z_step = float(map_entry['z']['step']) if 'step' in map_entry['z'] else None
+
     x_info = {
         'file': x_file,
         'metric': x_metric,
         'dataset': x_dataset,
         'scale': x_scale,
+        'window': x_window,
+        'step': x_step,
     }
     y_info = {
         'file': y_file,
         'metric': y_metric,
         'dataset': y_dataset,
         'scale': y_scale,
+        'window': y_window,
+        'step': y_step,
         'group' :  int(map_entry['y']['group'] if 'group' in map_entry['y'] else 0)
     }
     z_info = {
@@ -1318,6 +1802,8 @@ def parse_info_from_map_entry(map_entry):
         'metric': z_metric,
         'dataset': z_dataset,
         'scale': z_scale,
+        'window': z_window,
+        'step': z_step,
     }
 
     return (x_info, y_info, z_info)
@@ -1329,41 +1815,101 @@ def process_map_request(map_entry):
     Graph co-ordinates are always 3D (x,y,z)
     """
     x_info, y_info, z_info = parse_info_from_map_entry(map_entry)
+    # Optional number of bins of 2D density histograms
+    bins = map_entry['bins'] if 'bins' in map_entry else None
 
+    plot = None
+    histogram = None
     try:
-        plot = process_plot(x=x_info, y=y_info, z=z_info)
+        plot = process_plot(x=x_info, y=y_info, z=z_info, bins=bins)
     except ValueError as exc:
         LOG.error('Something went wrong with processing map request: %s', repr(exc))
         LOG.info(traceback.format_exc())
         result = 'Error: ' + repr(exc)
     else:
         result = 'Success'
+        if isinstance(plot, dict):
+            histogram = plot
+            plot = None
     return {
         'result':result,
         'map': map_entry['map'],
         'plot': plot,
+        'histogram': histogram,
         'metrics': {
             'x': x_info['metric'],
             'y': y_info['metric'],
             'z': z_info['metric']
             },
-        'group' : y_info['group']
+        'group' : y_info['group'],
+        'lod_key': get_lod_key(x_info, y_info, z_info)
         }
 
+def get_lod_key(x, y, z):
+    """
+    Returns the cache key of the levels of detail of a plot, or None if the
+    plot has no time axis
+    """
+    if x['metric'] == 'TIME':
+        time_col = 0
+    elif z['metric'] == 'TIME':
+        time_col = 2
+    else:
+        return None
+    key = ('lod', time_col)
+    for info in (x, y, z):
+        if info['file'] != '' and os.path.exists(info['file']):
+            key = key + ResultCache.make_key(info['file'], info['metric'], info['dataset'],
+                                             info['window'], info['step'])
+    return key
+
+def select_plot_lod(plot, lod_key, pixels, stime, etime):
+    """
+    Reduces the points of a plot to the points needed to draw the time range
+    [stime, etime] (plot time, 0 means end of plot) with the given number of
+    pixels. The levels of detail are computed when a plot is first requested
+    and then taken from RESULT_CACHE, so zooming into a time range only needs
+    the points of a finer level in that range. The first and last point are
+    always included, so the client knows the full time range.
+    """
+    time_col = lod_key[1]
+    times = plot[:, time_col]
+    if len(times) == 0:
+        return plot
+    if np.any(np.diff(times) < 0):
+        plot = plot[np.argsort(times, kind='mergesort')]
+        times = plot[:, time_col]
+    levels = RESULT_CACHE.get(lod_key)
+    if levels is None:
+        LOG.info('Building levels of detail for %s data points…', len(times))
+        levels = build_lod_levels(times, plot[:, 1])
+        RESULT_CACHE.put(lod_key, levels)
+    if etime <= stime:
+        etime = times[-1]
+    sel = select_lod(times, plot[:, 1], levels, stime, etime, pixels)
+    sel = np.unique(np.concatenate(([0], sel, [len(times) - 1])))
+    LOG.info('Selected %s of %s data points', len(sel), len(times))
+    return plot[sel]
+
 def make_graph(request):
     """
     Begins the process of parsing the request to calculate the points for the
     graph to plot on the client's screen. Iterates through each request in the
     request array.
     """
-    orig_dir = os.getcwd()
-    os.chdir(EXP_DIR)
     return_array = []
     result = 'Success'
     try:
         request = literal_eval(request)
         for map_entry in request:
             return_array = return_array + [process_map_request(map_entry),]
+            # Optional level of detail: pixels available for the time range
+            # [stime, etime] (time as shown on the graph)
+            return_array[-1]['lod'] = {
+                'pixels': int(map_entry['pixels']) if 'pixels' in map_entry else 0,
+                'stime': float(map_entry['stime']) if 'stime' in map_entry else 0.0,
+                'etime': float(map_entry['etime']) if 'etime' in map_entry else 0.0
+            }
     except Exception as exc:
         LOG.error('Error evaluating graph data points: ' + repr(exc))
         LOG.info(traceback.format_exc())
@@ -1373,6 +1919,8 @@ def make_graph(request):
         earliest = {}
         # Find earliest
         for data_set in return_array:
+            if data_set['plot'] is None:
+                continue
             metric = data_set['metrics']['y']
             if metric not in earliest:
                 earliest.update({metric:{}})
@@ -1384,18 +1932,30 @@ def make_graph(request):
                 earliest[metric][group] = minimum
         # Normalise times
         for data_set in return_array:
+            lod = data_set.pop('lod')
+            lod_key = data_set.pop('lod_key')
+            if data_set['plot'] is None:
+                continue
             metric = data_set['metrics']['y']
             group = data_set['group']
             plot = data_set['plot'][0]
             col = plot[:, 0]
             plot[:, 0] = col - np.full(fill_value=earliest[metric][group], shape=col.shape)
+            lod['points'] = len(plot)
+            if lod['pixels'] > 0 and lod_key is not None:
+                plot = select_plot_lod(plot, lod_key, lod['pixels'], lod['stime'], lod['etime'])
+            data_set['lod'] = lod
             data_set['plot'] = [plot.tolist(),]
-    finally:
-        os.chdir(orig_dir)
 
     return {'result': result, 'data': return_array}
 
 
+def get_cache_stats():
+    """
+    Returns the hit/miss counters and size of the result cache
+    """
+    return {'result': 'Success', 'cache': RESULT_CACHE.get_stats()}
+
 def load_default():
     """
     Returns the values specified when the fabric command was run as defaults for the
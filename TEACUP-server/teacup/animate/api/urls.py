@@ -33,8 +33,12 @@ from django.conf.urls import url
 urlpatterns = [
     url(r'^metrics/get/$', views.get_metrics),
     url(r'^metrics/$', views.get_metric_list),
+    url(r'^jobs/$', views.submit_job),
+    url(r'^jobs/(?P<job_id>[0-9a-f]+)/$', views.get_job),
+    url(r'^jobs/(?P<job_id>[0-9a-f]+)/result/$', views.get_job_result),
     url(r'^experiments/$', views.get_experiments),
     url(r'^graph/$', views.make_graph),
     url(r'^default/$', views.get_default_view),
-    url(r'^paths/$', views.get_paths)
+    url(r'^paths/$', views.get_paths),
+    url(r'^cache/$', views.get_cache_stats)
 ]
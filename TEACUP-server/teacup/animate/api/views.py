@@ -49,12 +49,28 @@ def get_metrics(request):
         return HttpResponseBadRequest()
 
 
+def submit_job(request):
+    if request.method == 'POST' and len(request.body) > 0:
+        return JsonResponse(teaplot.submit_extract_job(request.body));
+    else:
+        return HttpResponseBadRequest()
+
+def get_job(request, job_id):
+    return JsonResponse(teaplot.get_extract_job(job_id));
+
+def get_job_result(request, job_id):
+    return JsonResponse(teaplot.get_extract_job_result(job_id));
+
+
 def make_graph(request):
     if request.method == 'POST' and len(request.body) > 0:
         return JsonResponse(teaplot.make_graph(request.body));
     else:
         return HttpResponseBadRequest()
 
+def get_cache_stats(request):
+    return JsonResponse(teaplot.get_cache_stats());
+
 def get_default_view(request):
     return JsonResponse(teaplot.load_default());
 
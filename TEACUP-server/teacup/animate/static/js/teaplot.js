@@ -311,6 +311,9 @@ var space;
     };
 
     var flows = {};
+    /* Time range of the graphs (seconds) and number of the last graph request */
+    var graphTimeRange = 0.0;
+    var graphRequest = 0;
 
     var flowMappingRowTemplate = '\
 	<tr class="flowMapRow">\
@@ -1142,9 +1145,10 @@ var space;
     function updateDataSources() {
         //showLoadingPanel();
         config.src_filter = $('#metricsTabDataSourcesFilter').val();
+        /* Extraction runs as background job on the server, poll until it has finished */
         $.ajax({
             type : "POST",
-            url : "/api/metrics/get/",
+            url : "/api/jobs/",
             data : JSON.stringify({
                 'exp_id' : config.exp_id,
                 'src_filter' : config.src_filter,
@@ -1153,11 +1157,73 @@ var space;
             }),
             contentType : "application/json; charset=utf-8",
             dataType : "json",
-            success : updateDataSourcesSuccess,
-            failure : updateDataSourcesFailure,
+            success : function(result) {
+                if (result.result === 'Success') {
+                    showLoadingPanel();
+                    pollDataSourcesJob(result.job, 0, Date.now());
+                } else {
+                    updateDataSourcesSuccess(result);
+                }
+            },
+            error : function() {
+                updateDataSourcesFailure('Cannot submit extraction job');
+            },
         });
     }
 
+    /* Give up polling if the job status was not updated for this many milliseconds */
+    var JOB_POLL_TIMEOUT = 180000;
+
+    function pollDataSourcesJob(job, lastUpdate, lastChange) {
+        $.ajax({
+            type : "GET",
+            url : "/api/jobs/" + job + "/",
+            dataType : "json",
+            success : function(result) {
+                if (result.result !== 'Success') {
+                    updateDataSourcesSuccess(result);
+                } else if (result.job.state === 'done' || result.job.state === 'failed') {
+                    $.ajax({
+                        type : "GET",
+                        url : "/api/jobs/" + job + "/result/",
+                        dataType : "json",
+                        success : updateDataSourcesSuccess,
+                        error : function() {
+                            updateDataSourcesFailure('Cannot get result of extraction job');
+                        },
+                    });
+                } else {
+                    if (result.job.updated !== lastUpdate) {
+                        lastUpdate = result.job.updated;
+                        lastChange = Date.now();
+                    } else if (Date.now() - lastChange > JOB_POLL_TIMEOUT) {
+                        updateDataSourcesFailure('Extraction job is not responding');
+                        return;
+                    }
+                    showJobProgress(result.job);
+                    setTimeout(function() { pollDataSourcesJob(job, lastUpdate, lastChange); }, 1000);
+                }
+            },
+            error : function() {
+                updateDataSourcesFailure('Cannot get status of extraction job');
+            },
+        });
+    }
+
+    function showJobProgress(job) {
+        var text;
+        if (job.state === 'queued') {
+            text = 'Waiting for extraction...';
+        } else {
+            text = 'Extracting: ' + job.metrics_done + '/' + job.metrics_total + ' metrics, ' +
+                job.flows_done + ' flows';
+            if (job.eta !== null) {
+                text += ', ' + Math.ceil(job.eta) + ' s left';
+            }
+        }
+        $('.loadPanel .panel-body').text(text);
+    }
+
     function highest(data) {
         var y = 0, x = 0, z = 0;
         for ( var k in data) {
@@ -1171,13 +1237,19 @@ var space;
         return v(x, y, z);
     }
 
-    function getGraphSuccess(data) {
+    function getGraphSuccess(data, zoomed) {
 
         hideLoadingPanel(); 
         $('#flowSelection').modal('hide');
         $('.flowUpdateButton').prop('disabled', false); /* Changed */
 
         if (data.result === 'Success') {  
+            if (zoomed) {
+                /* Replace the plots, but keep axis ranges and zoom */
+                for ( var i in space.graphList) {
+                    space.graphList[i].deletePlots();
+                }
+            }
             var highestValues = {};
             var highestX = 0;
             var colours = {};
@@ -1206,7 +1278,7 @@ var space;
             }
 
             for ( var i in space.graphList) {
-                if (highestValues[i] !== undefined) {
+                if (highestValues[i] !== undefined && !zoomed) {
                     var graph = space.graphList[i];
                     graph.axisLabelRange.z.max = highestValues[i].z;
                     graph.axisLabelRange.y.max = highestValues[i].y;
@@ -1230,7 +1302,7 @@ var space;
                 }
                 dataSeries.colour = colours[map.flow];
                 dataSeries.xScale = graph.limits.x.max / graph.axisLabelRange.x.max;
-                dataSeries.zScale = highestValues[graphIndex].z === 0.0 ? 1.0 : (graph.limits.z.max / graph.axisLabelRange.z.max);
+                dataSeries.zScale = graph.axisLabelRange.z.max === 0.0 ? 1.0 : (graph.limits.z.max / graph.axisLabelRange.z.max);
                 var plot = new Plot(dataSeries, 0);
                 graph.addPlot(plot);
 
@@ -1242,7 +1314,16 @@ var space;
                     graph.setName(map.metric);
 
             }
-            updateStartAndEndTime(highestX);
+            if (zoomed) {
+                updateLabels();
+            } else {
+                graphTimeRange = highestX;
+                updateStartAndEndTime(highestX);
+                if (config.graph.x.min > 0.0 || config.graph.x.max < 100.0) {
+                    /* Start and end time given, fetch finer points */
+                    updateZoomedView();
+                }
+            }
 
             updateLegend(colours);
         } else {
@@ -1289,10 +1370,12 @@ var space;
 
     }
 
-    function updateView() {
+    function updateView(zoomed) {
         var i;
-        for (i in space.graphList) {
-            space.graphList[i].deletePlots();
+        if (!zoomed) {
+            for (i in space.graphList) {
+                space.graphList[i].deletePlots();
+            }
         }
         var data = [];
 
@@ -1323,22 +1406,52 @@ var space;
                     'scale' : (zmetric !== 'TIME' && zmetric !== 'NOTHING' ? config.yscale[zmetric] : 1.0)
                 }
             };
+            if (xmetric === 'TIME') {
+                /*
+                 * Server only returns the points needed to draw this many pixels,
+                 * when zoomed only for the time range shown
+                 */
+                mapData.pixels = window.innerWidth;
+                if (zoomed) {
+                    mapData.stime = config.graph.x.min / 100.0 * graphTimeRange;
+                    mapData.etime = config.graph.x.max / 100.0 * graphTimeRange;
+                }
+            }
 
             data.push(mapData);
         }
 
+        /* Ignore responses to older requests */
+        var request = ++graphRequest;
         $.ajax({
             type : "POST",
             url : "/api/graph/",
             data : JSON.stringify(data),
             contentType : "application/json; charset=utf-8",
             dataType : "json",
-            success : getGraphSuccess,
+            success : function(result) {
+                if (request === graphRequest) {
+                    getGraphSuccess(result, zoomed);
+                }
+            },
             failure : getGraphFailure,
         });
 
     }
 
+    /* Fetch the points of the time range shown after the x-axis was zoomed */
+    function updateZoomedView() {
+        var zoomedTime = false;
+        for ( var i in config.mapping) {
+            if (config.mapping[i].xaxis.metric === 'TIME') {
+                zoomedTime = true;
+            }
+        }
+        if (zoomedTime && graphTimeRange > 0.0) {
+            updateView(true);
+        }
+    }
+
     function updateFlows() {
 
         /* Save list of flow maps */
@@ -1794,6 +1907,9 @@ var space;
         $('.control-slider').on('slidestop', function(event, ui) {
             updateLabels();
         });
+
+        controlXMin.on('slidestop', updateZoomedView);
+        controlXMax.on('slidestop', updateZoomedView);
     }
 
     /* Russell Changes starts here */
@@ -1802,6 +1918,7 @@ var space;
     }
     
     function showLoadingPanel() {
+        $('.loadPanel .panel-body').text('Please wait...');
         $('.loadPanel').addClass('loadPanel-show');
     }
     /* Russell Changes ends here */
@@ -0,0 +1,155 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package bursts
+# Segmentation of time series into bursts (e.g. incast query/response bursts)
+#
+# Bursts are identified by index ranges over the rows of a data file, so a
+# time series does not need to be split into one file per burst. A burst is
+# passed to the plot functions as tuple (file name, first row, end row), where
+# the end row is not part of the burst.
+#
+# $Id$
+
+import numpy as np
+
+
+## Get index ranges of bursts
+#  @param times Timestamps
+#  @param burst_sep 0 no burst separation (one burst with all values),
+#                   > 0 new burst starts if time since previous value is at
+#                       least burst_sep seconds,
+#                   < 0 new burst starts if time since first value of burst
+#                       is at least abs(burst_sep) seconds
+#  @return List of tuples (first index, end index) of bursts
+def get_burst_ranges(times, burst_sep):
+
+    times = np.asarray(times, dtype=np.float64)
+    n = len(times)
+    if burst_sep == 0:
+        return [ (0, n) ]
+    if n == 0:
+        return []
+
+    if burst_sep > 0:
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(times) >= burst_sep) + 1))
+    else:
+        # the first value at least abs(burst_sep) after the burst start is the
+        # first value where the running maximum reaches the threshold, and the
+        # running maximum is sorted, so we only loop over bursts
+        run_max = np.maximum.accumulate(times)
+        gap = -burst_sep
+        starts = [ 0 ]
+        while True:
+            start = starts[-1]
+            first = times[start]
+            nxt = start + 1 + np.searchsorted(run_max[start + 1:], first + gap,
+                                              side='left')
+            # first + gap is rounded, so adjust to the same comparison as
+            # time - first >= gap
+            while nxt > start + 1 and run_max[nxt - 1] - first >= gap:
+                nxt -= 1
+            while nxt < n and run_max[nxt] - first < gap:
+                nxt += 1
+            if nxt >= n:
+                break
+            starts.append(nxt)
+        starts = np.array(starts, dtype=np.intp)
+
+    ends = np.concatenate((starts[1:], [n]))
+
+    return zip(starts.tolist(), ends.tolist())
+
+
+## Get value each burst is made relative to
+## The first burst is relative to the first value (or 0), each following burst
+## is relative to the last value of the previous burst.
+#  @param values Values
+#  @param ranges Burst ranges returned by get_burst_ranges()
+#  @param first Value the first burst is relative to
+#  @return Array with the base value of each row
+def _get_burst_bases(values, ranges, first):
+
+    bases = np.array([ first ] + [ values[start - 1] for start, end in ranges[1:] ],
+                     dtype=np.float64)
+
+    return np.repeat(bases, [ end - start for start, end in ranges ])
+
+
+## Make values relative to the start of each burst
+#  @param values Values
+#  @param ranges Burst ranges returned by get_burst_ranges()
+#  @param normalize 0 values unchanged,
+#                   1 first burst relative to the first value, each following
+#                     burst relative to the last value of the previous burst
+#  @return Array of values
+def normalise_bursts(values, ranges, normalize=0):
+
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0 or normalize != 1:
+        return values
+
+    return values - _get_burst_bases(values, ranges, values[0])
+
+
+## Get bytes acknowledged since the start of each burst
+## The first burst is relative to zero, each following burst is relative to
+## the last ACK number of the previous burst.
+#  @param acks ACK numbers (relative to the first ACK number of the flow)
+#  @param ranges Burst ranges returned by get_burst_ranges()
+#  @return Array of acknowledged bytes
+def get_burst_acked_bytes(acks, ranges):
+
+    acks = np.asarray(acks, dtype=np.float64)
+    if len(acks) == 0:
+        return acks
+
+    return acks - _get_burst_bases(acks, ranges, 0.0)
+
+
+## Get cumulative number of duplicate ACKs since the start of each burst
+## A duplicate ACK has the same ACK number as the preceding ACK. The count
+## restarts at each burst start and at each ACK with ACK number zero (the first
+## ACK of the flow).
+#  @param acks ACK numbers (relative to the first ACK number of the flow)
+#  @param ranges Burst ranges returned by get_burst_ranges()
+#  @return Array of duplicate ACK counts
+def get_burst_dupacks(acks, ranges):
+
+    acks = np.asarray(acks, dtype=np.float64)
+    n = len(acks)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    dups = np.concatenate(([False], acks[1:] == acks[:-1]))
+    resets = acks == 0
+    resets[[ start for start, end in ranges ]] = True
+    dups[resets] = False
+
+    counts = np.cumsum(dups)
+    last_reset = np.maximum.accumulate(np.where(resets, np.arange(n), 0))
+
+    return counts - counts[last_reset]
@@ -43,14 +43,16 @@ import os
 import socket
 import csv
 import tempfile
-import imp
+import hashlib
+import threading
+import numpy as np
 from subprocess import *
-import tempfile
 from fabric.api import task, warn, put, puts, get, local, run, execute, \
     settings, abort, hosts, env, runs_once, parallel
 import config
 from internalutil import mkdir_p
 from filefinder import get_testid_file_list
+from expmeta import get_dir_meta
 
 ## Create safe place to dump output from stderr of various shell processes
 stderrhack = os.tmpfile()
@@ -61,8 +63,13 @@ CLOCK_OFFSET_FILE_EXT = '_clock_offsets.txt'
 ## Extension for modified data file
 DATA_CORRECTED_FILE_EXT = '.tscorr'
 
-## Temporary unzipped config
-TMP_CONF_FILE = tempfile.mktemp(suffix='_oldconfig.py', dir='/tmp/')
+## Extension for file that records from which input a modified data file was
+## generated
+DATA_CORRECTED_STAMP_EXT = '.stamp'
+
+## Lock so that threads (e.g. of TeaPlot) don't generate clock offset files
+## at the same time
+clock_offsets_lock = threading.Lock()
 
 
 ## Get file with time offsets for each experiment host (TASK)
@@ -112,36 +119,15 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
 
         dir_name = os.path.dirname(tcpdump_files[0])
         # then look for tpconf_vars.log.gz file in that directory 
-        var_file = local('find -L %s -name "*tpconf_vars.log.gz"' % dir_name,
-                         capture=True)
+        meta = get_dir_meta(dir_name)
 
 	bc_addr = ''
         router_name = ''
 
-        if len(var_file) > 0:
+        if meta != None:
             # new approach without using config.py
-            # XXX no caching here yet, assume we only generate clockoffset file once
-            # per experiment 
-
-            # unzip archived file
-            local('gzip -cd %s > %s' % (var_file, TMP_CONF_FILE))
-
-            # load the TPCONF_variables into oldconfig
-            oldconfig = imp.load_source('oldconfig', TMP_CONF_FILE)
-
-            # remove temporary unzipped file 
-            try:
-                os.remove(TMP_CONF_FILE)
-                os.remove(TMP_CONF_FILE + 'c') # remove the compiled file as well
-            except OSError:
-                pass
-
-            try:
-                bc_addr = oldconfig.TPCONF_bc_ping_address
-            except AttributeError:
-                pass
-
-            router_name = oldconfig.TPCONF_router[0].split(':')[0]
+            bc_addr = meta['bc_ping_address']
+            router_name = meta['router_name']
             
         else:
             # old approach using config.py
@@ -238,8 +224,12 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
         mkdir_p(out_dir)
         out_name = out_dir + test_id + CLOCK_OFFSET_FILE_EXT
 
-        # write table of offsets (rows = time, cols = hosts)
-        f = open(out_name, 'w')
+        # write table of offsets (rows = time, cols = hosts) to temporary file
+        # and rename it, so other processes never read a partial file
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(out_name) or '.',
+                                        prefix='.tmp_',
+                                        suffix=CLOCK_OFFSET_FILE_EXT)
+        f = os.fdopen(fd, 'w')
         f.write('# ref_time' + host_str + '\n')
         for seq in sorted(diffs.keys()):
             if ref_times[seq] is not None:
@@ -260,6 +250,134 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
             f.write('\n')
 
         f.close()
+        os.chmod(tmp_name, 0644)
+        os.rename(tmp_name, out_name)
+
+
+## Clock offset tables already read, index is clock offset file name, value
+## is tuple (modification time, host names, reference times, offset matrix)
+clock_offsets_cache = {}
+
+
+## Read clock offset file, use cached table if file has not changed
+#  @param offs_fname Clock offset file name
+#  @return Tuple (host names, reference times, offset matrix), where the
+#          offset matrix has one column per host and missing offsets (NA)
+#          are replaced by the last offset observed (initially 0.0)
+def read_clock_offsets(offs_fname):
+
+    global clock_offsets_cache
+
+    try:
+        mtime = os.path.getmtime(offs_fname)
+        if offs_fname in clock_offsets_cache and \
+           clock_offsets_cache[offs_fname][0] == mtime:
+            return clock_offsets_cache[offs_fname][1:]
+
+        with open(offs_fname) as f:
+            offs_lines = f.read().splitlines()
+    except (IOError, OSError):
+        abort('Cannot open file %s' % offs_fname)
+
+    # first row is '# ref_time <host1> <host2> ...'
+    hosts = offs_lines[0].rstrip().split(' ')[2:]
+
+    ref_times = []
+    rows = []
+    for line in offs_lines[1:]:
+        fields = line.rstrip().split(' ')
+        if len(fields) < 2 or fields[0] == 'NA':
+            continue
+        ref_times.append(float(fields[0]))
+        rows.append(fields[1:])
+
+    offsets = np.zeros((len(rows), len(hosts)))
+    last_offs = np.zeros(len(hosts))
+    for i, row in enumerate(rows):
+        for j, offs in enumerate(row[:len(hosts)]):
+            # if we have no data our offset for correction will be the
+            # last offset observed
+            if offs != 'NA':
+                last_offs[j] = float(offs)
+        offsets[i] = last_offs
+
+    clock_offsets_cache[offs_fname] = (mtime, hosts, np.array(ref_times), offsets)
+
+    return clock_offsets_cache[offs_fname][1:]
+
+
+## Clock offset file digests, index is clock offset file name, value is
+## tuple (modification time, size, digest)
+clock_offsets_digests = {}
+
+
+## Get SHA1 digest of clock offset file, use cached digest if file has not
+## changed
+#  @param offs_fname Clock offset file name
+#  @return Hex digest
+def get_clock_offsets_digest(offs_fname):
+
+    global clock_offsets_digests
+
+    st = os.stat(offs_fname)
+    entry = clock_offsets_digests.get(offs_fname)
+    if entry is None or entry[0] != st.st_mtime or entry[1] != st.st_size:
+        with open(offs_fname, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        entry = (st.st_mtime, st.st_size, digest)
+        clock_offsets_digests[offs_fname] = entry
+
+    return entry[2]
+
+
+## Get stamp for a modified data file. The stamp identifies the input data
+## file version, the clock offsets and the parameters used.
+#  @param file_name Interim data file
+#  @param offs_fname Clock offset file name
+#  @param host_name Host the timestamps are from in the interim data file
+#  @param sep Separator used in interim data file
+#  @param offs_model Clock offset model
+#  @param offs_win Number of offsets averaged for offs_model 'mavg'
+#  @return Stamp string
+def _get_tscorr_stamp(file_name, offs_fname, host_name, sep, offs_model, offs_win):
+
+    st = os.stat(file_name)
+
+    return '%r %i %s %s %r %s %s\n' % (st.st_mtime, st.st_size,
+           get_clock_offsets_digest(offs_fname), host_name, sep, offs_model,
+           offs_win)
+
+
+## Compute offsets for timestamps of one host
+#  @param ref_times Reference times at which offsets were measured
+#  @param offsets Offsets measured for the host
+#  @param times Timestamps to compute offsets for
+#  @param offs_model 'step' each offset is valid from the time it was observed
+#                           until the time the next offset is observed
+#                    'interp' linear interpolation between observed offsets
+#                    'mavg' like step, but with moving average of the last
+#                           offs_win observed offsets
+#  @param offs_win Number of offsets averaged for offs_model 'mavg'
+#  @return Array of offsets, one for each timestamp
+def get_offsets(ref_times, offsets, times, offs_model='step', offs_win=5):
+
+    if offs_model == 'interp':
+        return np.interp(times, ref_times, offsets)
+
+    if offs_model == 'mavg':
+        offs_win = max(int(offs_win), 1)
+        csum = np.cumsum(np.concatenate(([0.0], offsets)))
+        idx = np.arange(1, len(offsets) + 1)
+        start = np.maximum(idx - offs_win, 0)
+        offsets = (csum[idx] - csum[start]) / (idx - start)
+    elif offs_model != 'step':
+        abort('Unknown clock offset model %s' % offs_model)
+
+    # the offset valid at time t is the last offset observed before t
+    idx = np.searchsorted(ref_times, times, side='left') - 1
+    idx[idx < 0] = 0
+
+    return offsets[idx]
 
 
 ## Adjust timestamps in interim data file (TASK)
@@ -268,11 +386,33 @@ def get_clock_offsets(exp_list='experiments_completed.txt',
 #  @param host_name Host the timestamps are from in the interim data file
 #  @param sep Separator used in interim data file
 #  @param out_dir Output directory for results
+#  @param offs_model Model used for clock offsets between the observations,
+#                    'step', 'interp' or 'mavg' (see get_offsets()). If not
+#                    specified TPCONF_clock_offset_model is used if set in
+#                    config, otherwise 'step'
+#  @param offs_win Number of offsets averaged for offs_model 'mavg'. If not
+#                  specified TPCONF_clock_offset_window is used if set in
+#                  config, otherwise 5
 #  @return Name of file with corrected timestamps
 @task
-def adjust_timestamps(test_id='', file_name='', host_name='', sep=' ', out_dir=''):
+def adjust_timestamps(test_id='', file_name='', host_name='', sep=' ', out_dir='',
+                      offs_model='', offs_win=''):
     "Adjust timestamps in data file based on observed clock offsets"
 
+    if offs_model == '':
+        offs_model = 'step'
+        try:
+            offs_model = config.TPCONF_clock_offset_model
+        except AttributeError:
+            pass
+
+    if offs_win == '':
+        offs_win = 5
+        try:
+            offs_win = config.TPCONF_clock_offset_window
+        except AttributeError:
+            pass
+
     # out_dir is the user-specified out_dir we pass on to get_clock_offsets()
     if len(out_dir) > 0 and out_dir[-1] != '/':
         out_dir += '/'
@@ -293,8 +433,9 @@ def adjust_timestamps(test_id='', file_name='', host_name='', sep=' ', out_dir='
 
     #print(offs_fname)
 
-    if not os.path.isfile(offs_fname):
-        execute(get_clock_offsets, test_id=test_id, out_dir=out_dir)
+    with clock_offsets_lock:
+        if not os.path.isfile(offs_fname):
+            execute(get_clock_offsets, test_id=test_id, out_dir=out_dir)
 
     if not os.path.isfile(offs_fname):
         # give up and just make a copy of the existing data, so we have a file
@@ -309,68 +450,59 @@ def adjust_timestamps(test_id='', file_name='', host_name='', sep=' ', out_dir='
 
         return new_fname
 
-    host_times = []
-    last_offs = 0.0
+    # skip if data file was already corrected with the same input
+    stamp_fname = new_fname + DATA_CORRECTED_STAMP_EXT
     try:
-        with open(offs_fname) as f:
-            offs_lines = f.readlines()
-
-            # find column (note # is first column in first row
-            host_col = -1
-            for col in offs_lines[0].rstrip().split(' '):
-                if col == host_name:
-                    break
-
-                host_col += 1
-
-            #print(host_name)
-            #print(host_col)
-
-            for line in offs_lines[1:]:
-                line = line.rstrip()
-                ref_time = line.split(' ')[0]
-                offs = line.split(' ')[host_col]
-                # if we have no data our offset for correction will be the
-                # last offset != zero otherwise it will be the offset measured
-                if offs == 'NA':
-                    offs = last_offs
-                else:
-                    offs = float(offs)
-                    last_offs = offs
+        stamp = _get_tscorr_stamp(file_name, offs_fname, host_name, sep,
+                                  offs_model, offs_win)
+    except OSError:
+        abort('Cannot open file %s' % file_name)
+
+    if os.path.isfile(new_fname) and os.path.isfile(stamp_fname):
+        try:
+            with open(stamp_fname) as f:
+                if f.read() == stamp:
+                    return new_fname
+        except IOError:
+            pass
+
+    hosts, ref_times, offsets = read_clock_offsets(offs_fname)
+    if len(ref_times) == 0:
+        abort('No clock offsets in file %s' % offs_fname)
 
-                # XXX instead of using the instantenous offset values we may
-                # want to do something better in the future, such as using
-                # a weighted moving average etc.
-                host_times.append((ref_time, offs))
+    if host_name not in hosts:
+        abort('No clock offsets for host %s in file %s' % (host_name, offs_fname))
+    host_col = hosts.index(host_name)
 
+    try:
+        with open(file_name) as f:
+            lines = f.read().splitlines()
     except IOError:
-        abort('Cannot open file %s' % offs_fname)
+        abort('Cannot open file %s' % file_name)
 
-    reader = csv.reader(open(file_name, 'r'), delimiter=sep)
-    fout = open(new_fname, 'w')
-
-    # index to curr_ref_time
-    curr = 0
-    for line in reader:
-        time = line[0]
-
-        # find the right time, we assume here that each offset is
-        # valid from the time it was observed until the time the next
-        # offset is observed
-        while host_times[curr][0] < time or host_times[curr][0] == 'NA':
-            curr += 1
-            if curr == len(host_times):
-                break
-            
-        if curr > 0 and host_times[curr - 1][0] != 'NA':
-            curr -= 1
+    # split off the timestamp, the rest of each line is copied unchanged
+    parts = [ line.split(sep, 1) for line in lines if line != '' ]
+    times = np.array([ p[0] for p in parts ], dtype=np.float64)
+    rests = [ p[1] if len(p) > 1 else '' for p in parts ]
 
-        new_time = float(time) - host_times[curr][1]
+    new_times = times - get_offsets(ref_times, offsets[:, host_col], times,
+                                    offs_model, offs_win)
 
-        fout.write('{0:.6f}'.format(new_time) + sep)
-        fout.write(sep.join(line[1:]))
-        fout.write('\n')
+    # remove old stamp first, so a partially written file is never reused
+    try:
+        os.remove(stamp_fname)
+    except OSError:
+        pass
 
-    fout.close()
+    with open(new_fname, 'w') as fout:
+        fout.writelines([ '%.6f%s%s\n' % (t, sep, rest)
+                          for t, rest in zip(new_times.tolist(), rests) ])
+
+    try:
+        with open(stamp_fname, 'w') as f:
+            f.write(stamp)
+    except IOError:
+        # no stamp means we just correct again next time
+        pass
 
     return new_fname
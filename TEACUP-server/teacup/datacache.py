@@ -0,0 +1,140 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package datacache
+# Binary sidecar files for interim data files
+#
+# The first time an interim data file (e.g. .rtts, .psiz, .acks, .tscorr) is
+# loaded, the parsed data is saved as NumPy array next to it (file name plus
+# .npy). The sidecar is memory-mapped on later loads, so the text file does not
+# need to be parsed again. The text files remain the primary data for the R
+# scripts and shell tools. A small stamp file records from which version of
+# the text file a sidecar was generated, so sidecars of changed text files are
+# never used.
+#
+# $Id$
+
+import os
+import thread
+from cStringIO import StringIO
+import numpy as np
+
+
+## Extension of binary sidecar file
+SIDECAR_FILE_EXT = '.npy'
+## Extension of file that records from which input a sidecar was generated
+SIDECAR_STAMP_EXT = '.stamp'
+
+
+## Get stamp of text file
+#  @param fname File name
+#  @return Stamp string
+def _get_stamp(fname):
+
+    st = os.stat(fname)
+
+    return '%r %i\n' % (st.st_mtime, st.st_size)
+
+
+## Count lines of text that are not empty
+#  @param text Text
+#  @return Number of lines
+def _count_data_lines(text):
+
+    num_lines = 0
+    for line in StringIO(text):
+        if not line.isspace():
+            num_lines += 1
+
+    return num_lines
+
+
+## Parse text data file with comma or whitespace separated numeric columns
+#  @param fname File name
+#  @return Two-dimensional array (one row per line)
+def parse_data_file(fname):
+
+    with open(fname) as f:
+        text = f.read().replace(',', ' ')
+
+    first_line = text.lstrip('\n').split('\n', 1)[0]
+    num_cols = len(first_line.split())
+    if num_cols == 0:
+        return np.zeros((0, 0))
+
+    values = np.fromstring(text, dtype=np.float64, sep=' ')
+    # fromstring stops at the first field that is not a number, so check that
+    # we got all rows (counting lines does not need a copy of the text, only
+    # count the non-empty lines if there are empty lines)
+    num_rows = text.count('\n')
+    if not text.endswith('\n'):
+        num_rows += 1
+    if len(values) != num_rows * num_cols:
+        num_rows = _count_data_lines(text)
+    if len(values) != num_rows * num_cols:
+        raise ValueError('Cannot parse data file %s' % fname)
+
+    return values.reshape(-1, num_cols)
+
+
+## Load data file, use binary sidecar if it is up to date
+## If there is no valid sidecar the text file is parsed and a sidecar is
+## written (if the directory is writable).
+#  @param fname File name
+#  @return Two-dimensional array (one row per line), read-only if memory-mapped
+def load_data_file(fname):
+
+    sidecar_fname = fname + SIDECAR_FILE_EXT
+    stamp_fname = sidecar_fname + SIDECAR_STAMP_EXT
+    stamp = _get_stamp(fname)
+
+    try:
+        with open(stamp_fname) as f:
+            if f.read() == stamp:
+                return np.load(sidecar_fname, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        pass
+
+    data = parse_data_file(fname)
+
+    # write sidecar under temporary name first, so that concurrent loads never
+    # see a partially written file
+    tmp_suffix = '.%i.%i.tmp' % (os.getpid(), thread.get_ident())
+    try:
+        # remove old stamp first, so an outdated sidecar is never used
+        if os.path.exists(stamp_fname):
+            os.remove(stamp_fname)
+        with open(sidecar_fname + tmp_suffix, 'wb') as f:
+            np.save(f, data)
+        os.rename(sidecar_fname + tmp_suffix, sidecar_fname)
+        with open(stamp_fname + tmp_suffix, 'w') as f:
+            f.write(stamp)
+        os.rename(stamp_fname + tmp_suffix, stamp_fname)
+    except (IOError, OSError):
+        # directory may not be writable, just parse again next time
+        pass
+
+    return data
@@ -0,0 +1,185 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package expmeta
+# Experiment metadata (hosts, internal/external address map, router name and
+# broadcast ping address) read from the <test_id_pfx>_tpconf_vars.log.gz file
+# of an experiment
+#
+# The variables file is parsed once and the metadata is saved as
+# <test_id_pfx>_tpconf_vars.json next to it, together with the modification
+# time and size of the variables file. Later lookups (also by other processes)
+# load the JSON file, and within a process the metadata is kept in memory.
+#
+# $Id$
+
+import os
+import gzip
+import json
+import tempfile
+
+from filefinder import get_testid_file_list, find_files
+
+
+## Version of the metadata file format
+META_VERSION = 1
+## Extension of metadata file (replaces .log.gz of the variables file)
+META_FILE_EXT = '.json'
+
+## Metadata of experiments, indexed by test ID and by directory
+_meta_cache = {}
+
+
+## Parse variables file of experiment
+#  @param var_file Name of <test_id_pfx>_tpconf_vars.log.gz file
+#  @return Metadata dictionary
+def _parse_var_file(var_file):
+
+    # the file has one TPCONF_<name> = <repr of value> line per variable
+    tpconf = {}
+    with gzip.open(var_file) as f:
+        exec(f.read(), tpconf)
+
+    host_internal_ip = tpconf.get('TPCONF_host_internal_ip', {})
+
+    # reverse map from first internal address to external address
+    internal_external = {}
+    for external, internal in sorted(host_internal_ip.items()):
+        if len(internal) > 0:
+            internal_external[internal[0]] = external
+
+    router_name = ''
+    if len(tpconf.get('TPCONF_router', [])) > 0:
+        router_name = tpconf['TPCONF_router'][0].split(':')[0]
+
+    return {
+        'host_internal_ip': host_internal_ip,
+        'internal_external': internal_external,
+        'hosts': list(tpconf.get('TPCONF_hosts', [])) +
+                 list(tpconf.get('TPCONF_router', [])),
+        'router_name': router_name,
+        'bc_ping_address': tpconf.get('TPCONF_bc_ping_address', ''),
+    }
+
+
+## Convert unicode strings returned by the JSON parser to byte strings, like
+## the rest of the code uses
+#  @param value Value (can be nested lists and dictionaries)
+#  @return Converted value
+def _to_str(value):
+
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return [ _to_str(v) for v in value ]
+    elif isinstance(value, dict):
+        return dict((_to_str(k), _to_str(v)) for k, v in value.items())
+    else:
+        return value
+
+
+## Load metadata file if it is up to date
+#  @param meta_file Name of metadata file
+#  @param stamp List [mtime, size] of variables file
+#  @return Metadata dictionary or None
+def _load_meta_file(meta_file, stamp):
+
+    try:
+        with open(meta_file) as f:
+            data = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if data.get('version') != META_VERSION or data.get('stamp') != stamp:
+        return None
+
+    return _to_str(data['meta'])
+
+
+## Save metadata file (atomically, so concurrent readers see the old or the
+## new file)
+#  @param meta_file Name of metadata file
+#  @param stamp List [mtime, size] of variables file
+#  @param meta Metadata dictionary
+def _save_meta_file(meta_file, stamp, meta):
+
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(meta_file) or '.',
+                                        prefix='.tmp_', suffix=META_FILE_EXT)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({ 'version': META_VERSION, 'stamp': stamp, 'meta': meta },
+                      f, sort_keys=True)
+        os.rename(tmp_name, meta_file)
+    except (IOError, OSError):
+        # if we can't write to the experiment directory we parse the variables
+        # file again next time
+        pass
+
+
+## Get metadata of experiments in directory
+#  @param dir_name Directory with the files of the experiment
+#  @return Metadata dictionary (host_internal_ip: map of external to internal
+#          addresses, internal_external: map of internal to external address,
+#          hosts: set of hosts and routers, router_name: name of first router,
+#          bc_ping_address: broadcast ping address or '') or None if the
+#          experiment has no variables file (TEACUP before version 0.9)
+def get_dir_meta(dir_name):
+
+    if dir_name in _meta_cache:
+        return _meta_cache[dir_name]
+
+    meta = None
+    var_files = find_files(dir_name, '*tpconf_vars.log.gz')
+    if len(var_files) > 0:
+        var_file = var_files[0]
+        st = os.stat(var_file)
+        stamp = [ st.st_mtime, st.st_size ]
+        meta_file = var_file[:-len('.log.gz')] + META_FILE_EXT
+
+        meta = _load_meta_file(meta_file, stamp)
+        if meta is None:
+            meta = _parse_var_file(var_file)
+            _save_meta_file(meta_file, stamp, meta)
+
+        meta['hosts'] = set(meta['hosts'])
+
+    _meta_cache[dir_name] = meta
+
+    return meta
+
+
+## Get metadata of experiment
+#  @param test_id Test ID
+#  @return Metadata dictionary (see get_dir_meta()) or None if the experiment
+#          has no variables file
+def get_experiment_meta(test_id):
+
+    if test_id not in _meta_cache:
+        # find the directory by looking for mandatory uname file
+        uname_file = get_testid_file_list('', test_id, 'uname.log.gz', '')
+        _meta_cache[test_id] = get_dir_meta(os.path.dirname(uname_file[0]))
+
+    return _meta_cache[test_id]
@@ -142,6 +142,11 @@ try:
 except ImportError:
     pass
 
+try:
+    from incremental import analyse_watch
+except ImportError:
+    pass
+
 try:
     from analyse import extract_pktloss, analyse_pktloss
 except ImportError:
@@ -414,6 +419,8 @@ def run_experiment_multiple(test_id='', resume='0', *nargs, **kwargs):
 # @param lnames Legend/Flow names to show on the graphs (semicolon-separated)
 # @param stime Default start time in seconds for a new graph
 # @param etime Default end time in seconds for a new graph
+# @param cache_size Maximum size in MB of the data cached in each process
+# @param job_workers Number of background extraction jobs run by each process
 #
 @task
 def animate(address='127.0.0.1',
@@ -433,7 +440,9 @@ def animate(address='127.0.0.1',
             siftr='0',
             web10g='0',
             stime='0',
-            etime='0'):
+            etime='0',
+            cache_size='512',
+            job_workers='2'):
     """
     Starts a Django-based HTTP server for visualisation in the browser
     """
@@ -459,6 +468,9 @@ def animate(address='127.0.0.1',
     env['TEACUP_ETIME'] = etime
     env['TEACUP_STIME'] = stime
 
+    env['TEACUP_CACHE_SIZE'] = cache_size
+    env['TEACUP_JOB_WORKERS'] = job_workers
+
 
     server = Popen(['uwsgi',
                    '--http', '%s:%s' % (address, port),
@@ -466,6 +478,7 @@ def animate(address='127.0.0.1',
                    '--processes', '%s' % (processes, ),
                    '--threads', '%s' % (threads, ),
                    '--master',
+                   '--enable-threads', # Extraction jobs run in background threads
                    '--static-map', '/static=%s' % (os.path.join(config.TPCONF_script_path, animate_dir, 'static'), ),
                    '--wsgi-file', 'TeaPlot/wsgi.py',
                    '--stats', '127.0.0.1:9191' # Status reporting for use with uwsgitop
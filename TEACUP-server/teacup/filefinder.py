@@ -27,48 +27,201 @@
 ## @package filefinder
 # Functions to find files (used by analysis functions) 
 #
+# Files are found with an in-memory index of the directories searched (like
+# find -L, symbolic links are followed). Each directory is only listed again
+# if its modification time changes, and names are looked up by prefix or
+# suffix with a binary search, so repeated searches in large result
+# directories don't need to scan the file system. Results are sorted in byte
+# order like the output of find piped through LC_ALL=C sort.
+#
 # $Id$
 
 import os
+import time
+import bisect
+import fnmatch
+import subprocess
+import threading
 import config
 from fabric.api import task, warn, local, run, execute, abort, hosts, env
 from internalutil import _list
+from metadb import lookup_experiment_dir, update_experiment_dir
+
+## Directory where searches of each thread start by default
+_search_base = threading.local()
+
+## Index of directories: absolute path -> (modification time, time listed,
+## sorted names, sorted reversed names, set of subdirectory names)
+_dir_index = {}
+## A directory listed less than this many seconds after it was modified is
+## listed again on the next search, since files created in the same
+## (coarse) modification time interval would be missed otherwise
+DIR_INDEX_RACY_SECS = 2.0
+
+
+## Set directory where searches of the current thread start if no search
+## directory is specified (default is the current directory). This allows
+## threads to search different directories without changing the current
+## directory of the process.
+#  @param directory Directory
+def set_search_dir(directory):
+
+    _search_base.directory = directory
+
+
+## Get directory where searches of the current thread start by default
+#  @return Directory
+def get_search_dir():
+
+    return getattr(_search_base, 'directory', '.')
+
 
-# 
-# Directory cache functions
 #
+# Directory index functions
+#
+
+## Get index entry of directory, list directory if it changed
+#  @param path Absolute path of directory
+#  @return Index entry or None if directory cannot be read
+def _get_dir_entry(path):
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    entry = _dir_index.get(path)
+    if entry is not None and entry[0] == mtime and \
+       entry[1] >= mtime + DIR_INDEX_RACY_SECS:
+        return entry
+
+    now = time.time()
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return None
+
+    # only check the type of new names
+    old_names = set(entry[2]) if entry is not None else set()
+    old_subdirs = entry[4] if entry is not None else set()
+    subdirs = set()
+    for name in names:
+        if name in old_names:
+            if name in old_subdirs:
+                subdirs.add(name)
+        elif os.path.isdir(os.path.join(path, name)):
+            subdirs.add(name)
+
+    entry = (mtime, now, names, sorted(name[::-1] for name in names), subdirs)
+    _dir_index[path] = entry
+
+    return entry
+
+
+## Get names in sorted list that start with prefix
+#  @param names Sorted list of names
+#  @param prefix Prefix
+#  @return List of names
+def _get_prefix_range(names, prefix):
+
+    start = bisect.bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+        end += 1
+
+    return names[start:end]
+
+
+## Get names of directory matching shell pattern
+#  @param entry Index entry of directory
+#  @param pattern Shell pattern (like find -name)
+#  @return List of matching names
+def _match_names(entry, pattern):
+
+    # literal prefix and suffix of pattern (no suffix if pattern has character
+    # classes, which can contain wildcards)
+    wildcards = [ pos for pos, c in enumerate(pattern) if c in '*?[' ]
+    if len(wildcards) == 0:
+        prefix = suffix = pattern
+    else:
+        prefix = pattern[:wildcards[0]]
+        suffix = pattern[wildcards[-1] + 1:] if '[' not in pattern else ''
+
+    if len(prefix) >= len(suffix):
+        candidates = _get_prefix_range(entry[2], prefix)
+    else:
+        candidates = [ name[::-1] for name in
+                       _get_prefix_range(entry[3], suffix[::-1]) ]
+
+    return [ name for name in candidates
+             if fnmatch.fnmatchcase(name, pattern) ]
+
+
+## Find files and directories below directory whose names match a shell pattern
+## (like find -L <directory> -name <pattern> | LC_ALL=C sort)
+#  @param directory Directory where search starts
+#  @param pattern Shell pattern the names must match
+#  @return List of path names (starting with directory, but without leading ./)
+#          sorted in byte order
+def find_files(directory, pattern):
+
+    found = []
+    if fnmatch.fnmatchcase(os.path.basename(directory.rstrip('/')) or '/',
+                           pattern):
+        found.append(directory)
+
+    # directories to search with the real paths of their parent directories
+    # (to detect symbolic link loops)
+    todo = [ (directory, ()) ]
+    while len(todo) > 0:
+        path, parents = todo.pop()
+        entry = _get_dir_entry(os.path.abspath(path))
+        if entry is None:
+            continue
+
+        parents += (os.path.realpath(path), )
+        loops = set(name for name in entry[4] if
+                    os.path.realpath(os.path.join(path, name)) in parents)
+
+        found += [ os.path.join(path, name)
+                   for name in _match_names(entry, pattern) if name not in loops ]
+        todo += [ (os.path.join(path, name), parents)
+                  for name in sorted(entry[4] - loops, reverse=True) ]
+
+    # sort full paths once, names of a directory are found before the names
+    # in its subdirectories (e.g. 'z' before 'a/z')
+    return sorted(f[2:] if f.startswith('./') else f for f in found)
+
+
+## Filter list of files through shell commands
+#  @param file_list List of file names
+#  @param pipe_cmd Shell command(s) reading file names from stdin
+#  @return List of file names output by the command(s)
+def _pipe_file_list(file_list, pipe_cmd):
 
-## Cache file name
-CACHE_FILE_NAME = 'teacup_dir_cache.txt'
-## Cache
-dir_cache = {}
+    # file lists of find_files() are already sorted
+    if pipe_cmd == '' or pipe_cmd == 'LC_ALL=C sort':
+        return file_list
 
-## Read cachfile if exists
-def read_dir_cache():
+    proc = subprocess.Popen(pipe_cmd, shell=True, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    out = proc.communicate(''.join(f + '\n' for f in file_list))[0]
 
-    if not os.path.isfile(CACHE_FILE_NAME):
-        return
+    return _list(out)
 
-    with open(CACHE_FILE_NAME, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            fields = line.split()
-            dir_cache[fields[0]] = fields[1]
 
+# 
+# Directory cache functions
+#
 
-## Append to cache if entry not in there yet 
+## Append to cache if entry not in there yet. The cache is the metadata
+## database, entries become invalid when the files of the experiment are moved.
 #  @param test_id Test ID
 #  @param directory Directory which has files of the experiment with ID = test ID
 def append_dir_cache(test_id, directory):
 
-    if test_id not in dir_cache:
-        try:
-            with open(CACHE_FILE_NAME, 'a') as f:
-                f.write('%s %s\n' % (test_id, directory))
-        except:
-            # if we can't write to the file then bad luck, user needs to fix permission,
-            # but ensure we don't crash
-            pass
+    if lookup_experiment_dir(test_id) == None:
+        update_experiment_dir(test_id, directory)
 
 
 ## Perform cache lookup, if we have entry for test id return directory. Otherwise
@@ -76,12 +229,9 @@ def append_dir_cache(test_id, directory):
 #  @param test_id Test ID
 def lookup_dir_cache(test_id):
 
-    # load cache first if cache is empty
-    if len(dir_cache) == 0:
-        read_dir_cache()
-
-    if test_id in dir_cache:
-        return dir_cache[test_id]
+    directory = lookup_experiment_dir(test_id)
+    if directory != None:
+        return directory
     else:
         return '.'
 
@@ -119,20 +269,15 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
 
     file_list = []
 
-    if pipe_cmd != '':
-        pipe_cmd = ' | ' + pipe_cmd
-
     # if search dir is not specified try to find it in cache
     if search_dir == '.':
         search_dir = lookup_dir_cache(test_id)
 
         # if not in cache try to locate the directory based on the uname file
         if search_dir == '.':
-            _files = _list(
-                local(
-                    'find -L %s -name "%s*uname.log*" -print | sed -e "s/^\.\///"%s' %
-                    (search_dir, test_id, pipe_cmd),
-                    capture=True))
+            search_dir = get_search_dir()
+            _files = _pipe_file_list(
+                find_files(search_dir, '%s*uname.log*' % test_id), pipe_cmd)
             if len(_files) > 0:
                 search_dir = os.path.dirname(_files[0])
                 append_dir_cache(test_id, search_dir)
@@ -147,11 +292,8 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
             abort('Must specify test_id parameter')
 
         for test_id in test_id_arr:
-            _files = _list(
-                local(
-                    'find -L %s -name "%s*%s" -print | sed -e "s/^\.\///"%s' %
-                    (search_dir, test_id, file_ext, pipe_cmd),
-                    capture=True))
+            _files = _pipe_file_list(
+                find_files(search_dir, '%s*%s' % (test_id, file_ext)), pipe_cmd)
 
             _files = filter_duplicates(_files)
  
@@ -165,11 +307,7 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
                 lines = f.readlines()
             for fname in lines:
                 fname = fname.rstrip()
-                _files = _list(
-                    local(
-                        'find -L %s -name "%s" -print | sed -e "s/^\.\///"' %
-                        (search_dir, fname),
-                        capture=True))
+                _files = find_files(search_dir, fname)
 
                 _files = filter_duplicates(_files)
 
@@ -179,8 +317,7 @@ def get_testid_file_list(file_list_fname='', test_id='', file_ext='', pipe_cmd='
             abort('Cannot open experiment list file %s' % file_list_fname)
 
     if not no_abort and len(file_list) == 0:
-        abort('Cannot find any matching data files.\n'
-              'Remove outdated teacup_dir_cache.txt if files were moved.') 
+        abort('Cannot find any matching data files.')
 
     return file_list
 
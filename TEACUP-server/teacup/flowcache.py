@@ -32,32 +32,11 @@
 import os
 import config
 from fabric.api import task, warn, local, run, execute, abort, hosts, env
+from metadb import lookup_flows, update_flows
 
 
-## Cache file name
-CACHE_FILE_NAME = 'teacup_flow_cache.txt'
-## Flow cache. Index is the file name for which we have flows cached 
-## (e.g. tcpdump file), value is a list of flows (which can be empty) 
-flow_cache = {}
-
-## Read cache file if exists
-def read_flow_cache():
-
-    if not os.path.isfile(CACHE_FILE_NAME):
-        return
-
-    with open(CACHE_FILE_NAME, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            fields = line.split()
-            if len(fields) == 2:
-                flow_cache[fields[0]] = fields[1].split(';')
-            else:
-                flow_cache[fields[0]] = []
-
-
-## Append to cache if entry not in there yet. note that flows may be empty in which
-## case the flow field in the cache file will be empty
+## Append to cache if entry not in there yet. The cache is the metadata
+## database, entries become invalid when the file changes.
 #  @param fname File name
 #  @param flows List of flows (5-tuples)
 def append_flow_cache(fname, flows):
@@ -66,14 +45,8 @@ def append_flow_cache(fname, flows):
     if len(flows) == 0:
         return
 
-    if fname not in flow_cache:
-        try:
-            with open(CACHE_FILE_NAME, 'a') as f:
-                f.write('%s %s\n' % (fname, ';'.join(flows)))
-        except:
-            # if we can't write to the file then bad luck, user needs to fix permission,
-            # but ensure we don't crash
-            pass
+    if lookup_flows(fname) == None:
+        update_flows(fname, flows)
 
 
 ## Perform cache lookup. If we have entry for file name return list of flows that can be
@@ -82,12 +55,4 @@ def append_flow_cache(fname, flows):
 #  @return List of flows (semicolon separated) or None
 def lookup_flow_cache(fname):
 
-    # load cache first if cache is empty
-    if len(flow_cache) == 0:
-        read_flow_cache()
-
-    if fname in flow_cache:
-        return flow_cache[fname]
-    else:
-        return None 
-
+    return lookup_flows(fname)
@@ -0,0 +1,371 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package flowstats
+# Summary statistics of the data series of interim data files (one file per
+# experiment, flow and metric), so comparisons across experiments don't need
+# to load the raw data again
+#
+# The statistics of a file are computed from the same series the R script
+# plot_cmp_experiments.R plots (scaled, differences, aggregated, time window)
+# and stored in the metadata database (see metadb). They are only valid as long
+# as the data file does not change. Besides count, mean, median, quantiles,
+# minimum and maximum the statistics include the box plot statistics of R's
+# boxplot() and a sketch of the value distribution. Sketches of different
+# series can be merged to estimate quantiles of the merged series (with a
+# relative error of SKETCH_ACCURACY).
+#
+# $Id$
+
+import json
+import math
+import numpy as np
+
+from datacache import load_data_file
+from aggregation import interval_aggregate
+from metadb import lookup_stats, update_stats
+
+
+## Version of statistics (change if the computation changes)
+STATS_VERSION = 1
+## Quantiles stored for each series
+QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+## Relative accuracy of quantiles estimated from sketches
+SKETCH_ACCURACY = 0.01
+## Ratio between sketch bucket boundaries
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+
+## Get data series like plot_cmp_experiments.R without the time window
+#  @param fname Data file name
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr '1' aggregate sum (throughput), '2' aggregate percentage
+#              (packet loss), '' or '0' no aggregation
+#  @param diff '1' use differences of consecutive values
+#  @param win_size Aggregation window size in seconds
+#  @param int_factor Aggregation oversampling factor
+#  @return Tuple (array of times relative to first timestamp, array of values,
+#          tuple (first timestamp, last timestamp) or None if no values)
+def _get_full_series(fname, yindex=2, yscaler=1.0, aggr='', diff='',
+                     win_size=1.0, int_factor=4):
+
+    data = load_data_file(fname)
+    if data.size == 0:
+        return (np.empty(0), np.empty(0), None)
+
+    times = np.array(data[:, 0])
+    values = np.array(data[:, yindex - 1])
+
+    # filter max int values (e.g. tcp rtt estimate is set to max int on
+    # windows for non-smoothed)
+    valid = values < 4294967295
+    times = times[valid]
+    values = values[valid] * yscaler
+    if len(times) == 0:
+        return (times, values, None)
+
+    time_range = (float(times.min()), float(times.max()))
+    times = times - times.min()
+
+    if diff == '1':
+        values = np.diff(values)
+        times = times[1:]
+
+    if aggr in ('1', '2'):
+        (times, values) = interval_aggregate(times, values, win_size, int_factor,
+                                             'sum' if aggr == '1' else 'percentage')
+
+    return (times, values, time_range)
+
+
+## Get data series like plot_cmp_experiments.R
+#  @param fname Data file name
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr '1' aggregate sum (throughput), '2' aggregate percentage
+#              (packet loss), '' or '0' no aggregation
+#  @param diff '1' use differences of consecutive values
+#  @param stime Start of time window in seconds (relative to first timestamp)
+#  @param etime End of time window in seconds (0.0 means no end)
+#  @param win_size Aggregation window size in seconds
+#  @param int_factor Aggregation oversampling factor
+#  @return Array of values
+def get_series(fname, yindex=2, yscaler=1.0, aggr='', diff='', stime=0.0,
+               etime=0.0, win_size=1.0, int_factor=4):
+
+    (times, values, time_range) = _get_full_series(fname, yindex, yscaler, aggr,
+                                                   diff, win_size, int_factor)
+
+    if stime > 0 or etime > 0:
+        window = times >= stime
+        if etime > 0:
+            window &= times <= etime
+        values = values[window]
+
+    return values
+
+
+## Get time range of data series, compute and store it if not in database
+#  @param fname Data file name
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr '1' aggregate sum (throughput), '2' aggregate percentage
+#              (packet loss), '' or '0' no aggregation
+#  @param diff '1' use differences of consecutive values
+#  @param win_size Aggregation window size in seconds
+#  @param int_factor Aggregation oversampling factor
+#  @return List [first timestamp, last timestamp, last time of aggregated
+#          series (relative to first timestamp)] or None if no values
+def get_time_range(fname, yindex=2, yscaler=1.0, aggr='', diff='',
+                   win_size=1.0, int_factor=4):
+
+    params = 'range %i %i %r %s %s %r %r' % (STATS_VERSION, yindex, yscaler,
+             aggr, diff, win_size, int_factor)
+
+    time_range = lookup_stats(fname, params)
+    if time_range is not None:
+        return json.loads(time_range)
+
+    (times, values, time_range) = _get_full_series(fname, yindex, yscaler, aggr,
+                                                   diff, win_size, int_factor)
+    if time_range is not None:
+        time_range = list(time_range) + \
+            [ float(times.max()) if len(times) > 0 else None ]
+    update_stats(fname, params, json.dumps(time_range))
+
+    return time_range
+
+
+## Get time window of a comparison plot like plot_cmp_experiments.R
+## The time window is limited to the time range of all series of the plot. A
+## start time outside this range is set to zero and an end time outside this
+## range is set to the end of the range.
+#  @param fnames Data file names
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr '1' aggregate sum (throughput), '2' aggregate percentage
+#              (packet loss), '' or '0' no aggregation
+#  @param diff '1' use differences of consecutive values
+#  @param stime Start of time window in seconds
+#  @param etime End of time window in seconds (0.0 means no end)
+#  @param win_size Aggregation window size in seconds
+#  @param int_factor Aggregation oversampling factor
+#  @return Tuple (start time, end time), (0.0, 0.0) if the window covers all
+#          data
+def get_plot_window(fnames, yindex=2, yscaler=1.0, aggr='', diff='', stime=0.0,
+                    etime=0.0, win_size=1.0, int_factor=4):
+
+    ranges = [ get_time_range(fname, yindex, yscaler, aggr, diff, win_size,
+                              int_factor) for fname in fnames ]
+    ranges = [ time_range for time_range in ranges if time_range is not None ]
+    if len(ranges) == 0:
+        return (0.0, 0.0)
+
+    if aggr in ('1', '2'):
+        xmax = max([ time_range[2] for time_range in ranges
+                     if time_range[2] is not None ] + [ 0.0 ])
+    else:
+        xmax = max(time_range[1] for time_range in ranges) - \
+            min(time_range[0] for time_range in ranges)
+
+    if stime < 0 or stime > xmax:
+        stime = 0.0
+    if etime <= 0 or etime > xmax:
+        etime = xmax
+    if stime > 0 or etime < xmax:
+        return (stime, etime)
+
+    return (0.0, 0.0)
+
+
+## Compute five number summary like R's fivenum()
+#  @param values Sorted array of values
+#  @return List (minimum, lower hinge, median, upper hinge, maximum)
+def _fivenum(values):
+
+    n = len(values)
+    n4 = math.floor((n + 3) / 2.0) / 2.0
+    pos = np.array([1, n4, (n + 1) / 2.0, n + 1 - n4, n]) - 1
+
+    return list(0.5 * (values[np.floor(pos).astype(int)] +
+                       values[np.ceil(pos).astype(int)]))
+
+
+## Compute box plot statistics like R's boxplot.stats()
+#  @param values Sorted array of values
+#  @return Tuple (list of lower whisker, lower hinge, median, upper hinge, upper
+#          whisker, sorted list of distinct outliers)
+def _box_stats(values):
+
+    stats = _fivenum(values)
+    iqr = stats[3] - stats[1]
+    out = (values < stats[1] - 1.5 * iqr) | (values > stats[3] + 1.5 * iqr)
+    inside = values[~out]
+    if len(inside) > 0:
+        stats[0] = inside[0]
+        stats[4] = inside[-1]
+
+    # outliers with the same value are plotted at the same position
+    return (stats, list(np.unique(values[out])))
+
+
+## Build sketch of values
+## The sketch counts the values in buckets with exponentially growing
+## boundaries, so quantiles estimated from it have a relative error of at most
+## SKETCH_ACCURACY. Sketches can be merged by adding the counts.
+#  @param values Array of values
+#  @return Sketch (dictionary with counts of positive buckets, negative
+#          buckets and zeros)
+def make_sketch(values):
+
+    sketch = { 'pos' : {}, 'neg' : {}, 'zero' : int(np.sum(values == 0)) }
+    for key, vals in (('pos', values[values > 0]), ('neg', -values[values < 0])):
+        if len(vals) > 0:
+            buckets = np.ceil(np.log(vals) / math.log(SKETCH_GAMMA)).astype(int)
+            idx, counts = np.unique(buckets, return_counts=True)
+            sketch[key] = dict((str(i), int(c)) for i, c in zip(idx, counts))
+
+    return sketch
+
+
+## Merge sketches
+#  @param sketches List of sketches
+#  @return Merged sketch
+def merge_sketches(sketches):
+
+    merged = { 'pos' : {}, 'neg' : {}, 'zero' : 0 }
+    for sketch in sketches:
+        merged['zero'] += sketch['zero']
+        for key in ('pos', 'neg'):
+            for bucket, count in sketch[key].items():
+                merged[key][bucket] = merged[key].get(bucket, 0) + count
+
+    return merged
+
+
+## Estimate quantile from sketch
+#  @param sketch Sketch
+#  @param q Quantile (between 0 and 1)
+#  @return Estimated value or None if sketch is empty
+def sketch_quantile(sketch, q):
+
+    # buckets in ascending order of their values
+    buckets = [ (-int(b), -1, c) for b, c in sketch['neg'].items() ]
+    buckets.sort()
+    buckets = [ (-b, sign, c) for b, sign, c in buckets ]
+    if sketch['zero'] > 0:
+        buckets.append((0, 0, sketch['zero']))
+    buckets += sorted((int(b), 1, c) for b, c in sketch['pos'].items())
+
+    total = sum(c for b, sign, c in buckets)
+    if total == 0:
+        return None
+
+    rank = q * (total - 1)
+    seen = 0
+    for bucket, sign, count in buckets:
+        seen += count
+        if seen > rank:
+            break
+
+    return sign * 2 * SKETCH_GAMMA ** bucket / (SKETCH_GAMMA + 1)
+
+
+## Compute statistics of values
+#  @param values Array of values
+#  @return Dictionary with statistics
+def compute_stats(values):
+
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    stats = {
+        'count' : len(values),
+        'sum'   : float(np.sum(values)),
+        'sketch': make_sketch(values),
+    }
+    if len(values) == 0:
+        return stats
+
+    (box, outliers) = _box_stats(values)
+    stats.update({
+        'mean'      : stats['sum'] / len(values),
+        'min'       : float(values[0]),
+        'max'       : float(values[-1]),
+        'median'    : float(np.median(values)),
+        # numpy's default interpolation is the default type 7 of R
+        'quantiles' : list(np.percentile(values, [ q * 100 for q in QUANTILES ])),
+        'box'       : box,
+        'outliers'  : outliers,
+    })
+
+    return stats
+
+
+## Get statistics of data series, compute and store them if not in database
+#  @param fname Data file name
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr '1' aggregate sum (throughput), '2' aggregate percentage
+#              (packet loss), '' or '0' no aggregation
+#  @param diff '1' use differences of consecutive values
+#  @param stime Start of time window in seconds (relative to first timestamp)
+#  @param etime End of time window in seconds (0.0 means no end)
+#  @param win_size Aggregation window size in seconds
+#  @param int_factor Aggregation oversampling factor
+#  @return Dictionary with statistics
+def get_stats(fname, yindex=2, yscaler=1.0, aggr='', diff='', stime=0.0,
+              etime=0.0, win_size=1.0, int_factor=4):
+
+    params = '%i %i %r %s %s %r %r %r %r' % (STATS_VERSION, yindex, yscaler,
+             aggr, diff, stime, etime, win_size, int_factor)
+
+    stats = lookup_stats(fname, params)
+    if stats is not None:
+        return json.loads(stats)
+
+    stats = compute_stats(get_series(fname, yindex, yscaler, aggr, diff, stime,
+                                     etime, win_size, int_factor))
+    update_stats(fname, params, json.dumps(stats))
+
+    return stats
+
+
+## Write statistics to file for plot_cmp_experiments.R
+## The first line has the values count, mean, median, the five box plot
+## statistics, minimum and maximum, the second line has the outliers.
+#  @param fname Output file name
+#  @param stats Dictionary with statistics
+def write_stats_file(fname, stats):
+
+    if stats['count'] == 0:
+        line = [ '0' ] + [ 'NA' ] * 9
+    else:
+        line = [ '%.17g' % x for x in [ stats['count'], stats['mean'],
+                 stats['median'] ] + stats['box'] + [ stats['min'], stats['max'] ] ]
+
+    with open(fname, 'w') as f:
+        f.write(' '.join(line) + '\n')
+        f.write(' '.join('%.17g' % x for x in stats['outliers']) + '\n')
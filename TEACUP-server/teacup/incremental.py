@@ -0,0 +1,339 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package incremental
+# Incremental analysis of experiments
+#
+# For each experiment and analysis task we record a fingerprint of the raw log
+# files of the experiment (names, modification times and sizes) together with
+# the task parameters in the metadata database. With incremental analysis
+# tasks are only run for experiments that are new (e.g. new lines in
+# experiments_completed.txt) or whose raw log files have changed since the
+# task was run with the same parameters. Summary plots over experiments are
+# only redone if the data files they are based on have changed. We also record
+# the output files (intermediate files, graphs) written by a task, and a task
+# is redone if any of them was removed or replaced by an older file.
+#
+# $Id$
+
+import os
+import time
+import hashlib
+from fabric.api import task, warn, puts, execute, abort
+
+from filefinder import get_testid_file_list
+from metadb import lookup_analysed, lookup_analysed_outputs, update_analysed
+
+
+## Extension of the raw (compressed) log files of an experiment
+RAW_FILE_EXT = '.gz'
+
+
+## Get fingerprint of files based on their names, modification times and sizes
+#  @param file_names List of file names
+#  @return Fingerprint string or '' if none of the files exist
+def get_files_fingerprint(file_names):
+
+    entries = []
+    for fname in file_names:
+        try:
+            st = os.stat(fname)
+        except OSError:
+            continue
+        entries.append('%s %f %i' % (os.path.abspath(fname), st.st_mtime,
+                                     st.st_size))
+
+    if len(entries) == 0:
+        return ''
+
+    return hashlib.md5('\n'.join(sorted(entries))).hexdigest()
+
+
+## Get fingerprint of the raw log files of an experiment
+#  @param test_id Test ID
+#  @return Fingerprint string or '' if there are no log files
+def get_raw_fingerprint(test_id):
+
+    return get_files_fingerprint(
+        get_testid_file_list('', test_id, RAW_FILE_EXT, '', no_abort=True))
+
+
+## Get string representation of parameters that does not change between runs
+## (functions are represented by their names, dictionaries are sorted)
+#  @param value Parameter value (can be nested lists, tuples and dictionaries)
+#  @return String
+def get_param_string(value):
+
+    if callable(value):
+        return getattr(value, '__name__', str(value))
+    elif isinstance(value, dict):
+        return '{' + ','.join('%s:%s' % (get_param_string(k), get_param_string(v))
+                              for k, v in sorted(value.items())) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '(' + ','.join(get_param_string(v) for v in value) + ')'
+    else:
+        return repr(value)
+
+
+## Check if analysis task was done for the current data and its output files
+## still exist
+#  @param key Test ID or other key of what is analysed
+#  @param task_name Task name
+#  @param params Parameter string
+#  @param fingerprint Fingerprint of the data
+#  @return True if task was done for data with this fingerprint and none of its
+#          output files was removed or replaced by an older file, otherwise False
+def is_analysed(key, task_name, params, fingerprint):
+
+    if fingerprint == '' or \
+       lookup_analysed(key, task_name, params) != fingerprint:
+        return False
+
+    outputs = lookup_analysed_outputs(key, task_name, params)
+    if outputs is None:
+        return False
+
+    for path, mtime in outputs:
+        stat = _get_stat(path)
+        if stat is None or stat[0] < mtime:
+            return False
+
+    return True
+
+
+## Record that analysis task was done
+#  @param key Test ID or other key of what is analysed
+#  @param task_name Task name
+#  @param params Parameter string
+#  @param fingerprint Fingerprint of the data
+#  @param outputs List of tuples (path, mtime) of the output files written
+def set_analysed(key, task_name, params, fingerprint, outputs=[]):
+
+    if fingerprint != '':
+        update_analysed(key, task_name, params, fingerprint, outputs)
+
+
+## Get files written since a point in time (except raw log files)
+#  @param dir_names List of directories to search (not recursive)
+#  @param name_part Only files whose name contains this string
+#  @param start Time in seconds since the epoch
+#  @return List of tuples (path, mtime)
+def get_new_files(dir_names, name_part, start):
+
+    # file systems may only store full seconds
+    start = int(start)
+
+    outputs = []
+    for dir_name in sorted(set(dir_names)):
+        try:
+            names = os.listdir(dir_name)
+        except OSError:
+            continue
+
+        for name in sorted(names):
+            # never record the raw log files the tasks read
+            if name.endswith(RAW_FILE_EXT):
+                continue
+
+            path = os.path.abspath(os.path.join(dir_name, name))
+            stat = _get_stat(path)
+            if name_part in name and stat is not None and stat[0] >= start and \
+               os.path.isfile(path):
+                outputs.append((path, stat[0]))
+
+    return outputs
+
+
+## Get directories an analysis task of an experiment can write output files to
+#  @param test_id Test ID
+#  @param out_dir Output directory of the task
+#  @param pdf_dir Output directory of the graphs of the task
+#  @return List of directory names
+def _get_output_dirs(test_id, out_dir, pdf_dir):
+
+    dir_names = []
+    for fname in get_testid_file_list('', test_id, RAW_FILE_EXT, '',
+                                      no_abort=True):
+        exp_dir = os.path.dirname(fname)
+        dir_names.append(exp_dir)
+        # same as get_out_dir()
+        if out_dir != '' and out_dir[0] == '/':
+            dir_names.append(out_dir)
+        else:
+            dir_names.append(os.path.join(exp_dir, out_dir))
+        # same as the plot functions
+        if pdf_dir != '':
+            if pdf_dir[0] == '/':
+                dir_names.append(pdf_dir)
+            else:
+                dir_names.append(os.path.join(exp_dir.split('/')[0], pdf_dir))
+
+    return dir_names
+
+
+## Run job and record that it was done for the experiment together with the
+## output files written
+#  @param func Task function
+#  @param params Parameter string
+#  @param fingerprint Fingerprint of the raw log files of the experiment
+#  @param dir_names Directories the task writes its output files to
+#  @param args Arguments of func, the first is the test ID
+#  @param kwargs Keyword arguments of func
+#  @return Return value of func
+def _run_and_record(func, params, fingerprint, dir_names, args, kwargs):
+
+    start = time.time()
+    ret = func(*args, **kwargs)
+    set_analysed(args[0], func.__name__, params, fingerprint,
+                 get_new_files(dir_names, args[0], start))
+
+    return ret
+
+
+## Filter out jobs that were already done for the current raw data of the
+## experiments, and make the remaining jobs record when they are done
+#  @param jobs List of jobs for run_jobs(), each a tuple (task, args, kwargs)
+#              where the first argument is the test ID
+#  @param out_dir Output directory of the jobs
+#  @param pdf_dir Output directory of the graphs of the jobs
+#  @return List of jobs that need to be run
+def filter_analysed_jobs(jobs, out_dir='', pdf_dir=''):
+
+    return [ group[0] for group in
+             filter_analysed_job_groups([ [ job ] for job in jobs ],
+                                        out_dir, pdf_dir) ]
+
+
+## Filter out jobs that were already done for the current raw data of the
+## experiments from groups of jobs (see run_job_groups()), and make the
+## remaining jobs record when they are done
+#  @param groups List of job lists, each job a tuple (task, args, kwargs)
+#                where the first argument is the test ID
+#  @param out_dir Output directory of the jobs
+#  @param pdf_dir Output directory of the graphs of the jobs
+#  @return List of job lists that need to be run (without empty lists)
+def filter_analysed_job_groups(groups, out_dir='', pdf_dir=''):
+
+    fingerprints = {}
+    output_dirs = {}
+    todo_groups = []
+    num_jobs = 0
+    num_todo = 0
+    for jobs in groups:
+        todo = []
+        for func, args, kwargs in jobs:
+            test_id = args[0]
+            if test_id not in fingerprints:
+                fingerprints[test_id] = get_raw_fingerprint(test_id)
+                output_dirs[test_id] = _get_output_dirs(test_id, out_dir,
+                                                        pdf_dir)
+
+            params = get_param_string((args[1:], kwargs))
+            if is_analysed(test_id, func.__name__, params, fingerprints[test_id]):
+                continue
+
+            todo.append((_run_and_record,
+                         (func, params, fingerprints[test_id],
+                          output_dirs[test_id], args, kwargs), {}))
+
+        num_jobs += len(jobs)
+        num_todo += len(todo)
+        if len(todo) > 0:
+            todo_groups.append(todo)
+
+    puts('Incremental analysis: %i of %i jobs are up to date' %
+         (num_jobs - num_todo, num_jobs))
+
+    return todo_groups
+
+
+## Get modification time and size of file
+#  @param fname File name
+#  @return Tuple (mtime, size) or None if file does not exist
+def _get_stat(fname):
+
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+
+    return (st.st_mtime, st.st_size)
+
+
+## Follow an experiment sweep and incrementally analyse experiments as they
+## complete. The analysis task is run with incremental='1' whenever the
+## experiment list file changes.
+#  @param task_name Analysis task: 'extract_all', 'analyse_all' (default),
+#                   'analyse_cmpexp' or 'analyse_2d_density'
+#  @param exp_list List of all test IDs
+#  @param interval Seconds between checks of the experiment list
+#  @param max_idle Stop if the experiment list did not change for this many
+#                  seconds, '0' means never stop (default)
+#  @param kwargs Parameters passed to the analysis task
+@task
+def analyse_watch(task_name='analyse_all', exp_list='experiments_completed.txt',
+                  interval='60', max_idle='0', **kwargs):
+    "Incrementally analyse experiments while an experiment sweep is running"
+
+    # imported here since the analysis modules use this module
+    from analyse import extract_all, analyse_all
+    from analysecmpexp import analyse_cmpexp, analyse_2d_density
+
+    tasks = {
+        'extract_all': extract_all,
+        'analyse_all': analyse_all,
+        'analyse_cmpexp': analyse_cmpexp,
+        'analyse_2d_density': analyse_2d_density,
+    }
+    if task_name not in tasks:
+        abort('Unknown analysis task %s' % task_name)
+
+    interval = float(interval)
+    max_idle = float(max_idle)
+
+    last_stat = None
+    idle = 0.0
+    while True:
+        stat = _get_stat(exp_list)
+        if stat is not None and stat != last_stat:
+            last_stat = stat
+            idle = 0.0
+            puts('\n[MAIN] Experiment list %s changed, running %s\n' %
+                 (exp_list, task_name))
+            try:
+                execute(tasks[task_name], exp_list=exp_list, incremental='1',
+                        **kwargs)
+            except SystemExit:
+                # e.g. not enough data yet, try again after next change
+                warn('%s failed, waiting for next change of %s' %
+                     (task_name, exp_list))
+        elif max_idle > 0 and idle >= max_idle:
+            break
+
+        time.sleep(interval)
+        idle += interval
+
+    puts('\n[MAIN] COMPLETED analyse_watch %s \n' % exp_list)
@@ -0,0 +1,397 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package metadb
+# Metadata index of the analysis (flows, row counts and summary statistics of
+# files, directories and hosts of experiments, analysis tasks done for
+# experiments and the output files they wrote) in an SQLite database
+#
+# File entries are keyed by absolute file name and are only valid as long as
+# the modification time and size of the file do not change. Experiment entries
+# are only valid as long as the experiment directory still has the experiment's
+# uname files. Updates are atomic, so the database can be used by multiple
+# processes and threads at the same time.
+#
+# $Id$
+
+import os
+import glob
+import sqlite3
+import threading
+
+
+## Database file name (created in the directory where fab is run)
+DB_FILE_NAME = 'teacup_meta_cache.db'
+## Seconds we wait for the lock of another writer
+DB_TIMEOUT = 60
+
+## Database connections (one per thread and process)
+_db = threading.local()
+
+
+## Get database connection of this thread, create tables if necessary
+#  @return Connection or None if database cannot be used
+def _get_db():
+
+    # connections must not be shared with forked processes
+    if getattr(_db, 'pid', None) != os.getpid():
+        _db.pid = os.getpid()
+        _db.conn = None
+        try:
+            conn = sqlite3.connect(DB_FILE_NAME, timeout=DB_TIMEOUT)
+            # return byte strings like the rest of the code uses
+            conn.text_factory = str
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                             'path TEXT PRIMARY KEY, mtime REAL, size INTEGER, '
+                             'flows TEXT, rows INTEGER)')
+                conn.execute('CREATE TABLE IF NOT EXISTS experiments ('
+                             'test_id TEXT PRIMARY KEY, directory TEXT, '
+                             'dir_mtime REAL, hosts TEXT)')
+                conn.execute('CREATE TABLE IF NOT EXISTS stats ('
+                             'path TEXT, params TEXT, mtime REAL, size INTEGER, '
+                             'stats TEXT, PRIMARY KEY (path, params))')
+                conn.execute('CREATE TABLE IF NOT EXISTS analysed ('
+                             'test_id TEXT, task TEXT, params TEXT, '
+                             'fingerprint TEXT, '
+                             'PRIMARY KEY (test_id, task, params))')
+                conn.execute('CREATE TABLE IF NOT EXISTS analysed_outputs ('
+                             'test_id TEXT, task TEXT, params TEXT, '
+                             'path TEXT, mtime REAL, '
+                             'PRIMARY KEY (test_id, task, params, path))')
+            _db.conn = conn
+        except sqlite3.Error:
+            # if we can't write to the database then bad luck, user needs to
+            # fix permission, but ensure we don't crash
+            pass
+
+    return _db.conn
+
+
+## Get modification time and size of file
+#  @param fname File name
+#  @return Tuple (mtime, size) or None if file does not exist
+def _get_stat(fname):
+
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+
+    return (st.st_mtime, st.st_size)
+
+
+## Look up field of file entry
+#  @param fname File name
+#  @param field Field name ('flows' or 'rows')
+#  @return Value or None if there is no valid entry
+def _lookup_file_field(fname, field):
+
+    conn = _get_db()
+    stat = _get_stat(fname)
+    if conn is None or stat is None:
+        return None
+
+    try:
+        row = conn.execute('SELECT mtime, size, %s FROM files WHERE path = ?' %
+                           field, (os.path.abspath(fname), )).fetchone()
+    except sqlite3.Error:
+        return None
+
+    # entry is outdated if file has changed
+    if row is None or (row[0], row[1]) != stat:
+        return None
+
+    return row[2]
+
+
+## Set field of file entry, other fields are cleared if the file has changed
+#  @param fname File name
+#  @param field Field name ('flows' or 'rows')
+#  @param value Value
+def _update_file_field(fname, field, value):
+
+    conn = _get_db()
+    stat = _get_stat(fname)
+    if conn is None or stat is None:
+        return
+
+    path = os.path.abspath(fname)
+    try:
+        with conn:
+            cur = conn.execute('UPDATE files SET %s = ? WHERE path = ? AND '
+                               'mtime = ? AND size = ?' % field,
+                               (value, path, stat[0], stat[1]))
+            if cur.rowcount == 0:
+                conn.execute('INSERT OR REPLACE INTO files (path, mtime, size, %s) '
+                             'VALUES (?, ?, ?, ?)' % field,
+                             (path, stat[0], stat[1], value))
+    except sqlite3.Error:
+        pass
+
+
+## Look up flows of file
+#  @param fname File name
+#  @return List of flows or None if not known
+def lookup_flows(fname):
+
+    flows = _lookup_file_field(fname, 'flows')
+    if flows is None:
+        return None
+
+    return [ flow for flow in flows.split(';') if flow != '' ]
+
+
+## Store flows of file
+#  @param fname File name
+#  @param flows List of flows
+def update_flows(fname, flows):
+
+    _update_file_field(fname, 'flows', ';'.join(flows))
+
+
+## Look up number of rows (lines) of file
+#  @param fname File name
+#  @return Number of rows or None if not known
+def lookup_rows(fname):
+
+    return _lookup_file_field(fname, 'rows')
+
+
+## Store number of rows (lines) of file
+#  @param fname File name
+#  @param rows Number of rows
+def update_rows(fname, rows):
+
+    _update_file_field(fname, 'rows', rows)
+
+
+## Look up summary statistics of file
+#  @param fname File name
+#  @param params String with the parameters the statistics were computed with
+#  @return Statistics string or None if not known
+def lookup_stats(fname, params):
+
+    conn = _get_db()
+    stat = _get_stat(fname)
+    if conn is None or stat is None:
+        return None
+
+    try:
+        row = conn.execute('SELECT mtime, size, stats FROM stats WHERE '
+                           'path = ? AND params = ?',
+                           (os.path.abspath(fname), params)).fetchone()
+    except sqlite3.Error:
+        return None
+
+    # entry is outdated if file has changed
+    if row is None or (row[0], row[1]) != stat:
+        return None
+
+    return row[2]
+
+
+## Store summary statistics of file
+#  @param fname File name
+#  @param params String with the parameters the statistics were computed with
+#  @param stats Statistics string
+def update_stats(fname, params, stats):
+
+    conn = _get_db()
+    stat = _get_stat(fname)
+    if conn is None or stat is None:
+        return
+
+    try:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO stats (path, params, mtime, '
+                         'size, stats) VALUES (?, ?, ?, ?, ?)',
+                         (os.path.abspath(fname), params, stat[0], stat[1],
+                          stats))
+    except sqlite3.Error:
+        pass
+
+
+## Get experiment entry if still valid
+#  @param test_id Test ID
+#  @return Tuple (directory, directory mtime, hosts) or None
+def _lookup_experiment(test_id):
+
+    conn = _get_db()
+    if conn is None:
+        return None
+
+    try:
+        row = conn.execute('SELECT directory, dir_mtime, hosts FROM experiments '
+                           'WHERE test_id = ?', (test_id, )).fetchone()
+    except sqlite3.Error:
+        return None
+
+    # entry is outdated if files were moved
+    if row is None or \
+       len(glob.glob(os.path.join(row[0], test_id + '*uname.log*'))) == 0:
+        return None
+
+    return row
+
+
+## Look up directory of experiment
+#  @param test_id Test ID
+#  @return Directory or None if not known
+def lookup_experiment_dir(test_id):
+
+    row = _lookup_experiment(test_id)
+    if row is None:
+        return None
+
+    return row[0]
+
+
+## Store directory of experiment
+#  @param test_id Test ID
+#  @param directory Directory which has the files of the experiment
+def update_experiment_dir(test_id, directory):
+
+    conn = _get_db()
+    if conn is None:
+        return
+
+    try:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO experiments (test_id, directory) '
+                         'VALUES (?, ?)', (test_id, directory))
+    except sqlite3.Error:
+        pass
+
+
+## Look up hosts of experiment
+#  @param test_id Test ID
+#  @return List of hosts or None if not known or the experiment directory has
+#          changed since the hosts were stored
+def lookup_experiment_hosts(test_id):
+
+    row = _lookup_experiment(test_id)
+    if row is None or row[2] is None:
+        return None
+
+    stat = _get_stat(row[0])
+    if stat is None or stat[0] != row[1]:
+        return None
+
+    return [ host for host in row[2].split(';') if host != '' ]
+
+
+## Store hosts of experiment (only if the directory of experiment is known)
+#  @param test_id Test ID
+#  @param hosts List of hosts
+def update_experiment_hosts(test_id, hosts):
+
+    row = _lookup_experiment(test_id)
+    if row is None:
+        return
+
+    stat = _get_stat(row[0])
+    if stat is None:
+        return
+
+    try:
+        with _get_db() as conn:
+            conn.execute('UPDATE experiments SET dir_mtime = ?, hosts = ? '
+                         'WHERE test_id = ?', (stat[0], ';'.join(hosts), test_id))
+    except sqlite3.Error:
+        pass
+
+
+## Look up fingerprint of raw data of experiment when analysis task was done
+#  @param test_id Test ID
+#  @param task Task name
+#  @param params String with the parameters of the task
+#  @return Fingerprint or None if task was not done
+def lookup_analysed(test_id, task, params):
+
+    conn = _get_db()
+    if conn is None:
+        return None
+
+    try:
+        row = conn.execute('SELECT fingerprint FROM analysed WHERE test_id = ? '
+                           'AND task = ? AND params = ?',
+                           (test_id, task, params)).fetchone()
+    except sqlite3.Error:
+        return None
+
+    if row is None:
+        return None
+
+    return row[0]
+
+
+## Look up output files written when analysis task was done
+#  @param test_id Test ID
+#  @param task Task name
+#  @param params String with the parameters of the task
+#  @return List of tuples (path, mtime), or None if database cannot be used
+def lookup_analysed_outputs(test_id, task, params):
+
+    conn = _get_db()
+    if conn is None:
+        return None
+
+    try:
+        rows = conn.execute('SELECT path, mtime FROM analysed_outputs WHERE '
+                            'test_id = ? AND task = ? AND params = ?',
+                            (test_id, task, params)).fetchall()
+    except sqlite3.Error:
+        return None
+
+    return [ (row[0], row[1]) for row in rows ]
+
+
+## Store that analysis task was done for experiment
+#  @param test_id Test ID
+#  @param task Task name
+#  @param params String with the parameters of the task
+#  @param fingerprint Fingerprint of raw data of experiment
+#  @param outputs List of tuples (path, mtime) of the output files written
+def update_analysed(test_id, task, params, fingerprint, outputs=[]):
+
+    conn = _get_db()
+    if conn is None:
+        return
+
+    try:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO analysed (test_id, task, '
+                         'params, fingerprint) VALUES (?, ?, ?, ?)',
+                         (test_id, task, params, fingerprint))
+            conn.execute('DELETE FROM analysed_outputs WHERE test_id = ? '
+                         'AND task = ? AND params = ?', (test_id, task, params))
+            conn.executemany('INSERT OR REPLACE INTO analysed_outputs (test_id, '
+                             'task, params, path, mtime) VALUES (?, ?, ?, ?, ?)',
+                             [ (test_id, task, params, path, mtime)
+                               for path, mtime in outputs ])
+    except sqlite3.Error:
+        pass
@@ -0,0 +1,246 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package pcapreader
+# Native reader for (gzipped) tcpdump files, so we can index flows in a
+# single pass instead of running zcat | tcpdump pipelines
+#
+# $Id$
+
+import gzip
+import socket
+import struct
+from fabric.api import warn, abort
+
+from flowcache import append_flow_cache, lookup_flow_cache
+
+
+## Number of bytes read from the (uncompressed) file at once
+PCAP_CHUNK_SIZE = 4 * 1024 * 1024
+
+## Link layer types we can decode
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+## Some platforms use these DLT values for raw IP
+LINKTYPE_RAW_DLT = (12, 14)
+
+## Ethertypes
+ETHERTYPE_IP = b'\x08\x00'
+ETHERTYPE_VLAN = (b'\x81\x00', b'\x88\xa8', b'\x91\x00')
+
+## IP protocol numbers and names as used in flow strings
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+IP_PROTO_NAMES = { IP_PROTO_TCP: 'tcp', IP_PROTO_UDP: 'udp' }
+
+## Flow tables already built, index is file name
+flow_table_cache = {}
+
+_unpack_short = struct.Struct('!H').unpack_from
+
+
+## Iterate over all packets in a tcpdump file
+#  @param file_name Name of tcpdump file (can be gzipped)
+#  @return Generator of tuples (timestamp, wire length, link type, data),
+#          where timestamp is in seconds and data is the captured packet
+#          including the link layer header
+def read_pcap(file_name):
+
+    if file_name.endswith('.gz'):
+        f = gzip.open(file_name, 'rb')
+    else:
+        f = open(file_name, 'rb')
+
+    try:
+        hdr = f.read(24)
+        if len(hdr) < 24:
+            return
+
+        magic = hdr[0:4]
+        if magic == b'\xd4\xc3\xb2\xa1':
+            endian, ts_div = '<', 1000000.0
+        elif magic == b'\xa1\xb2\xc3\xd4':
+            endian, ts_div = '>', 1000000.0
+        elif magic == b'\x4d\x3c\xb2\xa1':
+            endian, ts_div = '<', 1000000000.0
+        elif magic == b'\xa1\xb2\x3c\x4d':
+            endian, ts_div = '>', 1000000000.0
+        else:
+            abort('File %s is not a pcap file (pcapng is not supported)' %
+                  file_name)
+
+        # upper bits may contain FCS information
+        linktype = struct.unpack(endian + 'I', hdr[20:24])[0] & 0x0fffffff
+        unpack_rec_hdr = struct.Struct(endian + 'IIII').unpack_from
+
+        buf = b''
+        pos = 0
+        while True:
+            try:
+                chunk = f.read(PCAP_CHUNK_SIZE)
+            except (IOError, EOFError):
+                # zcat also returns the data read so far for truncated files
+                warn('File %s is truncated or corrupt' % file_name)
+                chunk = b''
+
+            if not chunk:
+                break
+
+            buf = buf[pos:] + chunk
+            pos = 0
+            buf_len = len(buf)
+            while pos + 16 <= buf_len:
+                sec, frac, cap_len, wire_len = unpack_rec_hdr(buf, pos)
+                end = pos + 16 + cap_len
+                if end > buf_len:
+                    break
+
+                yield (sec + frac / ts_div, wire_len, linktype,
+                       buf[pos + 16:end])
+                pos = end
+    finally:
+        f.close()
+
+
+## Get offset of IPv4 header in captured packet
+#  @param linktype Link layer type of file
+#  @param data Captured packet
+#  @return Offset of IPv4 header or -1 if packet is not an IPv4 packet
+def get_ipv4_offset(linktype, data):
+
+    if linktype == LINKTYPE_ETHERNET:
+        off = 12
+        etype = data[off:off + 2]
+        while etype in ETHERTYPE_VLAN:
+            off += 4
+            etype = data[off:off + 2]
+        if etype != ETHERTYPE_IP:
+            return -1
+        off += 2
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if data[14:16] != ETHERTYPE_IP:
+            return -1
+        off = 16
+    elif linktype == LINKTYPE_NULL:
+        # address family is in host byte order of capturing machine
+        if data[0:4] not in (b'\x02\x00\x00\x00', b'\x00\x00\x00\x02'):
+            return -1
+        off = 4
+    elif linktype == LINKTYPE_LOOP:
+        if data[0:4] != b'\x00\x00\x00\x02':
+            return -1
+        off = 4
+    elif linktype == LINKTYPE_RAW or linktype in LINKTYPE_RAW_DLT:
+        off = 0
+    else:
+        return -1
+
+    if len(data) < off + 20 or (ord(data[off:off + 1]) >> 4) != 4:
+        return -1
+
+    return off
+
+
+## Build flow table for tcpdump file in one pass over the file
+## Like the tcpdump output parsed before, only IPv4 TCP and UDP packets are
+## considered and non-first fragments are ignored (they have no ports).
+#  @param file_name Name of tcpdump file (can be gzipped)
+#  @return Dictionary, index is tuple (src, src_port, dst, dst_port, proto)
+#          with all elements as strings, value is list
+#          [first_timestamp, last_timestamp, packets, bytes] where bytes is
+#          the sum of the IP lengths
+def get_flow_table(file_name):
+
+    global flow_table_cache
+
+    if file_name in flow_table_cache:
+        return flow_table_cache[file_name]
+
+    # index on raw header bytes while reading, only convert at the end
+    raw_table = {}
+    for ts, wire_len, linktype, data in read_pcap(file_name):
+        off = get_ipv4_offset(linktype, data)
+        if off < 0:
+            continue
+
+        proto = ord(data[off + 9:off + 10])
+        if proto != IP_PROTO_TCP and proto != IP_PROTO_UDP:
+            continue
+        if _unpack_short(data, off + 6)[0] & 0x1fff:
+            continue
+
+        l4_off = off + (ord(data[off:off + 1]) & 0x0f) * 4
+        if len(data) < l4_off + 4:
+            continue
+
+        key = (data[off + 12:off + 20] + data[l4_off:l4_off + 4], proto)
+        ip_len = _unpack_short(data, off + 2)[0]
+        entry = raw_table.get(key)
+        if entry is None:
+            raw_table[key] = [ts, ts, 1, ip_len]
+        else:
+            entry[1] = ts
+            entry[2] += 1
+            entry[3] += ip_len
+
+    table = {}
+    for (addrs, proto), entry in raw_table.items():
+        src_port, dst_port = struct.unpack('!HH', addrs[8:12])
+        table[(socket.inet_ntoa(addrs[0:4]), str(src_port),
+               socket.inet_ntoa(addrs[4:8]), str(dst_port),
+               IP_PROTO_NAMES[proto])] = entry
+
+    flow_table_cache[file_name] = table
+
+    return table
+
+
+## Get unique flows in tcpdump file
+## Flows are looked up in the flow cache first. If not cached, the flow
+## table is built and all TCP and UDP flows are added to the cache.
+#  @param file_name Name of tcpdump file (can be gzipped)
+#  @param protos List of protocols we want flows for ('tcp', 'udp')
+#  @return List of flows as strings <src>,<src_port>,<dst>,<dst_port>,<proto>,
+#          sorted like LC_ALL=C sort would do for each protocol and in the
+#          order of protos
+def get_pcap_flows(file_name, protos=('tcp', 'udp')):
+
+    flows = lookup_flow_cache(file_name)
+    if flows == None:
+        table = get_flow_table(file_name)
+        flow_strs = [ ','.join(key) for key in table.keys() ]
+        flows = []
+        for proto in ('tcp', 'udp'):
+            flows += sorted([ flow for flow in flow_strs
+                              if flow.endswith(',' + proto) ])
+
+        append_flow_cache(file_name, flows)
+
+    return [ flow for proto in protos for flow in flows
+             if flow.endswith(',' + proto) ]
@@ -0,0 +1,369 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package pktstore
+# Columnar packet store. Each tcpdump file is converted once into a NumPy
+# array file with the packets grouped by flow (<dump>.pkts.npy) and a flow
+# table with the position of each flow in the array (<dump>.pkts.flows).
+# Extract functions memory-map the array and slice it by flow, instead of
+# running zcat | tcpdump for every flow and direction.
+#
+# $Id$
+
+import os
+import thread
+import zlib
+import struct
+import socket
+from array import array
+import numpy as np
+from fabric.api import warn
+
+from flowcache import append_flow_cache, lookup_flow_cache
+from pcapreader import read_pcap, get_ipv4_offset, flow_table_cache, \
+    IP_PROTO_TCP, IP_PROTO_UDP, IP_PROTO_NAMES
+
+
+## Extension of packet array file
+STORE_FILE_EXT = '.pkts.npy'
+## Extension of flow table file
+STORE_FLOWS_EXT = '.pkts.flows'
+
+## Per-packet columns. hash is the CRC32 over IP ID, TCP sequence number (TCP
+## only) and payload, computed like tools/pktloss.py does
+PKT_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('flow', '<u4'),
+    ('ip_len', '<u2'),
+    ('link_len', '<u4'),
+    ('ip_id', '<u2'),
+    ('seq', '<u4'),
+    ('ack', '<u4'),
+    ('flags', 'u1'),
+    ('hash', '<u4'),
+])
+
+## TCP flags
+TCP_FLAG_FIN = 0x01
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_RST = 0x04
+TCP_FLAG_PUSH = 0x08
+TCP_FLAG_ACK = 0x10
+
+## Packet stores already loaded, index is tcpdump file name, value is tuple
+## (flow index, packet array). The flow index maps flow strings
+## <src>,<src_port>,<dst>,<dst_port>,<proto> to tuples (start, end).
+pkt_store_cache = {}
+
+_unpack_short = struct.Struct('!H').unpack_from
+_unpack_seq_ack = struct.Struct('!II').unpack_from
+
+
+## Get base name of packet store files for tcpdump file
+#  @param tcpdump_file Name of tcpdump file
+#  @return Base name
+def _get_store_base(tcpdump_file):
+
+    if tcpdump_file.endswith('.gz'):
+        return tcpdump_file[:-3]
+
+    return tcpdump_file
+
+
+## Read tcpdump file and build packet array and flow index
+#  @param tcpdump_file Name of tcpdump file
+#  @return Tuple (flow list, flow index, packet array)
+def _build_pkt_store(tcpdump_file):
+
+    flow_ids = {}
+    col_ts = array('d')
+    col_flow = array('I')
+    col_ip_len = array('H')
+    col_link_len = array('I')
+    col_ip_id = array('H')
+    col_seq = array('I')
+    col_ack = array('I')
+    col_flags = array('B')
+    col_hash = array('I')
+
+    for ts, wire_len, linktype, data in read_pcap(tcpdump_file):
+        off = get_ipv4_offset(linktype, data)
+        if off < 0:
+            continue
+
+        proto = ord(data[off + 9:off + 10])
+        if proto != IP_PROTO_TCP and proto != IP_PROTO_UDP:
+            continue
+        if _unpack_short(data, off + 6)[0] & 0x1fff:
+            continue
+
+        l4_off = off + (ord(data[off:off + 1]) & 0x0f) * 4
+        if len(data) < l4_off + 4:
+            continue
+
+        key = (data[off + 12:off + 20] + data[l4_off:l4_off + 4], proto)
+        flow_id = flow_ids.get(key)
+        if flow_id is None:
+            flow_id = len(flow_ids)
+            flow_ids[key] = flow_id
+
+        ip_len = _unpack_short(data, off + 2)[0]
+        ip_id = _unpack_short(data, off + 4)[0]
+        seq = ack = flags = 0
+        if proto == IP_PROTO_TCP:
+            if len(data) >= l4_off + 14:
+                seq, ack = _unpack_seq_ack(data, l4_off + 4)
+                flags = ord(data[l4_off + 13:l4_off + 14])
+                payload = data[l4_off + (ord(data[l4_off + 12:l4_off + 13]) >> 4) * 4:
+                               off + ip_len]
+            else:
+                payload = b''
+            pkt_hash = zlib.crc32(str(ip_id) + str(seq) + payload)
+        else:
+            pkt_hash = zlib.crc32(str(ip_id) + data[l4_off + 8:off + ip_len])
+
+        col_ts.append(ts)
+        col_flow.append(flow_id)
+        col_ip_len.append(ip_len)
+        col_link_len.append(wire_len)
+        col_ip_id.append(ip_id)
+        col_seq.append(seq)
+        col_ack.append(ack)
+        col_flags.append(flags)
+        col_hash.append(pkt_hash & 0xffffffff)
+
+    pkts = np.empty(len(col_ts), dtype=PKT_DTYPE)
+    pkts['ts'] = np.frombuffer(col_ts, dtype=np.float64)
+    pkts['flow'] = np.frombuffer(col_flow, dtype=np.uint32)
+    pkts['ip_len'] = np.frombuffer(col_ip_len, dtype=np.uint16)
+    pkts['link_len'] = np.frombuffer(col_link_len, dtype=np.uint32)
+    pkts['ip_id'] = np.frombuffer(col_ip_id, dtype=np.uint16)
+    pkts['seq'] = np.frombuffer(col_seq, dtype=np.uint32)
+    pkts['ack'] = np.frombuffer(col_ack, dtype=np.uint32)
+    pkts['flags'] = np.frombuffer(col_flags, dtype=np.uint8)
+    pkts['hash'] = np.frombuffer(col_hash, dtype=np.uint32)
+
+    # group packets by flow, keeping the capture order within each flow
+    pkts = pkts[np.argsort(pkts['flow'], kind='mergesort')]
+    ends = np.cumsum(np.bincount(pkts['flow'], minlength=len(flow_ids)))
+
+    flow_list = [None] * len(flow_ids)
+    for (addrs, proto), flow_id in flow_ids.items():
+        src_port, dst_port = struct.unpack('!HH', addrs[8:12])
+        flow_list[flow_id] = ','.join((socket.inet_ntoa(addrs[0:4]),
+                                       str(src_port),
+                                       socket.inet_ntoa(addrs[4:8]),
+                                       str(dst_port),
+                                       IP_PROTO_NAMES[proto]))
+
+    flow_index = {}
+    start = 0
+    for flow_id, flow in enumerate(flow_list):
+        flow_index[flow] = (start, int(ends[flow_id]))
+        start = int(ends[flow_id])
+
+    return (flow_list, flow_index, pkts)
+
+
+## Write packet store files
+## Files are written under temporary names first, so concurrent readers never
+## see partial files
+#  @param base Base name of store files
+#  @param flow_list List of flows, index is flow id
+#  @param flow_index Flow index
+#  @param pkts Packet array
+def _write_pkt_store(base, flow_list, flow_index, pkts):
+
+    tmp_suffix = '.%i.%i.tmp' % (os.getpid(), thread.get_ident())
+    with open(base + STORE_FILE_EXT + tmp_suffix, 'wb') as f:
+        np.save(f, pkts)
+    with open(base + STORE_FLOWS_EXT + tmp_suffix, 'w') as f:
+        for flow in flow_list:
+            f.write('%s %i %i\n' % ((flow, ) + flow_index[flow]))
+
+    os.rename(base + STORE_FILE_EXT + tmp_suffix, base + STORE_FILE_EXT)
+    os.rename(base + STORE_FLOWS_EXT + tmp_suffix, base + STORE_FLOWS_EXT)
+
+
+## Read packet store files if they exist and are not older than tcpdump file
+#  @param tcpdump_file Name of tcpdump file
+#  @return Tuple (flow list, flow index, packet array) or None
+def _read_pkt_store(tcpdump_file):
+
+    base = _get_store_base(tcpdump_file)
+    try:
+        dump_mtime = os.path.getmtime(tcpdump_file)
+        if os.path.getmtime(base + STORE_FILE_EXT) < dump_mtime or \
+           os.path.getmtime(base + STORE_FLOWS_EXT) < dump_mtime:
+            return None
+
+        flow_list = []
+        flow_index = {}
+        with open(base + STORE_FLOWS_EXT) as f:
+            for line in f:
+                flow, start, end = line.split()
+                flow_list.append(flow)
+                flow_index[flow] = (int(start), int(end))
+
+        pkts = np.load(base + STORE_FILE_EXT, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        return None
+
+    return (flow_list, flow_index, pkts)
+
+
+## Get packet store for tcpdump file, build it if necessary
+## This also fills the flow cache and the flow table cache of pcapreader, so
+## building the store is the only pass over the tcpdump file.
+#  @param tcpdump_file Name of tcpdump file
+#  @return Tuple (flow index, packet array)
+def get_pkt_store(tcpdump_file):
+
+    global pkt_store_cache
+
+    if tcpdump_file in pkt_store_cache:
+        return pkt_store_cache[tcpdump_file]
+
+    store = _read_pkt_store(tcpdump_file)
+    if store == None:
+        store = _build_pkt_store(tcpdump_file)
+        try:
+            _write_pkt_store(_get_store_base(tcpdump_file), *store)
+        except (IOError, OSError):
+            # directory may not be writable, keep store in memory only
+            warn('Cannot write packet store for %s' % tcpdump_file)
+
+    flow_list, flow_index, pkts = store
+
+    if tcpdump_file not in flow_table_cache:
+        table = {}
+        for flow in flow_list:
+            start, end = flow_index[flow]
+            table[tuple(flow.split(','))] = [
+                float(pkts['ts'][start]), float(pkts['ts'][end - 1]),
+                end - start, int(pkts['ip_len'][start:end].sum())]
+        flow_table_cache[tcpdump_file] = table
+
+    if lookup_flow_cache(tcpdump_file) == None:
+        flows = []
+        for proto in ('tcp', 'udp'):
+            flows += sorted([ flow for flow in flow_list
+                              if flow.endswith(',' + proto) ])
+        append_flow_cache(tcpdump_file, flows)
+
+    pkt_store_cache[tcpdump_file] = (flow_index, pkts)
+
+    return pkt_store_cache[tcpdump_file]
+
+
+## Get unique flows in tcpdump file using the packet store
+## Same as pcapreader.get_pcap_flows(), but if the flows are not cached the
+## packet store is built, so the tcpdump file is only read once
+#  @param tcpdump_file Name of tcpdump file
+#  @param protos List of protocols we want flows for ('tcp', 'udp')
+#  @return List of flows as strings <src>,<src_port>,<dst>,<dst_port>,<proto>
+def get_store_flows(tcpdump_file, protos=('tcp', 'udp')):
+
+    flows = lookup_flow_cache(tcpdump_file)
+    if flows == None:
+        # take flows from the store, the cache has no entry if there are no
+        # flows or the metadata database cannot be used
+        flow_index, pkts = get_pkt_store(tcpdump_file)
+        flows = sorted(flow_index.keys())
+
+    return [ flow for proto in protos for flow in flows
+             if flow.endswith(',' + proto) ]
+
+
+## Get packets of one flow direction
+## Like the tcpdump filter 'src host <src> && src port <src_port> &&
+## dst host <dst> && dst port <dst_port>' TCP and UDP packets match, unless
+## proto is specified
+#  @param tcpdump_file Name of tcpdump file
+#  @param src Source IP
+#  @param src_port Source port
+#  @param dst Destination IP
+#  @param dst_port Destination port
+#  @param proto '' for TCP and UDP, 'tcp' or 'udp' otherwise
+#  @return Packet array (a view on the store if possible) in capture order
+def get_flow_pkts(tcpdump_file, src, src_port, dst, dst_port, proto=''):
+
+    flow_index, pkts = get_pkt_store(tcpdump_file)
+
+    if proto == '':
+        protos = ('tcp', 'udp')
+    else:
+        protos = (proto, )
+
+    parts = []
+    for p in protos:
+        flow = ','.join((src, src_port, dst, dst_port, p))
+        if flow in flow_index:
+            start, end = flow_index[flow]
+            parts.append(pkts[start:end])
+
+    if len(parts) == 0:
+        return np.empty(0, dtype=PKT_DTYPE)
+    if len(parts) == 1:
+        return parts[0]
+
+    flow_pkts = np.concatenate(parts)
+    return flow_pkts[np.argsort(flow_pkts['ts'], kind='mergesort')]
+
+
+## Get packets sent from one source IP and port to any destination
+#  @param tcpdump_file Name of tcpdump file
+#  @param src Source IP
+#  @param src_port Source port
+#  @param proto '' for TCP and UDP, 'tcp' or 'udp' otherwise
+#  @return Packet array in capture order
+def get_src_pkts(tcpdump_file, src, src_port, proto=''):
+
+    flow_index, pkts = get_pkt_store(tcpdump_file)
+
+    prefix = src + ',' + src_port + ','
+    parts = [ pkts[start:end] for flow, (start, end) in flow_index.items()
+              if flow.startswith(prefix) and
+                 (proto == '' or flow.endswith(',' + proto)) ]
+
+    if len(parts) == 0:
+        return np.empty(0, dtype=PKT_DTYPE)
+    if len(parts) == 1:
+        return parts[0]
+
+    src_pkts = np.concatenate(parts)
+    return src_pkts[np.argsort(src_pkts['ts'], kind='mergesort')]
+
+
+## Write columns to text file
+#  @param file_name Name of output file
+#  @param columns List of arrays of the same length
+#  @param fmt Format string for np.savetxt, e.g. '%.6f %i'
+def write_columns(file_name, columns, fmt):
+
+    with open(file_name, 'w') as f:
+        if len(columns[0]) > 0:
+            np.savetxt(f, np.column_stack(columns), fmt=fmt)
@@ -31,14 +31,23 @@
 # $Id$
 
 import os
+import re
 import errno
 import time
 import datetime
+import shlex
+import pipes
+import numpy as np
 from fabric.api import task, warn, put, puts, get, local, run, execute, \
     settings, abort, hosts, env, runs_once, parallel, hide
 
 import config
 from internalutil import mkdir_p, valid_dir
+from rworker import render
+from datacache import load_data_file
+from pktstore import write_columns
+from aggregation import interval_aggregate, thin_points
+from flowstats import get_stats, get_plot_window, write_stats_file
 
 
 #############################################################################
@@ -225,6 +234,316 @@ def sort_by_group_id2(files={}, groups={}):
         return sorted_files
 
 
+#############################################################################
+# Plot script execution
+#############################################################################
+
+
+## Parse plot parameters (shell-style list of VAR=VALUE assignments)
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @return List of tuples (variable name, value) or None if plot_params is not
+#          a simple list of assignments
+def _parse_plot_params(plot_params):
+
+    try:
+        tokens = shlex.split(plot_params)
+    except ValueError:
+        return None
+
+    params = []
+    for token in tokens:
+        match = re.match('^([A-Za-z_][A-Za-z0-9_]*)=(.*)$', token, re.DOTALL)
+        if match is None:
+            return None
+        params.append((match.group(1), match.group(2)))
+
+    return params
+
+
+## Run R plot script
+## If no plot script is specified, the R script is run by the persistent R
+## worker of this process (see rworker), so we don't start a new R process
+## for every graph. Otherwise, or if R cannot be started as worker, the plot
+## script command is run with the variables in its environment.
+#  @param script_name Name of R script in config.TPCONF_script_path
+#  @param env_vars List of tuples (variable name, value) passed to the script
+#  @param plot_params Parameters passed to plot function via environment variables
+#  @param plot_script Command used for plotting (empty means default R script)
+#  @param rout_file File the output of R is written to
+def run_plot_script(script_name, env_vars, plot_params, plot_script, rout_file):
+
+    done = False
+    if plot_script == '':
+        script = '%s/%s' % (config.TPCONF_script_path, script_name)
+        params = _parse_plot_params(plot_params)
+        if params is not None:
+            puts('[localhost] R worker: %s %s' % (script, rout_file))
+            ok = render(script, env_vars + params, rout_file)
+            if ok is False:
+                abort('Plot script %s failed, see %s' % (script, rout_file))
+            done = ok is not None
+        plot_script = 'R CMD BATCH --vanilla %s' % script
+
+    if not done:
+        local('%s %s %s %s' %
+              (' '.join('%s="%s"' % var for var in env_vars), plot_params,
+               plot_script, rout_file))
+
+    if config.TPCONF_debug_level == 0:
+        local('rm -f %s' % rout_file)
+
+
+#############################################################################
+# Data preparation
+#############################################################################
+
+
+## Parameters of the R plot scripts that are handled by prepare_time_series()
+PREPARE_PARAMS = ('TC_AGGR_WIN_SIZE', 'TC_AGGR_INT_FACTOR', 'TC_PTHIN_DIST',
+                  'TC_PTHIN_DIST_FAC', 'TC_DIFF')
+
+
+## Parameters of plot_cmp_experiments.R that are handled by
+## prepare_cmpexp_stats()
+CMPEXP_STATS_PARAMS = ('TC_AGGR_WIN_SIZE', 'TC_AGGR_INT_FACTOR')
+
+
+## Get numeric plot parameter
+#  @param params List of tuples (variable name, value)
+#  @param name Variable name
+#  @param default Value if parameter is not set
+#  @return Value
+def _get_num_param(params, name, default):
+
+    value = dict(params).get(name, '')
+    if value == '':
+        return default
+
+    return float(value)
+
+
+## Check if flag plot parameter is set
+#  @param params List of tuples (variable name, value)
+#  @param name Variable name
+#  @return True if set, False otherwise
+def _get_flag_param(params, name):
+
+    return dict(params).get(name, '') not in ('', '0')
+
+
+## Get distances for point thinning (same as pthin() in point_thinning.R)
+#  @param times Timestamps
+#  @param values Values
+#  @param params List of tuples (variable name, value)
+#  @param stime Start time of plot window in seconds
+#  @param etime End time of plot window in seconds
+#  @param ymin Minimum value on y-axis
+#  @param ymax Maximum value on y-axis
+#  @return Tuple (time distance, value distance) or None if no thinning
+def _get_pthin_dists(times, values, params, stime, etime, ymin, ymax):
+
+    dist = _get_num_param(params, 'TC_PTHIN_DIST', 0)
+    dist_fac = _get_num_param(params, 'TC_PTHIN_DIST_FAC', 0)
+    if (dist == 0 and dist_fac == 0) or len(times) == 0:
+        return None
+    if dist > 0:
+        return (dist, dist)
+
+    if etime == 0:
+        etime = times.max() - times.min()
+    if ymin == 0:
+        ymin = values.min()
+    if ymax == 0:
+        ymax = values.max()
+
+    return (dist_fac * (etime - stime), dist_fac * (ymax - ymin))
+
+
+## Thin out data points if point thinning is enabled
+#  @param times Timestamps
+#  @param values Values
+#  @param params List of tuples (variable name, value)
+#  @param stime Start time of plot window in seconds
+#  @param etime End time of plot window in seconds
+#  @param ymin Minimum value on y-axis
+#  @param ymax Maximum value on y-axis
+#  @return Tuple of arrays (timestamps, values)
+def _thin_series(times, values, params, stime, etime, ymin, ymax):
+
+    dists = _get_pthin_dists(times, values, params, stime, etime, ymin, ymax)
+    if dists is None:
+        return (times, values)
+
+    keep = thin_points(times, values, dists[0], dists[1])
+
+    return (times[keep], values[keep])
+
+
+## Check if the data of a time series plot should be prepared in Python
+#  @param aggr Aggregation of data in time intervals
+#  @param params List of tuples (variable name, value) or None
+#  @return True if data should be prepared, False otherwise
+def _do_prepare(aggr, params):
+
+    if params is None:
+        return False
+
+    return aggr in ('1', '2') or \
+        _get_num_param(params, 'TC_PTHIN_DIST', 0) != 0 or \
+        _get_num_param(params, 'TC_PTHIN_DIST_FAC', 0) != 0
+
+
+## Prepare data of a time series plot
+## Does everything plot_time_series.R does with the data before plotting
+## (omit constant series, filter max int values, scaling, point thinning,
+## time normalisation, differences, aggregation), so R only needs to load the
+## reduced data. The prepared data is written to files with two columns
+## (normalised time and value) separated by space.
+#  @param file_names List of data file names
+#  @param groups List of group numbers (one for each file)
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr Aggregation of data in time intervals
+#  @param omit_const '1' omit series that are 100% constant
+#  @param stime Start time of plot window in seconds
+#  @param etime End time of plot window in seconds
+#  @param ymin Minimum value on y-axis
+#  @param ymax Maximum value on y-axis
+#  @param params List of tuples (variable name, value)
+#  @param out_prefix Prefix of prepared data file names
+#  @return Tuple (list of prepared file names, list of indices of files that
+#          were not omitted)
+def prepare_time_series(file_names, groups, yindex, yscaler, aggr, omit_const,
+                        stime, etime, ymin, ymax, params, out_prefix):
+
+    stime = float(stime)
+    etime = float(etime)
+    ymin = float(ymin)
+    ymax = float(ymax)
+
+    series = []
+    for idx, file_name in enumerate(file_names):
+        data = load_data_file(file_name)
+        if data.size == 0:
+            times = values = np.empty(0)
+        else:
+            times = np.array(data[:, 0])
+            values = np.array(data[:, yindex - 1])
+
+        if omit_const not in ('', '0') and len(values) > 0 and \
+           np.all(values == values[0]):
+            continue
+
+        # filter max int values (e.g. tcp rtt estimate is set to max int on
+        # windows for non-smoothed)
+        valid = values < 4294967295
+        times = times[valid]
+        values = values[valid] * yscaler
+
+        if aggr == '':
+            (times, values) = _thin_series(times, values, params, stime, etime,
+                                           ymin, ymax)
+
+        series.append((idx, times, values))
+
+    # normalise time to start with zero
+    xmin = {}
+    for idx, times, values in series:
+        if len(times) > 0:
+            xmin[groups[idx]] = min(xmin.get(groups[idx], times.min()),
+                                    times.min())
+
+    data_files = []
+    kept = []
+    for idx, times, values in series:
+        times = times - xmin.get(groups[idx], 0.0)
+
+        if dict(params).get('TC_DIFF', '') == '1':
+            values = np.diff(values)
+            times = times[1:]
+
+        if aggr in ('1', '2'):
+            (times, values) = interval_aggregate(
+                times, values, _get_num_param(params, 'TC_AGGR_WIN_SIZE', 1.0),
+                _get_num_param(params, 'TC_AGGR_INT_FACTOR', 4),
+                'sum' if aggr == '1' else 'percentage')
+            (times, values) = _thin_series(times, values, params, stime, etime,
+                                           ymin, ymax)
+
+        data_file = '%s.%d.data' % (out_prefix, len(data_files))
+        write_columns(data_file, (times, values), '%.17g %.17g')
+        data_files.append(data_file)
+        kept.append(idx)
+
+    return (data_files, kept)
+
+
+## Check if a comparison plot can use summary statistics instead of the data
+#  @param omit_const '1' omit series that are 100% constant
+#  @param ptype Plot type ('box', 'median', 'mean')
+#  @param params List of tuples (variable name, value) or None
+#  @return True if statistics can be used, False otherwise
+def _use_cmpexp_stats(omit_const, ptype, params):
+
+    if params is None or omit_const not in ('', '0') or \
+       _get_num_param(params, 'TC_OUTLIER_QUANT', 0) > 0:
+        return False
+
+    # merged groups need all data for exact medians and box plots
+    if _get_flag_param(params, 'TC_MERGE_GROUPS'):
+        return False
+
+    return True
+
+
+## Prepare summary statistics files of a comparison plot
+## The statistics of each data file are computed like plot_cmp_experiments.R
+## computes them from the data and are stored in the metadata database, so
+## they only need to be computed once. The time window is limited to the time
+## range of all data series like the R script does. The statistics file of each
+## data series starts with the name of the data file, since the R script gets
+## parameter values from the file names (the first match in the name is used).
+#  @param file_names List of data file names
+#  @param yindex Index of data column (first column is 1)
+#  @param yscaler Factor that values are multiplied with
+#  @param aggr Aggregation of data in time intervals
+#  @param diff '1' use difference of consecutive values
+#  @param stime Start time of plot window in seconds
+#  @param etime End time of plot window in seconds
+#  @param params List of tuples (variable name, value)
+#  @param pdf_dir Directory for statistics files
+#  @param oprefix Output file name prefix
+#  @return List of statistics file names
+def prepare_cmpexp_stats(file_names, yindex, yscaler, aggr, diff, stime, etime,
+                         params, pdf_dir, oprefix):
+
+    env = dict(params)
+    # R gets the scaler with six decimal places
+    yscaler = float('%f' % yscaler)
+    win_size = _get_num_param(params, 'TC_AGGR_WIN_SIZE', 1.0)
+    int_factor = _get_num_param(params, 'TC_AGGR_INT_FACTOR', 4)
+
+    aggr = env.get('TC_AGGR', aggr)
+    diff = env.get('TC_DIFF', diff)
+    (stime, etime) = get_plot_window(file_names, int(yindex), yscaler, aggr, diff,
+                                     float(env.get('TC_STIME', stime)),
+                                     float(env.get('TC_ETIME', etime)), win_size,
+                                     int_factor)
+
+    stats = [ get_stats(file_name, int(yindex), yscaler, aggr, diff, stime, etime,
+                        win_size, int_factor)
+              for file_name in file_names ]
+
+    stats_files = []
+    for i, name in enumerate(file_names):
+        stats_file = '%s%s.%s.%d.stats' % (pdf_dir, os.path.basename(name),
+                                           oprefix, i)
+        write_stats_file(stats_file, stats[i])
+        stats_files.append(stats_file)
+
+    return stats_files
+
+
 #############################################################################
 # Plot functions
 #############################################################################
@@ -303,9 +622,28 @@ def plot_time_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, otype='
         # if pdf_dir specified create if it doesn't exist
         mkdir_p(pdf_dir)
 
-    if plot_script == '':
-        plot_script = 'R CMD BATCH --vanilla %s/plot_time_series.R' % \
-                      config.TPCONF_script_path
+    # aggregate and thin out the data here, so R only needs to load the reduced
+    # data (only for the default plot script, custom scripts get the raw data)
+    params = _parse_plot_params(plot_params)
+    prepared = '0'
+    data_files = []
+    if plot_script == '' and _do_prepare(aggr, params):
+        (data_files, kept) = prepare_time_series(
+            file_names, _groups, yindex, yscaler, aggr, omit_const, stime, etime,
+            ymin, ymax, params, '%s%s_plot_time_series' % (pdf_dir, oprefix))
+        if len(leg_names) == len(file_names):
+            leg_names = [ leg_names[i] for i in kept ]
+        _groups = [ _groups[i] for i in kept ]
+        file_names = data_files
+        yindex = 2
+        yscaler = 1.0
+        sep = ' '
+        aggr = ''
+        omit_const = '0'
+        prepared = '1'
+        plot_params = ' '.join('%s=%s' % (name, pipes.quote(value))
+                               for name, value in params
+                               if name not in PREPARE_PARAMS)
 
     # interface between this code and the plot function are environment variables
     # the following variables are passed to plot function:
@@ -349,19 +687,26 @@ def plot_time_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, otype='
     # TC_BOXPL:  '0' plot each point on time axis
     #         '1' plot a boxplot over all data points from all data seres for each 
     #         distinct timestamp (instead of a point for each a data series) 
-
-    #local('which R')
-    local('TC_TITLE="%s" TC_FNAMES="%s" TC_LNAMES="%s" TC_YLAB="%s" TC_YINDEX="%d" TC_YSCALER="%f" '
-          'TC_SEP="%s" TC_OTYPE="%s" TC_OPREFIX="%s" TC_ODIR="%s" TC_AGGR="%s" TC_OMIT_CONST="%s" '
-          'TC_YMIN="%s" TC_YMAX="%s" TC_STIME="%s" TC_ETIME="%s" TC_GROUPS="%s" TC_BOXPL="%s" %s '
-          '%s %s%s_plot_time_series.Rout' %
-          (title, ','.join(file_names), ','.join(leg_names), ylab, yindex, yscaler,
-           sep, otype, oprefix, pdf_dir, aggr, omit_const, ymin, ymax, stime, etime,
-           ','.join(map(str, _groups)), boxplot, plot_params,
-           plot_script, pdf_dir, oprefix))
+    # TC_PREPARED: '1' data was already prepared by prepare_time_series(), the
+    #         time is normalised (but not aggregated etc. since the other variables
+    #         are set accordingly)
+
+    env_vars = [
+        ('TC_TITLE', title), ('TC_FNAMES', ','.join(file_names)),
+        ('TC_LNAMES', ','.join(leg_names)), ('TC_YLAB', ylab),
+        ('TC_YINDEX', '%d' % yindex), ('TC_YSCALER', '%f' % yscaler),
+        ('TC_SEP', sep), ('TC_OTYPE', otype), ('TC_OPREFIX', oprefix),
+        ('TC_ODIR', pdf_dir), ('TC_AGGR', aggr), ('TC_OMIT_CONST', omit_const),
+        ('TC_YMIN', ymin), ('TC_YMAX', ymax), ('TC_STIME', stime),
+        ('TC_ETIME', etime), ('TC_GROUPS', ','.join(map(str, _groups))),
+        ('TC_BOXPL', boxplot), ('TC_PREPARED', prepared),
+        ]
+    run_plot_script('plot_time_series.R', env_vars, plot_params, plot_script,
+                    '%s%s_plot_time_series.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
-        local('rm -f %s%s_plot_time_series.Rout' % (pdf_dir, oprefix))
+        for data_file in data_files:
+            os.remove(data_file)
 
 
 ## Plot DASH goodput
@@ -420,10 +765,6 @@ def plot_dash_goodput(title='', files={}, groups={}, ylab='', otype='', oprefix=
         # if pdf_dir specified create if it doesn't exist
         mkdir_p(pdf_dir)
 
-    if plot_script == '':
-        plot_script = 'R CMD BATCH --vanilla %s/plot_dash_goodput.R' % \
-                      config.TPCONF_script_path
-
     # interface between this code and the plot function are environment variables
     # the following variables are passed to plot function:
     # TC_TITLE:  character string that is plotted over the graph
@@ -448,24 +789,24 @@ def plot_dash_goodput(title='', files={}, groups={}, ylab='', otype='', oprefix=
     # TC_ETIME:  end time on x-axis (for zooming in), default is 0.0 meaning the end of an
     #         experiment a determined from the data
 
-    #local('which R')
-    local('TC_TITLE="%s" TC_FNAMES="%s" TC_LNAMES="%s" TC_YLAB="%s" TC_SEP="%s" TC_OTYPE="%s" '
-          'TC_OPREFIX="%s" TC_ODIR="%s" TC_YMIN="%s" TC_YMAX="%s" TC_STIME="%s" TC_ETIME="%s" %s '
-          '%s %s%s_plot_dash_goodput.Rout' %
-          (title, ','.join(file_names), ','.join(leg_names), ylab, sep, otype, oprefix,
-           pdf_dir, ymin, ymax, stime, etime, plot_params, plot_script,
-           pdf_dir, oprefix))
-
-    if config.TPCONF_debug_level == 0:
-        local('rm -f %s%s_plot_dash_goodput.Rout' % (pdf_dir, oprefix))
+    env_vars = [
+        ('TC_TITLE', title), ('TC_FNAMES', ','.join(file_names)),
+        ('TC_LNAMES', ','.join(leg_names)), ('TC_YLAB', ylab), ('TC_SEP', sep),
+        ('TC_OTYPE', otype), ('TC_OPREFIX', oprefix), ('TC_ODIR', pdf_dir),
+        ('TC_YMIN', ymin), ('TC_YMAX', ymax), ('TC_STIME', stime),
+        ('TC_ETIME', etime),
+        ]
+    run_plot_script('plot_dash_goodput.R', env_vars, plot_params, plot_script,
+                    '%s%s_plot_dash_goodput.Rout' % (pdf_dir, oprefix))
 
 
 ## plot_incast_ACK_series
 ## (based on plot_time_series, but massages the filenames and legend names a little
 ## differently to handle a trial being broken into 'bursts'.)
 #  @param title Title of plot at the top
-#  @param files Dictionary with legend names (keys) and files with the data
-#               to plot (values)
+#  @param files Dictionary with legend names (keys) and lists of bursts with the
+#               data to plot (values), each burst a tuple (file name, first row,
+#               end row)
 #  @param ylab Label for y-axis
 #  @param yindex Index of the column in data file to plot
 #  @param yscaler Scaler for y-values (data in file is multiplied with the scaler)
@@ -484,7 +825,7 @@ def plot_dash_goodput(title='', files={}, groups={}, ylab='', otype='', oprefix=
 #               (by default 0.0 = start of experiment)
 #  @param etime End time of plot window in seconds
 #               (by default 0.0 = end of experiment)
-#  @param groups Map data files to groups (all files of same experiment must have
+#  @param groups Map bursts to groups (all bursts of same experiment must have
 #                same group number)
 #  @param sort_flowkey '1' sort by flow key (default)
 #                      '0' don't sort by flow key
@@ -506,6 +847,8 @@ def plot_incast_ACK_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, o
                      plot_params='', plot_script='', source_filter=''):
 
     file_names = []
+    burst_rows = []
+    burst_nums = []
     leg_names = []
     _groups = []
 
@@ -533,9 +876,13 @@ def plot_incast_ACK_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, o
         # Keep the .R code happy by creating a groups entry
         # for each burst-specific file.
         for burst_index in range(len(file_name)) :
+            burst = file_name[burst_index]
             leg_names.append(name+"%"+str(burst_index+sburst))
-            file_names.append(file_name[burst_index])
-            _groups.append(groups[file_name[burst_index]])
+            file_names.append(burst[0])
+            # rows of burst in data file (first and last row, counted from one)
+            burst_rows.append('%i:%i' % (burst[1] + 1, burst[2]))
+            burst_nums.append(str(burst_index+sburst))
+            _groups.append(groups[burst])
 
     if lnames != '':
         # Create a sequence of burst-specific legend names,
@@ -566,23 +913,20 @@ def plot_incast_ACK_series(title='', files={}, ylab='', yindex=2, yscaler=1.0, o
         # if pdf_dir specified create if it doesn't exist
         mkdir_p(pdf_dir)
 
-    if plot_script == '':
-        plot_script = 'R CMD BATCH --vanilla %s/plot_bursts.R' % \
-                       config.TPCONF_script_path
-
     # for a description of parameters see plot_time_series above
-    #local('which R')
-    local('TC_TITLE="%s" TC_FNAMES="%s" TC_LNAMES="%s" TC_YLAB="%s" TC_YINDEX="%d" TC_YSCALER="%f" '
-          'TC_SEP="%s" TC_OTYPE="%s" TC_OPREFIX="%s" TC_ODIR="%s" TC_AGGR="%s" TC_OMIT_CONST="%s" '
-          'TC_YMIN="%s" TC_YMAX="%s" TC_STIME="%s" TC_ETIME="%s" TC_GROUPS="%s" %s '
-          'TC_BURST_SEP=1 '
-          '%s %s%s_plot_bursts.Rout' %
-          (title, ','.join(file_names), ','.join(leg_names), ylab, yindex, yscaler,
-           sep, otype, oprefix, pdf_dir, aggr, omit_const, ymin, ymax, stime, etime,
-           ','.join(map(str, _groups)), plot_params, plot_script, pdf_dir, oprefix))
-
-    if config.TPCONF_debug_level == 0:
-        local('rm -f %s%s_plot_bursts.Rout' % (pdf_dir, oprefix))
+    env_vars = [
+        ('TC_TITLE', title), ('TC_FNAMES', ','.join(file_names)),
+        ('TC_LNAMES', ','.join(leg_names)), ('TC_YLAB', ylab),
+        ('TC_YINDEX', '%d' % yindex), ('TC_YSCALER', '%f' % yscaler),
+        ('TC_SEP', sep), ('TC_OTYPE', otype), ('TC_OPREFIX', oprefix),
+        ('TC_ODIR', pdf_dir), ('TC_AGGR', aggr), ('TC_OMIT_CONST', omit_const),
+        ('TC_YMIN', ymin), ('TC_YMAX', ymax), ('TC_STIME', stime),
+        ('TC_ETIME', etime), ('TC_GROUPS', ','.join(map(str, _groups))),
+        ('TC_BURST_SEP', '1'), ('TC_BURST_ROWS', ','.join(burst_rows)),
+        ('TC_BURST_NUMS', ','.join(burst_nums)),
+        ]
+    run_plot_script('plot_bursts.R', env_vars, plot_params, plot_script,
+                    '%s%s_plot_bursts.Rout' % (pdf_dir, oprefix))
 
 
 ## plot comparison plot for different metrics across different experiment parameter
@@ -619,10 +963,6 @@ def plot_cmpexp(title='', file_names=[], xlabs=[], ylab='', yindex=2, yscaler=1.
                 ptype='', ymin=0, ymax=0, leg_names=[], stime='0.0', etime='0.0',
                 plot_params='', plot_script=''):
 
-    if plot_script == '':
-        plot_script = 'R CMD BATCH --vanilla %s/plot_cmp_experiments.R' % \
-                      config.TPCONF_script_path
-
     # interface between this code and the plot function are environment variables
     # the following variables are passed to plot function:
     # TC_TITLE:  character string that is plotted over the graph
@@ -659,19 +999,39 @@ def plot_cmpexp(title='', file_names=[], xlabs=[], ylab='', yindex=2, yscaler=1.
     #         of an experiment
     # TC_ETIME:  end time on x-axis (for zooming in), default is 0.0 meaning the end of an
     #         experiment a determined from the data
-
-    #local('which R')
-    local('TC_TITLE="%s" TC_FNAMES="%s" TC_LNAMES="%s" TC_XLABS="%s" TC_YLAB="%s" TC_YINDEX="%d" '
-          'TC_YSCALER="%f" TC_SEP="%s" TC_OTYPE="%s" TC_OPREFIX="%s" TC_ODIR="%s" TC_AGGR="%s" TC_DIFF="%s" '
-          'TC_OMIT_CONST="%s" TC_PTYPE="%s" TC_YMIN="%s" TC_YMAX="%s" TC_STIME="%s" TC_ETIME="%s" %s '
-          '%s %s%s_plot_cmp_experiments.Rout' %
-          (title, ','.join(file_names), ','.join(leg_names), ','.join(xlabs), ylab,
-           yindex, yscaler, sep, otype, oprefix, pdf_dir, aggr, diff,
-           omit_const, ptype, ymin, ymax, stime, etime, plot_params,
-           plot_script, pdf_dir, oprefix))
+    # TC_STATS:  '1' files contain summary statistics (see prepare_cmpexp_stats())
+
+    # use summary statistics of the data series, so R does not need to load all
+    # data (only for the default plot script, custom scripts get the raw data)
+    params = _parse_plot_params(plot_params)
+    use_stats = '0'
+    stats_files = []
+    if plot_script == '' and _use_cmpexp_stats(omit_const, ptype, params):
+        stats_files = prepare_cmpexp_stats(
+            file_names, yindex, yscaler, aggr, diff, stime, etime, params,
+            pdf_dir, oprefix)
+        file_names = stats_files
+        use_stats = '1'
+        plot_params = ' '.join('%s=%s' % (name, pipes.quote(value))
+                               for name, value in params
+                               if name not in CMPEXP_STATS_PARAMS)
+
+    env_vars = [
+        ('TC_TITLE', title), ('TC_FNAMES', ','.join(file_names)),
+        ('TC_LNAMES', ','.join(leg_names)), ('TC_XLABS', ','.join(xlabs)),
+        ('TC_YLAB', ylab), ('TC_YINDEX', '%d' % yindex),
+        ('TC_YSCALER', '%f' % yscaler), ('TC_SEP', sep), ('TC_OTYPE', otype),
+        ('TC_OPREFIX', oprefix), ('TC_ODIR', pdf_dir), ('TC_AGGR', aggr),
+        ('TC_DIFF', diff), ('TC_OMIT_CONST', omit_const), ('TC_PTYPE', ptype),
+        ('TC_YMIN', ymin), ('TC_YMAX', ymax), ('TC_STIME', stime),
+        ('TC_ETIME', etime), ('TC_STATS', use_stats),
+        ]
+    run_plot_script('plot_cmp_experiments.R', env_vars, plot_params, plot_script,
+                    '%s%s_plot_cmp_experiments.Rout' % (pdf_dir, oprefix))
 
     if config.TPCONF_debug_level == 0:
-        local('rm -f %s%s_plot_cmp_experiments.Rout' % (pdf_dir, oprefix))
+        for stats_file in stats_files:
+            os.remove(stats_file)
 
 
 ## plot comparison plot for different metrics across different experiment parameter
@@ -709,9 +1069,6 @@ def plot_2d_density(title='', x_files=[], y_files=[], xlab='', ylab='', yindexes
                 xmin=0, xmax=0, ymin=0, ymax=0, stime='0.0', etime='0.0', groups=[], leg_names=[],
                 plot_params='', plot_script=''):
 
-    if plot_script == '':
-        plot_script = 'R CMD BATCH --vanilla %s/plot_contour.R' % config.TPCONF_script_path
-
     # interface between this code and the plot function are environment variables
     # the following variables are passed to plot function:
     # TC_TITLE:  character string that is plotted over the graph
@@ -761,18 +1118,17 @@ def plot_2d_density(title='', x_files=[], y_files=[], xlab='', ylab='', yindexes
     #         have the same length as XFNAMES and YFNAMES. The data is grouped using colour
     #         as per the specified group numbers. 
 
-    #local('which R')
-    local('TC_TITLE="%s" TC_XFNAMES="%s" TC_YFNAMES="%s", TC_LNAMES="%s" TC_XLAB="%s" TC_YLAB="%s" TC_YINDEXES="%s" '
-          'TC_YSCALERS="%s" TC_XSEP="%s" TC_YSEP="%s" TC_OTYPE="%s" TC_OPREFIX="%s" TC_ODIR="%s" TC_AGGRS="%s" '
-          'TC_DIFFS="%s" TC_XMIN="%s" TC_XMAX="%s" TC_YMIN="%s" TC_YMAX="%s" TC_STIME="%s" TC_ETIME="%s" TC_GROUPS="%s" %s '
-          '%s %s%s_plot_contour.Rout' %
-          (title, ','.join(x_files), ','.join(y_files), ','.join(leg_names),
-           xlab, ylab, ','.join(yindexes), ','.join(yscalers),
-           xsep, ysep, 'pdf', oprefix, pdf_dir, ','.join(aggrs),
-           ','.join(diffs), xmin, xmax, ymin, ymax, stime, etime, 
-	   ','.join([str(x) for x in groups]),
-           plot_params, plot_script, pdf_dir, oprefix))
-
-    if config.TPCONF_debug_level == 0:
-        local('rm -f %s%s_plot_contour.Rout' % (pdf_dir, oprefix))
+    env_vars = [
+        ('TC_TITLE', title), ('TC_XFNAMES', ','.join(x_files)),
+        ('TC_YFNAMES', ','.join(y_files)), ('TC_LNAMES', ','.join(leg_names)),
+        ('TC_XLAB', xlab), ('TC_YLAB', ylab), ('TC_YINDEXES', ','.join(yindexes)),
+        ('TC_YSCALERS', ','.join(yscalers)), ('TC_XSEP', xsep), ('TC_YSEP', ysep),
+        ('TC_OTYPE', 'pdf'), ('TC_OPREFIX', oprefix), ('TC_ODIR', pdf_dir),
+        ('TC_AGGRS', ','.join(aggrs)), ('TC_DIFFS', ','.join(diffs)),
+        ('TC_XMIN', xmin), ('TC_XMAX', xmax), ('TC_YMIN', ymin), ('TC_YMAX', ymax),
+        ('TC_STIME', stime), ('TC_ETIME', etime),
+        ('TC_GROUPS', ','.join([str(x) for x in groups])),
+        ]
+    run_plot_script('plot_contour.R', env_vars, plot_params, plot_script,
+                    '%s%s_plot_contour.Rout' % (pdf_dir, oprefix))
 
@@ -0,0 +1,191 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package rworker
+# Persistent R process that runs the R plot scripts, so we don't need to start
+# a new R interpreter (and load all R packages again) for every graph
+#
+# The worker reads R commands from a pipe. For each graph the TC_* variables
+# are set with Sys.setenv(), the plot script is sourced into an empty global
+# environment and the output is written to the .Rout file like R CMD BATCH
+# does. The worker uses the current directory of the calling process. Each
+# process and thread has its own worker, so graphs rendered by the
+# parallel worker processes of run_jobs() are rendered in parallel.
+#
+# $Id$
+
+import os
+import threading
+import subprocess
+
+
+## Command to start the R worker
+R_WORKER_CMD = [ 'R', '--vanilla', '--slave' ]
+## Line printed by the worker after each graph
+R_WORKER_DONE = 'TEACUP_RENDER_DONE'
+
+## R code that defines the render function of the worker. The function is
+## stored in an attached environment, so clearing the global environment
+## between graphs does not remove it. The plot scripts determine their
+## directory from the command line arguments, so commandArgs() is replaced
+## with a function returning the arguments R CMD BATCH would have.
+_R_WORKER_CODE = r'''
+options(warn = 1)
+local({
+    worker_env = attach(NULL, name = "teacup_worker")
+    worker_env$.tc_render = function(script, vars, rout, cwd) {
+        setwd(cwd)
+        con = file(rout, open = "wt")
+        sink(con)
+        sink(con, type = "message")
+        old_vars = Sys.getenv(names(vars), unset = NA, names = TRUE)
+        do.call(Sys.setenv, as.list(vars))
+        rm(list = ls(globalenv(), all.names = TRUE), envir = globalenv())
+        assign("commandArgs", function(trailingOnly = FALSE) {
+                if (trailingOnly) character(0) else c("R", "-f", script, "--vanilla")
+        }, envir = globalenv())
+        ok = tryCatch({
+                source(script, local = globalenv(), echo = TRUE,
+                       max.deparse.length = Inf)
+                TRUE
+        }, error = function(e) {
+                message("Error: ", conditionMessage(e))
+                FALSE
+        })
+        graphics.off()
+        rm(list = ls(globalenv(), all.names = TRUE), envir = globalenv())
+        Sys.unsetenv(names(old_vars)[is.na(old_vars)])
+        if (any(!is.na(old_vars))) {
+                do.call(Sys.setenv, as.list(old_vars[!is.na(old_vars)]))
+        }
+        sink(type = "message")
+        sink()
+        close(con)
+        cat("%s", as.integer(ok), "\n")
+        flush(stdout())
+        invisible(ok)
+    }
+})
+''' % R_WORKER_DONE
+
+## Workers (one per thread and process)
+_worker = threading.local()
+
+
+## Quote string as R string constant
+#  @param s String
+#  @return Quoted string
+def _r_string(s):
+
+    return '"%s"' % str(s).replace('\\', '\\\\').replace('"', '\\"'). \
+        replace('\n', '\\n')
+
+
+## Persistent R process
+class RWorker(object):
+
+    ## Start R process
+    def __init__(self):
+
+        self.proc = subprocess.Popen(R_WORKER_CMD, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, close_fds=True)
+        self.proc.stdin.write(_R_WORKER_CODE)
+        self.proc.stdin.flush()
+
+    ## Check if R process is still running
+    #  @return True if running, False otherwise
+    def is_alive(self):
+
+        return self.proc.poll() is None
+
+    ## Run plot script
+    #  @param script Plot script file name
+    #  @param env_vars List of tuples (variable name, value)
+    #  @param rout_file File for the output of R
+    #  @return True if script succeeded, False otherwise
+    def render(self, script, env_vars, rout_file):
+
+        var_list = ', '.join('%s = %s' % (_r_string(name), _r_string(value))
+                             for name, value in env_vars)
+        self.proc.stdin.write('.tc_render(%s, c(%s), %s, %s)\n' %
+                              (_r_string(os.path.abspath(script)), var_list,
+                               _r_string(os.path.abspath(rout_file)),
+                               _r_string(os.getcwd())))
+        self.proc.stdin.flush()
+
+        while True:
+            line = self.proc.stdout.readline()
+            if line == '':
+                raise IOError('R worker terminated')
+            if line.startswith(R_WORKER_DONE):
+                return line.split()[1] == '1'
+
+    ## Stop R process
+    def close(self):
+
+        try:
+            self.proc.stdin.close()
+            self.proc.wait()
+        except (IOError, OSError):
+            pass
+
+
+## Get worker of this thread, start it if necessary
+#  @return Worker or None if R cannot be started
+def get_worker():
+
+    # workers must not be shared with forked processes
+    worker = getattr(_worker, 'worker', None)
+    if getattr(_worker, 'pid', None) != os.getpid() or worker is None or \
+       not worker.is_alive():
+        _worker.pid = os.getpid()
+        _worker.worker = None
+        try:
+            _worker.worker = RWorker()
+        except OSError:
+            pass
+
+    return _worker.worker
+
+
+## Run plot script with the worker of this thread
+#  @param script Plot script file name
+#  @param env_vars List of tuples (variable name, value)
+#  @param rout_file File for the output of R
+#  @return True if script succeeded, False if script failed, None if
+#          the worker could not be used
+def render(script, env_vars, rout_file):
+
+    worker = get_worker()
+    if worker is None:
+        return None
+
+    try:
+        return worker.render(script, env_vars, rout_file)
+    except (IOError, OSError):
+        # worker died (e.g. crashed in a plot script), start new one next time
+        _worker.worker = None
+        return False
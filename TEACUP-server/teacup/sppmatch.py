@@ -0,0 +1,144 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package sppmatch
+# Passive RTT estimation with synthetic packet pairs (like SPP) based on the
+# packet store, so we don't need filtered tcpdump files and the spp binary
+#
+# The packets of a flow are observed at a reference point (ref, close to the
+# source) and a monitor point (mon, close to the destination). Packets seen
+# at both points are matched based on their packet ids. Each packet going back
+# from mon to ref is paired with the last packet from ref to mon that was seen
+# at mon before it (each outgoing packet is only paired once). For a pair
+# with timestamps t1 (outgoing at ref), t2 (outgoing at mon), t3 (back at mon)
+# and t4 (back at ref) the RTT is (t4 - t1) - (t3 - t2), so the clocks of
+# the two points need not be synchronised.
+#
+# $Id$
+
+import numpy as np
+
+from pktstore import write_columns
+
+
+## Compute packet ids
+## For TCP the id is based on IP ID, sequence number and payload (packet
+## hash of the store) plus the ACK number, for UDP the id is based on IP ID
+## and payload. The flow 5-tuple is implied since packets are per flow.
+#  @param pkts Packet array
+#  @param proto 'tcp' or 'udp'
+#  @return Array of packet ids
+def get_pkt_ids(pkts, proto):
+
+    ids = pkts['hash'].astype(np.uint64)
+    if proto == 'tcp':
+        ids = (ids << np.uint64(32)) | pkts['ack'].astype(np.uint64)
+
+    return ids
+
+
+## Match packets seen at two measurement points
+## If a packet id occurs more than once, the first occurrence is used
+#  @param pkts1 Packet array from first point
+#  @param pkts2 Packet array from second point
+#  @param proto 'tcp' or 'udp'
+#  @return Tuple of timestamp arrays (t1, t2) of matched packets, sorted by t2
+def match_pkts(pkts1, pkts2, proto):
+
+    ids1, idx1 = np.unique(get_pkt_ids(pkts1, proto), return_index=True)
+    ids2, idx2 = np.unique(get_pkt_ids(pkts2, proto), return_index=True)
+
+    common, c1, c2 = _intersect(ids1, ids2)
+    t1 = np.asarray(pkts1['ts'])[idx1[c1]]
+    t2 = np.asarray(pkts2['ts'])[idx2[c2]]
+
+    order = np.argsort(t2, kind='mergesort')
+
+    return (t1[order], t2[order])
+
+
+## Intersect two sorted unique arrays
+#  @param a First array
+#  @param b Second array
+#  @return Tuple (common values, indices into a, indices into b)
+def _intersect(a, b):
+
+    pos = np.searchsorted(b, a)
+    pos[pos == len(b)] = 0
+    if len(b) == 0:
+        found = np.zeros(len(a), dtype=bool)
+    else:
+        found = b[pos] == a
+
+    return (a[found], np.nonzero(found)[0], pos[found])
+
+
+## Compute RTT samples of one flow direction
+#  @param ref_out Packets from ref to mon captured at ref
+#  @param ref_back Packets from mon to ref captured at ref
+#  @param mon_out Packets from ref to mon captured at mon
+#  @param mon_back Packets from mon to ref captured at mon
+#  @param proto 'tcp' or 'udp'
+#  @return Tuple of arrays (timestamps at ref, RTTs) sorted by timestamp
+def get_spp_rtts(ref_out, ref_back, mon_out, mon_back, proto):
+
+    t1, t2 = match_pkts(ref_out, mon_out, proto)
+    t4, t3 = match_pkts(ref_back, mon_back, proto)
+
+    # last outgoing packet seen at mon before each packet going back
+    idx = np.searchsorted(t2, t3, side='left') - 1
+    valid = idx >= 0
+    idx = idx[valid]
+    t3 = t3[valid]
+    t4 = t4[valid]
+
+    # each outgoing packet is only paired with the first packet going back
+    if len(idx) > 0:
+        first = np.concatenate(([True], idx[1:] != idx[:-1]))
+        idx = idx[first]
+        t3 = t3[first]
+        t4 = t4[first]
+
+    ts = t1[idx]
+    rtts = (t4 - ts) - (t3 - t2[idx])
+
+    order = np.argsort(ts, kind='mergesort')
+
+    return (ts[order], rtts[order])
+
+
+## Compute RTT samples of one flow direction and write them to file
+## The file has the columns timestamp at ref and RTT, separated by space
+#  @param out_file Output file name
+#  @param ref_out Packets from ref to mon captured at ref
+#  @param ref_back Packets from mon to ref captured at ref
+#  @param mon_out Packets from ref to mon captured at mon
+#  @param mon_back Packets from mon to ref captured at mon
+#  @param proto 'tcp' or 'udp'
+def write_spp_rtts(out_file, ref_out, ref_back, mon_out, mon_back, proto):
+
+    ts, rtts = get_spp_rtts(ref_out, ref_back, mon_out, mon_back, proto)
+    write_columns(out_file, (ts, rtts), '%.6f %.6f')
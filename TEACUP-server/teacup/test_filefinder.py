@@ -0,0 +1,132 @@
+# Copyright (c) 2013-2015 Centre for Advanced Internet Architectures,
+# Swinburne University of Technology. All rights reserved.
+#
+# Author: Sebastian Zander (sebastian.zander@gmx.de)
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+#
+## @package test_filefinder
+# Tests of the file finder functions (run with python -m unittest
+# test_filefinder)
+#
+# $Id$
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import types
+import unittest
+
+# the file finder does not use the experiment configuration
+if 'config' not in sys.modules:
+    sys.modules['config'] = types.ModuleType('config')
+
+from filefinder import find_files, get_testid_file_list
+
+
+## Files of the test tree (directories are created as needed)
+TREE_FILES = [
+    '20150101-000000_exp_x_host1_uname.log.gz',
+    '20150101-000000_exp_x_host1_tpconf_vars.log.gz',
+    'z_20150101-000000_exp_x_host1_uname.log.gz',
+    'a/20150101-000000_exp_x_host2_uname.log.gz',
+    'a/b/20150101-000000_exp_x_host3_uname.log.gz',
+    'a-b/20150101-000000_exp_x_host4_uname.log.gz',
+    'a.b/c/20150101-000000_exp_x_host5_uname.log.gz',
+    'A/20150101-000000_exp_x_host6_uname.log.gz',
+    'copy/20150101-000000_exp_x_host1_uname.log.gz',
+    'res/20150101-000000_exp_x_host1_uname.log.gz.rtts',
+    'res/sub dir/20150101-000000_exp_x_host2_uname.log.gz.rtts',
+]
+## Symbolic links of the test tree (name, target)
+TREE_LINKS = [
+    ('a/link', '../a.b'),
+    ('a/b/loop', '..'),
+]
+## Patterns searched for
+PATTERNS = [
+    '*',
+    '20150101-000000_exp_x*uname.log*',
+    '*_uname.log.gz',
+    '*.rtts',
+    '*host[13]*',
+    'a*',
+    'b',
+    '*tpconf_vars.log.gz',
+]
+
+
+## Tests comparing results with find -L piped through LC_ALL=C sort
+class FindFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        for name in TREE_FILES:
+            if os.path.dirname(name) != '' and \
+               not os.path.isdir(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+            open(name, 'w').close()
+        for name, target in TREE_LINKS:
+            os.symlink(target, name)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    ## Get result of find command the file finder replaced
+    #  @param directory Directory where search starts
+    #  @param pattern Shell pattern
+    #  @return List of path names
+    def _find(self, directory, pattern):
+        with open(os.devnull, 'w') as null:
+            out = subprocess.Popen(
+                'find -L "%s" -name "%s" -print | sed -e "s/^\.\///" | '
+                'LC_ALL=C sort' % (directory, pattern), shell=True,
+                stdout=subprocess.PIPE, stderr=null).communicate()[0]
+
+        return [ line for line in out.split('\n') if line != '' ]
+
+    def test_find_files(self):
+        for directory in [ '.', 'a', 'a/', self.tmp_dir ]:
+            for pattern in PATTERNS:
+                self.assertEqual(find_files(directory, pattern),
+                                 self._find(directory, pattern),
+                                 '%s %s' % (directory, pattern))
+
+    def test_get_testid_file_list(self):
+        # the first of files with the same name is used
+        old_files = []
+        for f in self._find('.', '20150101-000000_exp_x*uname.log.gz'):
+            if os.path.basename(f) not in map(os.path.basename, old_files):
+                old_files.append(f)
+
+        self.assertEqual(get_testid_file_list('', '20150101-000000_exp_x',
+                                              'uname.log.gz', 'LC_ALL=C sort',
+                                              search_dir='.'),
+                         old_files)
+
+if __name__ == '__main__':
+    unittest.main()